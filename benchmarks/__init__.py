@@ -0,0 +1,2 @@
+# Inicialización del paquete benchmarks
+# Este archivo hace que la carpeta benchmarks sea un paquete de Python
@@ -0,0 +1,87 @@
+"""
+Benchmark del writer de Excel del reporte agrupado.
+
+Compara el writer anterior (pd.ExcelWriter con openpyxl, modelo completo en
+memoria) con el writer en streaming de utils.excel sobre una pestaña tipo
+'nifViticultor' sintética.
+
+Uso:
+    python -m benchmarks.bench_excel --filas 100000 --repeticiones 3
+"""
+import argparse
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from utils.excel import crear_excel_streaming
+
+def generar_hoja_nif(filas, semilla=0):
+    """Genera una pestaña NIF sintética con la forma de la que produce agrupar_por_nif"""
+    rng = np.random.default_rng(semilla)
+    kg_rvc = rng.integers(100, 50000, filas).astype(float)
+    kg_extranet = kg_rvc + rng.normal(0, 200, filas).round()
+    pesadas_rvc = rng.integers(1, 20, filas)
+    pesadas_extranet = pesadas_rvc + (rng.random(filas) < 0.05)
+    diferencia = kg_extranet - kg_rvc
+    return pd.DataFrame({
+        'nipd': rng.integers(800000000, 800000500, filas),
+        'nif': [f"{n:08d}A" for n in range(filas)],
+        'KgTotales RVC': kg_rvc,
+        'KgTotales Extranet': kg_extranet,
+        'diferencia porcentual': diferencia,
+        'porcentaje diferencia pesadas': diferencia / kg_rvc * 100,
+        'numero pesadas viticultor rvc': pesadas_rvc,
+        'numero pesadas viticultor extranet': pesadas_extranet,
+        'incidencia pesadas': np.where(pesadas_rvc != pesadas_extranet, 'SI', 'NO')
+    })
+
+def writer_anterior(df):
+    """Writer previo: pd.ExcelWriter con openpyxl"""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='nifViticultor', index=False)
+    return output.getvalue()
+
+def writer_streaming(df):
+    """Writer en streaming con formatos y resaltado de incidencias"""
+    from utils.pipeline_comprobaciones import FORMATOS_HOJA_NIF
+    return crear_excel_streaming([{
+        'nombre': 'nifViticultor',
+        'df': df,
+        'formatos': FORMATOS_HOJA_NIF,
+        'columnas_incidencia': ['incidencia pesadas']
+    }])
+
+def medir(funcion, df, repeticiones):
+    """Devuelve (mejor tiempo en s, pico de memoria en MB, tamaño en KB)"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(df)
+        tiempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    contenido = funcion(df)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(tiempos), pico / 1024 / 1024, len(contenido) / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del writer de Excel del reporte agrupado")
+    parser.add_argument('--filas', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'filas':>8}  {'writer':<10}  {'tiempo (s)':>10}  {'pico (MB)':>10}  {'tamaño (KB)':>11}")
+    for filas in args.filas:
+        df = generar_hoja_nif(filas)
+        for nombre, funcion in (('anterior', writer_anterior), ('streaming', writer_streaming)):
+            tiempo, pico, tamano = medir(funcion, df, args.repeticiones)
+            print(f"{filas:>8}  {nombre:<10}  {tiempo:>10.2f}  {pico:>10.1f}  {tamano:>11.0f}")
+
+if __name__ == '__main__':
+    main()
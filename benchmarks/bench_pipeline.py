@@ -0,0 +1,215 @@
+"""
+Benchmark del pipeline completo sobre datos sintéticos (benchmarks.datos_sinteticos).
+
+Mide tiempo y pico de memoria (tracemalloc) de cada etapa, desde
+analizar_errores_originales hasta crear_excel_agrupado, y guarda cada
+ejecución (commit, fecha, filas, tasas de error, etapas) como una línea JSON
+para poder comparar ejecuciones entre versiones del código.
+
+El pico de memoria no incluye los procesos del pool de cargar_archivos_comprobaciones,
+y tracemalloc añade sobrecarga al tiempo: usar --sin-memoria para medir solo tiempos.
+
+Uso:
+    python -m benchmarks.bench_pipeline --filas 10000 100000
+    python -m benchmarks.bench_pipeline --filas 1000000 --tasa kg_cero=0.05 --comparar
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+from benchmarks.datos_sinteticos import generar_datos, TASAS_ERROR_POR_DEFECTO
+
+RESULTADOS_POR_DEFECTO = os.path.join(os.path.dirname(__file__), 'resultados', 'pipeline.jsonl')
+
+def commit_actual():
+    """Commit corto del árbol medido (None fuera de un repositorio git)"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def filas_de(resultado):
+    """Filas del DataFrame principal de un resultado de etapa (None si no aplica)"""
+    if isinstance(resultado, tuple):
+        resultado = resultado[0]
+    if isinstance(resultado, dict):
+        resultado = resultado.get('extranet')
+    return len(resultado) if isinstance(resultado, pd.DataFrame) else None
+
+class MedidorEtapas:
+    """Ejecuta etapas midiendo tiempo y pico de memoria; la salida por consola se descarta"""
+
+    def __init__(self, memoria=True):
+        self.memoria = memoria
+        self.etapas = []
+
+    def medir(self, nombre, funcion, *args, **kwargs):
+        if self.memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+            resultado = funcion(*args, **kwargs)
+        segundos = time.perf_counter() - inicio
+        pico = None
+        if self.memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        self.etapas.append({
+            'etapa': nombre,
+            'segundos': round(segundos, 4),
+            'pico_mb': round(pico / 1024 / 1024, 2) if pico is not None else None,
+            'filas_salida': filas_de(resultado)
+        })
+        return resultado
+
+def ejecutar_pipeline(datos, medidor):
+    """Recorre el pipeline del verificador y de comprobaciones con los datos generados"""
+    from utils.analyzer import VerificadorAnalyzer
+    from utils.carga import cargar_archivos_comprobaciones
+    from utils.claves import unificar_categorias
+    from utils.agregacion import construir_cubo
+    from utils.conciliacion import conciliar_pesadas
+    from utils.consistencia import comprobar_consistencia
+    from utils.pipeline_comprobaciones import (
+        enriquecer_con_nipd_mejorado, preparar_datos_fechas,
+        agrupar_por_nipd, agrupar_por_nif, crear_excel_agrupado
+    )
+
+    # Verificador
+    analyzer = VerificadorAnalyzer()
+    try:
+        medidor.medir('analizar_errores_originales', analyzer.analizar_errores_originales, datos['extranet'], 'extranet.xlsx')
+        medidor.medir('aplicar_correcciones', analyzer.aplicar_correcciones)
+        extranet_corregido = medidor.medir('generar_archivo_corregido', analyzer.generar_archivo_corregido)
+    finally:
+        with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+            analyzer.cleanup()
+
+    # Comprobaciones, sobre la declaración corregida
+    cargados = medidor.medir(
+        'cargar_archivos_comprobaciones', cargar_archivos_comprobaciones,
+        extranet_corregido, datos['bbdd'], datos['ervc']
+    )
+    df_enriquecido, _ = medidor.medir(
+        'enriquecer_con_nipd_mejorado', enriquecer_con_nipd_mejorado, cargados['extranet'], cargados['bbdd']
+    )
+    medidor.medir('comprobar_consistencia', comprobar_consistencia, df_enriquecido, cargados['ervc'])
+    df_ervc = cargados['ervc'][cargados['ervc']['nipd'].isin(df_enriquecido['NIPD'].dropna().unique())]
+    df_extranet_prep, df_ervc_prep = medidor.medir(
+        'preparar_datos_fechas', preparar_datos_fechas, df_enriquecido, df_ervc
+    )
+    df_extranet_prep['Nif Viticultor'], df_ervc_prep['nifLLiurador'] = unificar_categorias(
+        df_extranet_prep['Nif Viticultor'], df_ervc_prep['nifLLiurador']
+    )
+    cubo_extranet = medidor.medir(
+        'construir_cubo_extranet', construir_cubo, df_extranet_prep, 'NIPD', 'Nif Viticultor', 'Total Kg:'
+    )
+    cubo_ervc = medidor.medir(
+        'construir_cubo_ervc', construir_cubo, df_ervc_prep, 'nipd', 'nifLLiurador', 'kgTotals'
+    )
+    df_nipd = medidor.medir('agrupar_por_nipd', agrupar_por_nipd, cubo_extranet, cubo_ervc)
+    df_nif = medidor.medir('agrupar_por_nif', agrupar_por_nif, cubo_extranet, cubo_ervc)
+    df_pesadas = medidor.medir('conciliar_pesadas', conciliar_pesadas, df_extranet_prep, df_ervc_prep)
+    medidor.medir('crear_excel_agrupado', crear_excel_agrupado, df_nipd, df_nif, df_pesadas)
+
+def cargar_resultados(ruta):
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, encoding='utf-8') as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+def guardar_resultado(ruta, resultado):
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    with open(ruta, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+
+def imprimir_ejecucion(resultado, referencia=None):
+    """Tabla por etapa; con referencia, añade el tiempo anterior y la variación"""
+    etapas_ref = {e['etapa']: e for e in (referencia or {}).get('etapas', [])}
+    cabecera = f"{'etapa':<32}  {'tiempo (s)':>10}  {'pico (MB)':>10}  {'filas':>9}"
+    if referencia:
+        cabecera += f"  {'ref (s)':>9}  {'var.':>7}"
+    print(cabecera)
+
+    for etapa in resultado['etapas'] + [{'etapa': 'TOTAL', 'segundos': resultado['total_segundos']}]:
+        pico = etapa.get('pico_mb')
+        filas = etapa.get('filas_salida')
+        linea = (
+            f"{etapa['etapa']:<32}  {etapa['segundos']:>10.3f}  "
+            f"{(f'{pico:.1f}' if pico is not None else '-'):>10}  "
+            f"{(filas if filas is not None else '-'):>9}"
+        )
+        if referencia:
+            anterior = referencia['total_segundos'] if etapa['etapa'] == 'TOTAL' else etapas_ref.get(etapa['etapa'], {}).get('segundos')
+            if anterior:
+                linea += f"  {anterior:>9.3f}  {(etapa['segundos'] / anterior - 1) * 100:>+6.0f}%"
+        print(linea)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapas del pipeline sobre datos sintéticos")
+    parser.add_argument('--filas', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument(
+        '--tasa', action='append', default=[], metavar='TIPO=FRACCION',
+        help=f"Tasa de error (repetible). Tipos: {', '.join(TASAS_ERROR_POR_DEFECTO)}"
+    )
+    parser.add_argument('--sin-memoria', action='store_true', help="No medir memoria (tiempos sin sobrecarga de tracemalloc)")
+    parser.add_argument('--resultados', default=RESULTADOS_POR_DEFECTO, help="Archivo JSONL donde se acumulan las ejecuciones")
+    parser.add_argument('--etiqueta', default=None, help="Texto libre para identificar la ejecución")
+    parser.add_argument('--comparar', action='store_true', help="Comparar con la última ejecución guardada con las mismas filas")
+    args = parser.parse_args()
+
+    tasas = {**TASAS_ERROR_POR_DEFECTO, **{t: float(v) for t, v in (x.split('=', 1) for x in args.tasa)}}
+    anteriores = cargar_resultados(args.resultados)
+
+    for filas in args.filas:
+        print(f"\n=== {filas} filas ===")
+        inicio = time.perf_counter()
+        datos = generar_datos(filas, tasas, args.semilla)
+        print(f"Datos generados en {time.perf_counter() - inicio:.1f} s ({datos['resumen']['filas_ervc']} líneas eRVC)")
+
+        medidor = MedidorEtapas(memoria=not args.sin_memoria)
+        ejecutar_pipeline(datos, medidor)
+
+        resultado = {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit_actual(),
+            'etiqueta': args.etiqueta,
+            'filas': filas,
+            'semilla': args.semilla,
+            'tasas_error': tasas,
+            'memoria': not args.sin_memoria,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'cpus': os.cpu_count(),
+            'resumen_datos': datos['resumen'],
+            'etapas': medidor.etapas,
+            'total_segundos': round(sum(e['segundos'] for e in medidor.etapas), 4)
+        }
+
+        referencia = None
+        if args.comparar:
+            candidatas = [r for r in anteriores if r['filas'] == filas and r.get('memoria') == resultado['memoria']]
+            referencia = candidatas[-1] if candidatas else None
+            if referencia:
+                print(f"Referencia: {referencia['fecha']} (commit {referencia.get('commit')})")
+            else:
+                print("Sin ejecución anterior comparable")
+
+        imprimir_ejecucion(resultado, referencia)
+        guardar_resultado(args.resultados, resultado)
+
+if __name__ == '__main__':
+    main()
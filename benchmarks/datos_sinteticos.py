@@ -0,0 +1,199 @@
+"""
+Generador de datos sintéticos con la forma de los archivos reales.
+
+- Declaración de Extranet: 6 filas de preámbulo, encabezado en la fila 7 y
+  columnas 'Verificador', 'Razón Social', 'Zona', 'Nif Viticultor',
+  'Total Kg:', 'Día y hora:', etc.
+- BBDD_FINAL: pestaña CAT con EXTRANET/RVC/NIPD/ZONA
+- eRVC: dos/nipd/nifLLiurador/kgTotals/dataPesada
+
+Las tasas de error (fracción de filas) se controlan con TASAS_ERROR_POR_DEFECTO.
+
+Uso:
+    python -m benchmarks.datos_sinteticos --filas 100000 --salida datos_sinteticos/
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+from openpyxl import Workbook
+
+# Fracción de filas afectadas por cada tipo de error
+TASAS_ERROR_POR_DEFECTO = {
+    'nif_guion': 0.01,          # NIF con guion (corregible por el verificador)
+    'nif_invalido': 0.002,      # NIF con formato inválido (no corregible)
+    'kg_cero': 0.005,           # pesada con Kg = 0 (se elimina al corregir)
+    'campo_vacio': 0.005,       # campo informativo vacío
+    'bodega_desconocida': 0.002,  # razón social que no está en la BBDD
+    'zona_fuera_cat': 0.01,     # pesadas de zonas sin pestaña en la BBDD
+    'sin_ervc': 0.01,           # pesada de Extranet que no aparece en eRVC
+    'kg_desviado': 0.02,        # kg distintos entre Extranet y eRVC
+    'dia_desfasado': 0.01,      # pesada registrada en eRVC un día después
+    'dos_otro': 0.05            # líneas eRVC con 'dos' distinto de CV (se filtran)
+}
+
+ZONAS_CAT = ['PENEDÈS', 'LLEIDA', 'TERRA ALTA', 'TARRAGONA', 'CONCA DE BARBERÀ', 'MONTSANT']
+VARIEDADES = ['MACABEU', 'XAREL·LO', 'PARELLADA', 'CHARDONNAY', 'GARNATXA', 'ULL DE LLEBRE']
+LETRAS_NIF = 'TRWAGMYFPDXBNJZSQVHLCKE'
+INICIO_CAMPANA = datetime(2025, 8, 20, 7, 0)
+DIAS_CAMPANA = 70
+PREAMBULO_EXTRANET = [
+    ['Declaración de pesadas de verificadores'],
+    ['Campaña', INICIO_CAMPANA.year],
+    ['Generado', 'datos sintéticos'],
+    [],
+    ['Filtros', 'Todos'],
+    []
+]
+
+def _libro_bytes(hojas):
+    """Escribe un libro write_only con {nombre: lista de filas} y devuelve sus bytes"""
+    wb = Workbook(write_only=True)
+    for nombre, filas in hojas.items():
+        ws = wb.create_sheet(title=nombre)
+        for fila in filas:
+            ws.append(fila)
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+def _nifs(rng, cantidad):
+    """NIFs con formato NNNNNNNNL válidos y distintos"""
+    numeros = rng.choice(10 ** 8, size=cantidad, replace=False)
+    return np.array([f"{n:08d}{LETRAS_NIF[n % 23]}" for n in numeros], dtype=object)
+
+def generar_datos(filas, tasas_error=None, semilla=0):
+    """
+    Genera los tres archivos en memoria.
+    Devuelve {'extranet': bytes, 'bbdd': bytes, 'ervc': bytes, 'resumen': {...}}
+    con el número de filas afectadas por cada tipo de error.
+    """
+    tasas = {**TASAS_ERROR_POR_DEFECTO, **(tasas_error or {})}
+    rng = np.random.default_rng(semilla)
+
+    def mascara(tipo):
+        return rng.random(filas) < tasas[tipo]
+
+    # Bodegas (BBDD) y viticultores
+    num_bodegas = int(np.clip(filas // 500, 20, 2000))
+    num_viticultores = int(np.clip(filas // 20, 50, 200000))
+    nombres_bodega = np.array([f"BODEGA {i:04d}, S.L." for i in range(num_bodegas)], dtype=object)
+    nipd_bodega = 800000000 + np.arange(num_bodegas)
+    zona_bodega = rng.choice(ZONAS_CAT, num_bodegas)
+    nifs = _nifs(rng, num_viticultores)
+    bodega_viticultor = rng.integers(0, num_bodegas, num_viticultores)
+
+    # Pesadas de Extranet
+    viticultor = rng.integers(0, num_viticultores, filas)
+    bodega = bodega_viticultor[viticultor]
+    # Una parte de los viticultores entrega también en una segunda bodega
+    segunda = rng.random(filas) < 0.1
+    bodega[segunda] = rng.integers(0, num_bodegas, int(segunda.sum()))
+    kg = rng.integers(300, 12000, filas)
+    dias = rng.integers(0, DIAS_CAMPANA, filas)
+    minutos = rng.integers(0, 11 * 60, filas)
+    fechas = [INICIO_CAMPANA + timedelta(days=int(d), minutes=int(m)) for d, m in zip(dias, minutos)]
+
+    razon_social = nombres_bodega[bodega].copy()
+    zona = np.array([z.title() for z in zona_bodega[bodega]], dtype=object)
+    nif_extranet = nifs[viticultor].copy()
+    variedad = rng.choice(VARIEDADES, filas).astype(object)
+
+    # Errores de la declaración
+    errores = {}
+    m = mascara('nif_guion')
+    nif_extranet[m] = [f"{n[:8]}-{n[8:]}" for n in nif_extranet[m]]
+    errores['nif_guion'] = m
+    m = mascara('nif_invalido') & ~errores['nif_guion']
+    nif_extranet[m] = [f"{n[:5]}X" for n in nif_extranet[m]]
+    errores['nif_invalido'] = m
+    m = mascara('kg_cero')
+    kg[m] = 0
+    errores['kg_cero'] = m
+    m = mascara('campo_vacio')
+    variedad[m] = None
+    errores['campo_vacio'] = m
+    m = mascara('bodega_desconocida')
+    razon_social[m] = [f"BODEGA DESCONOCIDA {i}" for i in range(int(m.sum()))]
+    errores['bodega_desconocida'] = m
+    m = mascara('zona_fuera_cat')
+    zona[m] = 'Requena'
+    errores['zona_fuera_cat'] = m
+
+    encabezado = [
+        'Verificador', 'Razón Social', 'Zona', 'Nif Viticultor', 'Variedad',
+        'Total Kg:', 'Día y hora:', 'Grado'
+    ]
+    verificador = rng.choice([f"VERIFICADOR {i}" for i in range(1, 41)], filas)
+    grado = np.round(rng.normal(11, 1, filas), 1)
+    extranet = PREAMBULO_EXTRANET + [encabezado] + [
+        [verificador[i], razon_social[i], zona[i], nif_extranet[i], variedad[i],
+         int(kg[i]), fechas[i].strftime('%d/%m/%Y %H:%M'), float(grado[i])]
+        for i in range(filas)
+    ]
+
+    # BBDD_FINAL (el nombre RVC a veces difiere del de Extranet)
+    nombre_rvc = np.where(rng.random(num_bodegas) < 0.2, [n.replace(', S.L.', ' SL') for n in nombres_bodega], nombres_bodega)
+    bbdd = [['EXTRANET', 'RVC', 'NIPD', 'ZONA']] + [
+        [nombres_bodega[i], nombre_rvc[i], int(nipd_bodega[i]), zona_bodega[i]]
+        for i in range(num_bodegas)
+    ]
+
+    # eRVC: las pesadas válidas de Extranet, con desviaciones controladas
+    en_ervc = ~errores['kg_cero'] & ~mascara('sin_ervc')
+    kg_ervc = kg.copy()
+    m = mascara('kg_desviado') & en_ervc
+    kg_ervc[m] = kg_ervc[m] + rng.integers(-500, 500, int(m.sum()))
+    errores['kg_desviado'] = m
+    desfase = mascara('dia_desfasado') & en_ervc
+    errores['dia_desfasado'] = desfase
+    errores['sin_ervc'] = ~en_ervc & ~errores['kg_cero']
+
+    indices_ervc = np.flatnonzero(en_ervc)
+    ervc = [['dos', 'nipd', 'nifLLiurador', 'kgTotals', 'dataPesada']]
+    for i in indices_ervc:
+        fecha = fechas[i] + timedelta(days=1) if desfase[i] else fechas[i]
+        ervc.append(['CV', int(nipd_bodega[bodega[i]]), nifs[viticultor[i]], int(kg_ervc[i]), fecha])
+    num_otros = int(len(indices_ervc) * tasas['dos_otro'])
+    for i in rng.choice(indices_ervc, num_otros) if num_otros else []:
+        ervc.append(['VN', int(nipd_bodega[bodega[i]]), nifs[viticultor[i]], int(kg[i]), fechas[i]])
+
+    return {
+        'extranet': _libro_bytes({'Declaración': extranet}),
+        'bbdd': _libro_bytes({'CAT': bbdd}),
+        'ervc': _libro_bytes({'eRVC': ervc}),
+        'resumen': {
+            'filas_extranet': filas,
+            'filas_ervc': len(ervc) - 1,
+            'bodegas': num_bodegas,
+            'viticultores': num_viticultores,
+            **{f'errores_{tipo}': int(m.sum()) for tipo, m in errores.items()}
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera archivos Extranet, BBDD_FINAL y eRVC sintéticos")
+    parser.add_argument('--filas', type=int, default=10000)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', default='datos_sinteticos')
+    parser.add_argument(
+        '--tasa', action='append', default=[], metavar='TIPO=FRACCION',
+        help=f"Tasa de error (repetible). Tipos: {', '.join(TASAS_ERROR_POR_DEFECTO)}"
+    )
+    args = parser.parse_args()
+
+    tasas = {tipo: float(valor) for tipo, valor in (t.split('=', 1) for t in args.tasa)}
+    datos = generar_datos(args.filas, tasas, args.semilla)
+
+    os.makedirs(args.salida, exist_ok=True)
+    for nombre, archivo in (('extranet', 'extranet.xlsx'), ('bbdd', 'BBDD_FINAL.xlsx'), ('ervc', 'eRVC.xlsx')):
+        with open(os.path.join(args.salida, archivo), 'wb') as f:
+            f.write(datos[nombre])
+
+    for clave, valor in datos['resumen'].items():
+        print(f"{clave:<28} {valor:>10}")
+
+if __name__ == '__main__':
+    main()
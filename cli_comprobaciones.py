@@ -0,0 +1,104 @@
+"""
+Comprobaciones CAT por línea de comandos (sin Streamlit), p. ej. para la
+conciliación nocturna programada.
+
+Uso:
+    python cli_comprobaciones.py declaracion_corregida.xlsx BBDD_FINAL.xlsx eRVC.xlsx \
+        --salida reporte_agrupado_pesadas.xlsx --ventana-dias 1
+"""
+import argparse
+import getpass
+import sys
+import time
+
+from utils.memoria_matches import MemoriaMatches
+from utils.incidencias import REGLAS_INCIDENCIA_POR_DEFECTO
+from utils.conciliacion import resumir_conciliacion, TOLERANCIA_KG_PESADA
+from utils.consistencia import resumir_consistencia
+from utils.pipeline_comprobaciones import ejecutar_comprobaciones, ErrorComprobaciones, PARTICIONES_CONCILIACION
+
+def progreso_consola(nivel, mensaje):
+    """Escribe el progreso por stderr (stdout queda libre para el resumen)"""
+    if nivel == 'titulo':
+        print(f"\n{mensaje}", file=sys.stderr)
+    else:
+        print(f"  {mensaje}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprobaciones CAT: Extranet corregida + BBDD de bodegas + eRVC")
+    parser.add_argument('extranet', help="Declaración de Extranet corregida (.xlsx)")
+    parser.add_argument('bbdd', help="BBDD_FINAL con las pestañas de bodegas y NIPD (.xlsx)")
+    parser.add_argument('ervc', help="Pesadas eRVC (.xlsx)")
+    parser.add_argument('--salida', default='reporte_agrupado_pesadas.xlsx', help="Excel del reporte agrupado")
+    parser.add_argument('--auditoria', default=None, help="CSV con la auditoría de matching NIPD")
+    parser.add_argument('--kg-absoluta', type=float, default=REGLAS_INCIDENCIA_POR_DEFECTO['kg_absoluta'])
+    parser.add_argument('--kg-relativa', type=float, default=REGLAS_INCIDENCIA_POR_DEFECTO['kg_relativa'])
+    parser.add_argument('--ventana-dias', type=int, default=REGLAS_INCIDENCIA_POR_DEFECTO['ventana_dias'],
+                        help="Días de desfase con los que una pesada aún tiene pareja (0: criterio original, mismo número de días)")
+    parser.add_argument('--tolerancia-kg-pesada', type=float, default=TOLERANCIA_KG_PESADA)
+    parser.add_argument('--usar-almacen', action='store_true', help="Reutilizar agregados de días ya procesados")
+    parser.add_argument('--campana', default=None, help="Campaña de los agregados guardados (por defecto, el año actual)")
+    parser.add_argument('--usuario', default=getpass.getuser(), help="Usuario dueño de los agregados guardados")
+    parser.add_argument('--particiones', type=int, default=PARTICIONES_CONCILIACION,
+                        help="Particiones por NIPD para agregar y conciliar en paralelo (1: un solo proceso)")
+    parser.add_argument('--sin-memoria-matches', action='store_true', help="No usar las resoluciones bodega → NIPD confirmadas")
+    parser.add_argument('--silencioso', action='store_true', help="No mostrar el progreso")
+    args = parser.parse_args()
+
+    archivos = []
+    for ruta in (args.extranet, args.bbdd, args.ervc):
+        with open(ruta, 'rb') as f:
+            archivos.append(f.read())
+
+    opciones = {
+        'usar_almacen': args.usar_almacen,
+        'campana': args.campana,
+        'usuario': args.usuario,
+        'reglas': {
+            'kg_absoluta': args.kg_absoluta,
+            'kg_relativa': args.kg_relativa,
+            'ventana_dias': args.ventana_dias
+        },
+        'tolerancia_kg_pesada': args.tolerancia_kg_pesada,
+        'particiones': args.particiones
+    }
+    memoria = {} if args.sin_memoria_matches else MemoriaMatches().cargar()
+
+    inicio = time.perf_counter()
+    try:
+        resultado = ejecutar_comprobaciones(
+            *archivos, opciones=opciones, memoria=memoria,
+            progreso=None if args.silencioso else progreso_consola
+        )
+    except ErrorComprobaciones as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    with open(args.salida, 'wb') as f:
+        f.write(resultado['archivo_excel'])
+    if args.auditoria:
+        resultado['df_auditoria'].to_csv(args.auditoria, index=False, encoding='utf-8-sig')
+
+    df_nipd = resultado['df_nipd']
+    df_nif = resultado['df_nif']
+    pesadas = resumir_conciliacion(resultado['df_pesadas'])
+    print(f"Reporte: {args.salida} ({time.perf_counter() - inicio:.1f} s)")
+    print(
+        f"NIPD: {len(df_nipd)} (incidencias kg: {(df_nipd['incidencias kg'] == 'SI').sum()}, "
+        f"pesadas: {(df_nipd['incidencia pesadas'] == 'SI').sum()})"
+    )
+    print(f"NIF: {len(df_nif)} (incidencias pesadas: {(df_nif['incidencia pesadas'] == 'SI').sum()})")
+    print(
+        f"Pesadas: {pesadas['emparejada']} emparejadas, {pesadas['ambigua']} ambiguas, "
+        f"{pesadas['solo_extranet']} solo Extranet, {pesadas['solo_ervc']} solo eRVC"
+    )
+    consistencia = resumir_consistencia(resultado['df_consistencia'])
+    print(
+        f"Consistencia NIF: {consistencia['formato']} con formato distinto, "
+        f"{consistencia['nipd_distinto']} con NIPD distinto, "
+        f"{consistencia['solo_extranet']} solo Extranet, {consistencia['solo_ervc']} solo eRVC"
+    )
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,9 @@
 import streamlit as st
 from pages import verificador, comprobaciones
+from utils.memoria_sesion import SesionCaducada
+from utils.estado_sesion import registrar_actividad, mostrar_uso_memoria, perfilado_activo
+from utils.perfilado import PERFILADO_POR_DEFECTO
+from utils.ui_components import mostrar_informes_perfilado
 
 # Configuración de la página
 st.set_page_config(
@@ -109,6 +113,9 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def main():
+    # Actividad de la sesión y liberación de memoria de sesiones inactivas
+    registrar_actividad()
+    
     # Header principal
     st.markdown("""
     <div class="main-header">
@@ -147,6 +154,17 @@ def main():
         # Actualizar página actual
         st.session_state.pagina_actual = opciones[seleccion]
         
+        # Memoria de la sesión (los datos grandes se vuelcan a disco al superar el presupuesto)
+        mostrar_uso_memoria()
+        
+        # Perfilado de los pasos (cProfile + tracemalloc); sin coste mientras está desactivado
+        st.checkbox(
+            "⏱️ Modo perfilado",
+            value=PERFILADO_POR_DEFECTO,
+            key="perfilado_activo",
+            help="Mide tiempo por función y memoria por línea de cada paso del verificador y de comprobaciones"
+        )
+        
         # Información adicional en sidebar
         st.markdown("---")
         st.markdown("""
@@ -158,6 +176,25 @@ def main():
         """, unsafe_allow_html=True)
     
     # Enrutamiento de páginas
+    try:
+        mostrar_pagina_actual()
+    except SesionCaducada as e:
+        # Los datos de la sesión se expulsaron por inactividad: se empieza de nuevo
+        pagina_actual = st.session_state.pagina_actual
+        for clave in list(st.session_state.keys()):
+            del st.session_state[clave]
+        st.session_state.pagina_actual = pagina_actual
+        st.warning(f"⚠️ {e}")
+        mostrar_pagina_actual()
+    
+    # Panel de perfilado
+    if perfilado_activo():
+        st.markdown("---")
+        with st.expander("⏱️ Perfilado de los pasos", expanded=True):
+            mostrar_informes_perfilado(st.session_state.get('informes_perfilado', []))
+
+def mostrar_pagina_actual():
+    """Muestra la página seleccionada en el menú"""
     if st.session_state.pagina_actual == "inicio":
         mostrar_inicio()
     elif st.session_state.pagina_actual == "verificador":
@@ -1,9 +1,26 @@
+import os
 import streamlit as st
 import pandas as pd
-import numpy as np
 from datetime import datetime
-# Asumo que tienes este archivo de utilidades, si no, puedes eliminar la línea
-# from utils.ui_components import mostrar_mensaje_error, mostrar_mensaje_exito, mostrar_mensaje_info
+from utils.memoria_matches import MemoriaMatches, nipd_valido
+from utils.trabajos import ErrorTrabajos
+from utils.estado_sesion import (
+    guardar_en_sesion, leer_de_sesion, borrar_de_sesion,
+    enviar_trabajo, recoger_trabajo, trabajo_pendiente, retomar_trabajo_anterior
+)
+from utils.ui_components import mostrar_informe_memoria, mostrar_progreso
+from utils.claves import normalizar_nipd
+from utils.incidencias import REGLAS_INCIDENCIA_POR_DEFECTO
+from utils.desglose import consultar_desglose
+from utils.conciliacion import resumir_conciliacion, TOLERANCIA_KG_PESADA, ESTADO_EMPAREJADA
+from utils.consistencia import resumir_consistencia
+from utils.pipeline_comprobaciones import detectar_columnas_bodega_zona, enriquecer_con_nipd_mejorado
+
+# Orden de presentación: primero lo que requiere revisión
+ORDEN_METODOS_AUDITORIA = ['sin_match', 'codorniu_zona_desconocida', 'parcial', 'memoria', 'codorniu', 'exacto']
+
+# Métodos cuyo NIPD puede confirmarse manualmente y guardarse en memoria
+METODOS_CONFIRMABLES = ['sin_match', 'codorniu_zona_desconocida', 'parcial']
 
 def mostrar_pagina():
     """Página de comprobaciones CAT"""
@@ -25,7 +42,7 @@ def mostrar_pagina():
     
     1. **Subir 3 archivos:** Pesadas Extranet (limpio), Base de Datos NIPD, y Pesadas eRVC
     2. **Enriquecimiento:** Añadir NIPD del archivo de bodegas al archivo limpio
-    3. **Filtrado:** Solo registros CAT (excluyendo Almendralejo, Cariñena, Requena)
+    3. **Filtrado:** Solo zonas con pestaña en la BBDD (CAT y, si existen, Almendralejo, Cariñena, Requena)
     4. **Agrupación:** Comparar pesadas por NIPD y NIF entre sistemas
     5. **Reporte:** Excel con diferencias y incidencias por NIPD y NIF
     """)
@@ -68,566 +85,464 @@ def mostrar_pagina():
     if archivo_extranet and archivo_bbdd and archivo_ervc:
         st.markdown("---")
         
+        # Un cambio en los archivos subidos invalida los resultados anteriores
+        comprobar_archivos_subidos(archivo_extranet, archivo_bbdd, archivo_ervc)
+        
         # Inicializar estados si no existen
         if 'nipd_enriquecido' not in st.session_state:
             st.session_state.nipd_enriquecido = False
         
-        # Botón Paso 1: Enriquecer
+        # Botón Paso 1: Enriquecer (carga y NIPD como trabajo del servicio local)
         if not st.session_state.nipd_enriquecido:
-            if st.button("🔍 Enriquecer con NIPD (Paso 1)", use_container_width=True):
-                enriquecer_declaracion_nipd(archivo_extranet, archivo_bbdd, archivo_ervc)
+            if st.button(
+                "🔍 Enriquecer con NIPD (Paso 1)",
+                use_container_width=True,
+                disabled=trabajo_pendiente('trabajo_enriquecimiento')
+            ):
+                enviar_trabajo(
+                    'trabajo_enriquecimiento', 'enriquecimiento',
+                    [(archivo.getvalue(), archivo.name) for archivo in (archivo_extranet, archivo_bbdd, archivo_ervc)],
+                    descripcion=f"Comprobaciones · Paso 1: {archivo_extranet.name}"
+                )
+            
+            try:
+                resultado = recoger_trabajo('trabajo_enriquecimiento')
+            except ErrorTrabajos as e:
+                st.error(f"❌ Error: {str(e)}")
+                resultado = None
+            
+            if resultado is not None:
+                enriquecer_declaracion_nipd(resultado)
+            
+            retomar_trabajo_anterior('trabajo_enriquecimiento', ['enriquecimiento'])
+        
+        if 'datos_cargados' in st.session_state:
+            with st.expander("🧮 Memoria de los datos cargados"):
+                mostrar_informe_memoria(st.session_state['datos_cargados']['informe_memoria'])
         
         # Botón Paso 2: Generar Reporte (solo visible después del enriquecimiento)
         if st.session_state.nipd_enriquecido:
-            if st.button("✅ Confirmar y continuar con Reporte Agrupado (Paso 2)", use_container_width=True):
-                generar_reporte_agrupado()
+            opciones = mostrar_opciones_reporte()
+            if st.button(
+                "✅ Confirmar y continuar con Reporte Agrupado (Paso 2)",
+                use_container_width=True,
+                disabled=trabajo_pendiente('trabajo_reporte')
+            ):
+                generar_reporte_agrupado(opciones, archivo_extranet.name)
+            
+            try:
+                resultado = recoger_trabajo('trabajo_reporte')
+            except ErrorTrabajos as e:
+                st.error(f"❌ Error: {str(e)}")
+                resultado = None
+            
+            if resultado is not None:
+                for nivel, mensaje in resultado.pop('mensajes', []):
+                    mostrar_progreso(nivel, mensaje)
+                # Se guarda en la sesión para que sobreviva a los reruns (selectores del desglose)
+                guardar_en_sesion('reporte_agrupado', resultado)
+            
+            # Resultados del Paso 2 (persisten entre reruns)
+            if 'reporte_agrupado' in st.session_state:
+                mostrar_reporte_agrupado(st.session_state['reporte_agrupado'])
+            
+            # Auditoría del matching del Paso 1
+            if 'auditoria_matches' in st.session_state:
+                with st.expander("🧾 Auditoría de matching NIPD (Paso 1)"):
+                    mostrar_auditoria_matches(st.session_state['auditoria_matches'])
+                    mostrar_confirmacion_matches()
             
             # Botón para reiniciar si es necesario
             if st.button("🔄 Reiniciar Proceso", help="Volver al paso 1"):
                 st.session_state.nipd_enriquecido = False
-                if 'df_enriquecido' in st.session_state:
-                    del st.session_state.df_enriquecido
-                if 'archivo_ervc' in st.session_state:
-                    del st.session_state.archivo_ervc
+                borrar_de_sesion('df_enriquecido', 'auditoria_matches', 'reporte_agrupado', 'tablas_comprobaciones')
                 st.rerun()
 
-def enriquecer_declaracion_nipd(archivo_extranet, archivo_bbdd, archivo_ervc):
-    """Enriquecer declaracion_corregida con NIPD - PASO 1"""
+def comprobar_archivos_subidos(archivo_extranet, archivo_bbdd, archivo_ervc):
+    """Descarta los datos y resultados de la sesión si los archivos subidos han cambiado"""
     
-    try:
-        with st.spinner("📊 Procesando archivos..."):
-            
-            # 1. CARGAR ARCHIVOS
-            st.write("### 📥 1. Cargando archivos...")
-            
-            # Cargar Extranet (saltar 6 filas, usar fila 7 como header)
-            df_extranet = pd.read_excel(archivo_extranet, skiprows=6, header=0)
-            st.success(f"✅ Extranet: {df_extranet.shape[0]} registros cargados")
-            
-            # Cargar BBDD (pestaña CAT)
-            df_bbdd = pd.read_excel(archivo_bbdd, sheet_name='CAT')
-            st.success(f"✅ BBDD CAT: {df_bbdd.shape[0]} registros cargados")
-            
-            # 2. FILTRAR EXTRANET POR ZONA
-            st.write("### 🏷️ 2. Filtrando por zona...")
-            
-            # Detectar columna de zona
-            col_zona = None
-            for col in df_extranet.columns:
-                if 'zona' in str(col).lower():
-                    col_zona = col
-                    break
-            
-            if col_zona is None:
-                st.error("❌ No se encontró columna 'Zona' en Extranet")
-                st.write("**Columnas disponibles:** ", list(df_extranet.columns))
-                return
-            
-            st.info(f"📍 Usando columna zona: '{col_zona}'")
-            
-            # Filtrar por zona (excluir Almendralejo, Cariñena, Requena)
-            zonas_excluir = ['Almendralejo', 'Cariñena', 'Requena']
-            df_extranet_filtrado = df_extranet[~df_extranet[col_zona].isin(zonas_excluir)]
-            
-            st.success(f"✅ Filtrado por zona: {df_extranet_filtrado.shape[0]} registros (excluidos: {df_extranet.shape[0] - df_extranet_filtrado.shape[0]})")
-            
-            # 3. ENRIQUECER CON NIPD
-            st.write("### 🏭 3. Añadiendo NIPD...")
-            
-            df_extranet_enriquecido = enriquecer_con_nipd_mejorado(df_extranet_filtrado, df_bbdd)
-            
-            nipd_encontrados = df_extranet_enriquecido['NIPD'].notna().sum()
-            st.success(f"✅ NIPD encontrados: {nipd_encontrados}/{df_extranet_enriquecido.shape[0]} registros")
-            
-            # 4. MOSTRAR RESULTADO PARA VERIFICACIÓN
-            st.write("### 📊 4. Resultado para verificación")
-            
-            st.info("🔍 **Archivo declaracion_corregida enriquecido con NIPD:**")
-            
-            # Mostrar estadísticas por NIPD
-            nipd_stats = df_extranet_enriquecido.groupby('NIPD', dropna=False).size().reset_index(name='registros')
-            st.write("**📈 Distribución por NIPD:**")
-            st.dataframe(nipd_stats, use_container_width=True)
-            
-            # Mostrar el DataFrame completo
-            st.write("**📋 DataFrame completo enriquecido:**")
-            st.dataframe(df_extranet_enriquecido, use_container_width=True, height=400)
-            
-            # Guardar en session_state para siguiente paso
-            st.session_state['df_enriquecido'] = df_extranet_enriquecido
-            st.session_state['archivo_ervc'] = archivo_ervc
-            st.session_state.nipd_enriquecido = True  # Marcar como completado
-            
-            st.markdown("---")
-            st.success("✅ **Enriquecimiento completado. Usa el botón de abajo para continuar al Paso 2.**")
-            st.info("🔄 La página se recargará automáticamente para mostrar el siguiente paso.")
-            
-            # Recargar página para mostrar el botón del paso 2
-            st.rerun()
-            
-    except Exception as e:
-        st.error(f"❌ Error: {str(e)}")
-        import traceback
-        st.code(traceback.format_exc())
+    clave = tuple(
+        (archivo.name, archivo.size, getattr(archivo, 'file_id', None))
+        for archivo in (archivo_extranet, archivo_bbdd, archivo_ervc)
+    )
+    
+    if st.session_state.get('clave_datos_cargados') != clave:
+        if 'clave_datos_cargados' in st.session_state:
+            st.session_state.nipd_enriquecido = False
+            borrar_de_sesion(
+                'datos_cargados', 'df_enriquecido', 'auditoria_matches', 'reporte_agrupado', 'tablas_comprobaciones'
+            )
+        st.session_state['clave_datos_cargados'] = clave
 
-def enriquecer_con_nipd_mejorado(df_extranet, df_bbdd):
-    """Añade NIPD al DataFrame de extranet - VERSIÓN MEJORADA"""
-    
-    df_resultado = df_extranet.copy()
-    df_resultado['NIPD'] = None
-    
-    # Detectar columnas en extranet
-    col_bodega = None
-    col_zona = None
-    
-    for col in df_extranet.columns:
-        col_lower = str(col).lower()
-        if 'razón' in col_lower and 'social' in col_lower:
-            col_bodega = col
-        elif 'zona' in col_lower:
-            col_zona = col
-    
-    if col_bodega is None or col_zona is None:
-        st.error(f"❌ Columnas no encontradas - Bodega: {col_bodega}, Zona: {col_zona}")
-        st.write("**Columnas disponibles:** ", list(df_extranet.columns))
-        return df_resultado
-    
-    st.info(f"🔍 Detectadas - Bodega: '{col_bodega}', Zona: '{col_zona}'")
-    
-    # Crear diccionario usando columnas EXTRANET y RVC del BBDD
-    bodegas_dict = {}
-    for _, row in df_bbdd.iterrows():
-        nombre_extranet = str(row['EXTRANET']).strip().upper()
-        nombre_rvc = str(row['RVC']).strip().upper()
-        nipd = row['NIPD']
-        zona_bbdd = str(row.get('ZONA', '')).strip().upper()
-        
-        # Agregar ambos nombres al diccionario
-        bodegas_dict[nombre_extranet] = {
-            'nipd': nipd,
-            'zona_bbdd': zona_bbdd
-        }
-        
-        if nombre_rvc != nombre_extranet:
-            bodegas_dict[nombre_rvc] = {
-                'nipd': nipd,
-                'zona_bbdd': zona_bbdd
-            }
-    
-    # Estadísticas de matching
-    matches = 0
-    codorniu_casos = 0
-    matches_exactos = 0
-    matches_parciales = 0
-    sin_match = 0
-    
-    # Procesar cada registro
-    for index, row in df_resultado.iterrows():
-        bodega_extranet = str(row[col_bodega]).strip().upper()
-        zona_extranet = str(row[col_zona]).strip().upper()
-        
-        nipd_asignado = None
-        
-        # CASO ESPECIAL: CODORNIU, S.A.
-        if bodega_extranet == 'CODORNIU, S.A.':
-            codorniu_casos += 1
-            
-            if zona_extranet == 'LLEIDA':
-                nipd_asignado = '2501200003'
-                st.write(f"🎯 CODORNIU Lleida → NIPD: {nipd_asignado}")
-            elif zona_extranet == 'PENEDÈS':
-                nipd_asignado = '802400022'
-                st.write(f"🎯 CODORNIU Penedès → NIPD: {nipd_asignado}")
-            else:
-                st.warning(f"⚠️ CODORNIU zona desconocida: '{zona_extranet}'")
-        
-        # BÚSQUEDA NORMAL
-        else:
-            # Búsqueda exacta primero
-            if bodega_extranet in bodegas_dict:
-                nipd_asignado = bodegas_dict[bodega_extranet]['nipd']
-                matches_exactos += 1
-            
-            # Búsqueda parcial si no hay match exacto
-            else:
-                for nombre_bbdd, datos in bodegas_dict.items():
-                    if bodega_extranet in nombre_bbdd or nombre_bbdd in bodega_extranet:
-                        nipd_asignado = datos['nipd']
-                        matches_parciales += 1
-                        st.write(f"🔍 Match parcial: '{bodega_extranet}' ≈ '{nombre_bbdd}' → NIPD: {nipd_asignado}")
-                        break
-        
-        # Asignar NIPD
-        if nipd_asignado:
-            df_resultado.at[index, 'NIPD'] = nipd_asignado
-            matches += 1
-        else:
-            sin_match += 1
-            if sin_match <= 5:  # Mostrar solo los primeros 5 para no saturar
-                st.write(f"❌ Sin match: '{bodega_extranet}' (Zona: '{zona_extranet}')")
-    
-    # Mostrar estadísticas
-    st.write(f"📊 **Estadísticas de matching:**")
-    st.write(f"• **Total registros:** {len(df_resultado)}")
-    st.write(f"• **Matches totales:** {matches}")
-    st.write(f"• **Matches exactos:** {matches_exactos}")
-    st.write(f"• **Matches parciales:** {matches_parciales}")
-    st.write(f"• **Casos CODORNIU:** {codorniu_casos}")
-    st.write(f"• **Sin match:** {sin_match}")
-    
-    return df_resultado
+def enriquecer_declaracion_nipd(resultado):
+    """Resultado del trabajo de enriquecimiento con NIPD - PASO 1"""
+    
+    # 1-3. Carga, filtrado por zona y NIPD (ejecutados por el servicio de trabajos)
+    for nivel, mensaje in resultado['mensajes']:
+        mostrar_progreso(nivel, mensaje)
+    
+    df_extranet_enriquecido = resultado['df_enriquecido']
+    
+    # 4. MOSTRAR RESULTADO PARA VERIFICACIÓN
+    st.write("### 📊 4. Resultado para verificación")
+    
+    st.info("🔍 **Archivo declaracion_corregida enriquecido con NIPD:**")
+    
+    # Mostrar estadísticas por NIPD
+    nipd_stats = df_extranet_enriquecido.groupby('NIPD', dropna=False).size().reset_index(name='registros')
+    st.write("**📈 Distribución por NIPD:**")
+    st.dataframe(nipd_stats, use_container_width=True)
+    
+    # Mostrar el DataFrame completo
+    st.write("**📋 DataFrame completo enriquecido:**")
+    st.dataframe(df_extranet_enriquecido, use_container_width=True, height=400)
+    
+    # Guardar en session_state para siguiente paso
+    # (los DataFrames quedan bajo el gestor de memoria de sesión)
+    guardar_en_sesion('datos_cargados', resultado['datos_cargados'])
+    guardar_en_sesion('df_enriquecido', df_extranet_enriquecido)
+    # Rutas de las tablas compartidas del trabajo: el Paso 2 las abre sin reescribirlas
+    st.session_state['tablas_comprobaciones'] = resultado.get('tablas', {})
+    st.session_state['auditoria_matches'] = resultado['df_auditoria']
+    st.session_state.nipd_enriquecido = True  # Marcar como completado
+    borrar_de_sesion('reporte_agrupado')
+    
+    st.markdown("---")
+    st.success("✅ **Enriquecimiento completado. Usa el botón de abajo para continuar al Paso 2.**")
+    st.info("🔄 La página se recargará automáticamente para mostrar el siguiente paso.")
+    
+    # Recargar página para mostrar el botón del paso 2
+    st.rerun()
 
-def generar_reporte_agrupado():
-    """Genera reporte agrupado por NIPD y NIF con Excel de 2 pestañas"""
+def mostrar_auditoria_matches(df_auditoria):
+    """Muestra la auditoría de matching como una única tabla descargable"""
     
-    if 'df_enriquecido' not in st.session_state:
-        st.error("❌ No se encontró el DataFrame enriquecido")
+    st.write("### 🧾 Auditoría de matching")
+    
+    # Estadísticas de matching (en registros, no en combinaciones)
+    registros_por_metodo = df_auditoria.groupby('metodo')['registros'].sum()
+    
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
+    
+    with col1:
+        st.metric("📊 Total registros", int(df_auditoria['registros'].sum()))
+    
+    with col2:
+        st.metric("🎯 Exactos", int(registros_por_metodo.get('exacto', 0)))
+    
+    with col3:
+        st.metric("🔍 Parciales", int(registros_por_metodo.get('parcial', 0)))
+    
+    with col4:
+        st.metric("🧠 Memoria", int(registros_por_metodo.get('memoria', 0)))
+    
+    with col5:
+        st.metric("🍾 CODORNIU", int(
+            registros_por_metodo.get('codorniu', 0) +
+            registros_por_metodo.get('codorniu_zona_desconocida', 0)
+        ))
+    
+    with col6:
+        st.metric("❌ Sin match", int(
+            registros_por_metodo.get('sin_match', 0) +
+            registros_por_metodo.get('codorniu_zona_desconocida', 0)
+        ))
+    
+    # Mostrar primero lo que requiere revisión
+    orden_metodos = {metodo: i for i, metodo in enumerate(ORDEN_METODOS_AUDITORIA)}
+    df_mostrar = df_auditoria.sort_values(
+        ['metodo', 'registros'],
+        key=lambda col: col.map(orden_metodos) if col.name == 'metodo' else -col
+    )
+    
+    st.dataframe(df_mostrar, use_container_width=True, height=300, hide_index=True)
+    
+    st.download_button(
+        label="📥 Descargar auditoría de matching (CSV)",
+        data=df_mostrar.to_csv(index=False).encode('utf-8-sig'),
+        file_name="auditoria_matching_nipd.csv",
+        mime="text/csv",
+        help="Una fila por bodega/zona con el método de matching y el NIPD asignado"
+    )
+
+def mostrar_confirmacion_matches():
+    """
+    Permite confirmar manualmente NIPD de matches parciales o sin match y guardarlos
+    en memoria, y olvidar las resoluciones de memoria que ya no sean correctas
+    """
+    
+    mostrar_olvido_resoluciones()
+    
+    df_auditoria = st.session_state['auditoria_matches']
+    pendientes = df_auditoria[df_auditoria['metodo'].isin(METODOS_CONFIRMABLES)]
+    
+    if pendientes.empty:
         return
     
-    st.write("### 📊 5. Generando Reporte Agrupado...")
+    st.write("#### ✍️ Confirmar resoluciones")
+    st.caption("Revisa o escribe el NIPD, marca 'confirmar' y guarda. Las confirmaciones se reutilizan en próximas campañas.")
     
-    try:
-        # Cargar eRVC
-        archivo_ervc = st.session_state['archivo_ervc']
-        df_ervc = pd.read_excel(archivo_ervc)
-        st.success(f"✅ eRVC: {df_ervc.shape[0]} registros cargados")
-        
-        # Filtrar eRVC
-        df_ervc_filtrado = df_ervc[df_ervc['dos'] == 'CV']
-        st.info(f"📊 eRVC después de filtro 'dos'='CV': {df_ervc_filtrado.shape[0]} registros")
-        
-        # Solo NIPD que existen en extranet
-        df_enriquecido = st.session_state['df_enriquecido']
-        nipd_validos = df_enriquecido['NIPD'].dropna().unique()
-        df_ervc_final = df_ervc_filtrado[df_ervc_filtrado['nipd'].isin(nipd_validos)]
-        
-        st.success(f"✅ eRVC final: {df_ervc_final.shape[0]} registros")
-        st.info(f"🎯 NIPD a analizar: {len(nipd_validos)}")
-        
-        # Preparar datos con fechas
-        with st.spinner("📅 Preparando datos y comparando fechas..."):
-            df_extranet_prep, df_ervc_prep = preparar_datos_fechas(df_enriquecido, df_ervc_final)
-            
-        # DEBUG: Verificar columnas después del procesamiento de fechas
-        st.write("**🔍 DEBUG - Columnas Extranet después de preparar fechas:**", list(df_extranet_prep.columns))
-        st.write("**🔍 DEBUG - Columnas eRVC después de preparar fechas:**", list(df_ervc_prep.columns))
-        
-        # Verificar que NIPD existe en Extranet
-        if 'NIPD' not in df_extranet_prep.columns:
-            st.error("❌ CRÍTICO: La columna NIPD se perdió durante el procesamiento de fechas")
-            st.write("Columnas disponibles:", list(df_extranet_prep.columns))
-            return
+    df_editor = pendientes[['clave', 'zona', 'metodo', 'nombre_match', 'nipd', 'registros']].copy()
+    df_editor['nipd'] = df_editor['nipd'].map(lambda v: '' if v is None or pd.isna(v) else str(v))
+    df_editor['confirmar'] = False
+    
+    df_editado = st.data_editor(
+        df_editor,
+        use_container_width=True,
+        hide_index=True,
+        disabled=['clave', 'zona', 'metodo', 'nombre_match', 'registros'],
+        key="editor_confirmacion_matches"
+    )
+    
+    if st.button("💾 Guardar confirmaciones en memoria"):
+        confirmados = df_editado[df_editado['confirmar'] & (df_editado['nipd'].str.strip() != '')]
         
-        # Verificar que nipd existe en eRVC
-        if 'nipd' not in df_ervc_prep.columns:
-            st.error("❌ CRÍTICO: La columna nipd no existe en eRVC")
-            st.write("Columnas disponibles:", list(df_ervc_prep.columns))
+        if confirmados.empty:
+            st.warning("⚠️ No hay filas marcadas con NIPD para confirmar")
             return
         
-        # Agrupar por NIPD
-        with st.spinner("🏭 Agrupando por NIPD..."):
-            df_nipd = agrupar_por_nipd(df_extranet_prep, df_ervc_prep)
+        # Un NIPD que no es numérico no se guarda: se repetiría como resolución en cada ejecución
+        no_numericos = confirmados[confirmados['nipd'].map(nipd_valido).isna()]
+        if not no_numericos.empty:
+            st.toast(f"⚠️ NIPD no numérico, no se guarda: {', '.join(no_numericos['nipd'].str.strip())}")
+            confirmados = confirmados.drop(no_numericos.index)
+            if confirmados.empty:
+                return
         
-        # Agrupar por NIF
-        with st.spinner("👤 Agrupando por NIF..."):
-            df_nif = agrupar_por_nif(df_extranet_prep, df_ervc_prep)
+        guardados = MemoriaMatches().confirmar(
+            zip(confirmados['clave'], confirmados['zona'], confirmados['nipd'])
+        )
         
-        # Generar Excel
-        with st.spinner("📋 Generando archivo Excel..."):
-            archivo_excel = crear_excel_agrupado(df_nipd, df_nif)
+        # Aplicar las confirmaciones al resultado del Paso 1 sin volver a enriquecer
+        resoluciones = MemoriaMatches().cargar()
+        df_enriquecido = leer_de_sesion('df_enriquecido')
+        col_bodega, col_zona = detectar_columnas_bodega_zona(df_enriquecido)
+        claves = list(zip(
+            df_enriquecido[col_bodega].astype(str).str.strip().str.upper(),
+            df_enriquecido[col_zona].astype(str).str.strip().str.upper()
+        ))
+        confirmadas = set(zip(confirmados['clave'], confirmados['zona']))
+        df_enriquecido['NIPD'] = normalizar_nipd(pd.Series([
+            resoluciones[clave] if clave in confirmadas else nipd
+            for clave, nipd in zip(claves, df_enriquecido['NIPD'])
+        ], index=df_enriquecido.index, dtype=object))
         
-        if archivo_excel:
-            st.success("✅ Reporte generado exitosamente")
-            
-            # Mostrar resúmenes
-            mostrar_resumen_nipd(df_nipd)
-            mostrar_resumen_nif(df_nif)
-            
-            # Botón de descarga
-            st.download_button(
-                label="📥 Descargar Reporte Completo (Excel)",
-                data=archivo_excel,
-                file_name="reporte_agrupado_pesadas.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                help="Descarga el Excel con pestañas NIPD y NIF Viticultor"
-            )
-        else:
-            st.error("❌ Error al generar el archivo Excel")
-            
-    except Exception as e:
-        st.error(f"❌ Error: {str(e)}")
-        import traceback
-        st.code(traceback.format_exc())
-
-def preparar_datos_fechas(df_extranet, df_ervc):
-    """Prepara datos y convierte fechas para comparación"""
-    
-    # Detectar columnas
-    col_fecha_extranet = 'Día y hora:'
-    col_fecha_ervc = None
-    
-    # Buscar columna de fecha en eRVC  
-    posibles_fecha = ['dataPesada', 'dataPesai', 'fecha', 'dataGravacio']
-    for posible in posibles_fecha:
-        if posible in df_ervc.columns:
-            col_fecha_ervc = posible
-            break
-    
-    if not col_fecha_ervc:
-        st.error(f"❌ No se encontró columna fecha en eRVC")
-        return df_extranet, df_ervc
-    
-    st.info(f"📅 Usando fechas: Extranet='{col_fecha_extranet}', eRVC='{col_fecha_ervc}'")
-    
-    # Preparar Extranet
-    df_extranet_prep = df_extranet.copy()
-    try:
-        # Convertir fecha extranet - MEJORADO para manejar múltiples formatos
-        fechas_str = df_extranet_prep[col_fecha_extranet].astype(str).str.split(' ').str[0]
+        mascara = [clave in confirmadas for clave in zip(df_auditoria['clave'], df_auditoria['zona'])]
+        df_auditoria.loc[mascara, 'nipd'] = [
+            resoluciones[clave] for clave in zip(df_auditoria.loc[mascara, 'clave'], df_auditoria.loc[mascara, 'zona'])
+        ]
+        df_auditoria.loc[mascara, 'metodo'] = 'memoria'
         
-        # Primero intentar formato dd/mm/yyyy
-        try:
-            df_extranet_prep['fecha_pesada'] = pd.to_datetime(fechas_str, format='%d/%m/%Y').dt.date
-            st.success("✅ Fechas Extranet procesadas con formato dd/mm/yyyy")
-        except:
-            # Si falla, intentar formato yyyy-mm-dd (ISO)
-            try:
-                df_extranet_prep['fecha_pesada'] = pd.to_datetime(fechas_str, format='%Y-%m-%d').dt.date
-                st.success("✅ Fechas Extranet procesadas con formato yyyy-mm-dd")
-            except:
-                # Como último recurso, usar formato automático
-                df_extranet_prep['fecha_pesada'] = pd.to_datetime(fechas_str, dayfirst=True, errors='coerce').dt.date
-                st.warning("⚠️ Fechas Extranet procesadas con detección automática")
-                
-    except Exception as e:
-        st.error(f"❌ Error al procesar fechas Extranet: {str(e)}")
-        # Crear columna vacía para evitar el error posterior
-        df_extranet_prep['fecha_pesada'] = pd.NaT
-        return df_extranet_prep, df_ervc
-    
-    # Preparar eRVC
-    df_ervc_prep = df_ervc.copy()
-    try:
-        df_ervc_prep['fecha_pesada'] = pd.to_datetime(df_ervc_prep[col_fecha_ervc], errors='coerce').dt.date
-        st.success("✅ Fechas eRVC procesadas correctamente")
-    except Exception as e:
-        st.error(f"❌ Error al procesar fechas eRVC: {str(e)}")
-        # Crear columna vacía para evitar el error posterior
-        df_ervc_prep['fecha_pesada'] = pd.NaT
-        return df_extranet_prep, df_ervc_prep
-    
-    # Verificar que se crearon las columnas
-    if 'fecha_pesada' not in df_extranet_prep.columns or 'fecha_pesada' not in df_ervc_prep.columns:
-        st.error("❌ Error: No se pudieron crear las columnas de fecha")
-        return df_extranet, df_ervc
-    
-    # Filtrar por fechas válidas primero
-    df_extranet_prep = df_extranet_prep.dropna(subset=['fecha_pesada'])
-    df_ervc_prep = df_ervc_prep.dropna(subset=['fecha_pesada'])
-    
-    # Filtrar por fechas coincidentes
-    fechas_extranet = set(df_extranet_prep['fecha_pesada'])
-    fechas_ervc = set(df_ervc_prep['fecha_pesada'])
-    fechas_comunes = fechas_extranet.intersection(fechas_ervc)
-    
-    st.info(f"📊 Fechas válidas - Extranet: {len(fechas_extranet)}, eRVC: {len(fechas_ervc)}")
-    st.info(f"📊 Fechas comunes encontradas: {len(fechas_comunes)}")
-    
-    if len(fechas_comunes) == 0:
-        st.warning("⚠️ No se encontraron fechas comunes. Procesando todos los datos...")
-        # Si no hay fechas comunes, usar todos los datos
-        st.success(f"✅ Datos preparados - Extranet: {len(df_extranet_prep)}, eRVC: {len(df_ervc_prep)}")
-        return df_extranet_prep, df_ervc_prep
-    
-    # Filtrar por fechas comunes
-    df_extranet_prep = df_extranet_prep[df_extranet_prep['fecha_pesada'].isin(fechas_comunes)]
-    df_ervc_prep = df_ervc_prep[df_ervc_prep['fecha_pesada'].isin(fechas_comunes)]
-    
-    st.success(f"✅ Datos filtrados por fechas comunes - Extranet: {len(df_extranet_prep)}, eRVC: {len(df_ervc_prep)}")
-    
-    return df_extranet_prep, df_ervc_prep
+        guardar_en_sesion('df_enriquecido', df_enriquecido)
+        # La tabla compartida del Paso 1 ya no refleja los NIPD confirmados
+        st.session_state.get('tablas_comprobaciones', {}).pop('df_enriquecido', None)
+        st.session_state['auditoria_matches'] = df_auditoria
+        # El reporte anterior se generó con los NIPD sin confirmar
+        borrar_de_sesion('reporte_agrupado')
+        st.toast(f"✅ {guardados} resoluciones guardadas en memoria y aplicadas")
+        st.rerun()
 
-def agrupar_por_nipd(df_extranet, df_ervc):
-    """Agrupa datos por NIPD y calcula diferencias"""
-    
-    # Asegurarse de que las columnas NIPD son de tipo string en ambos DataFrames
-    df_extranet['NIPD'] = df_extranet['NIPD'].astype(str) # <-- CORRECCIÓN AÑADIDA
-    df_ervc['nipd'] = df_ervc['nipd'].astype(str) # <-- CORRECCIÓN AÑADIDA
-    
-    # Agrupar Extranet por NIPD
-    extranet_nipd = df_extranet.groupby('NIPD').agg({
-        'Total Kg:': 'sum',
-        'fecha_pesada': 'nunique'  # Contar días únicos como "número de pesadas"
-    }).rename(columns={
-        'Total Kg:': 'kg_extranet',
-        'fecha_pesada': 'num_pesadas_extranet'
-    }).reset_index()
-    
-    # Agrupar eRVC por NIPD
-    ervc_nipd = df_ervc.groupby('nipd').agg({
-        'kgTotals': 'sum',
-        'fecha_pesada': 'nunique'  # Contar días únicos como "número de pesadas"
-    }).rename(columns={
-        'kgTotals': 'kg_ervc',
-        'fecha_pesada': 'num_pesadas_ervc'
-    }).reset_index()
-    
-    # Renombrar nipd a NIPD después del groupby para el merge
-    ervc_nipd = ervc_nipd.rename(columns={'nipd': 'NIPD'})
-    
-    # Merge
-    df_nipd = pd.merge(ervc_nipd, extranet_nipd, on='NIPD', how='outer')
-    df_nipd = df_nipd.fillna(0)
-    
-    # Calcular diferencias y porcentajes
-    df_nipd['diferencia'] = df_nipd['kg_extranet'] - df_nipd['kg_ervc']
-    df_nipd['porcentaje_diferencia'] = np.where(
-        df_nipd['kg_ervc'] != 0,
-        (df_nipd['diferencia'] / df_nipd['kg_ervc']) * 100,
-        np.inf
-    )
+def mostrar_olvido_resoluciones():
+    """Elimina de la memoria resoluciones aplicadas en esta declaración y rehace su matching"""
     
-    # Calcular incidencias
-    df_nipd['incidencia_pesadas'] = np.where(
-        df_nipd['num_pesadas_ervc'] != df_nipd['num_pesadas_extranet'],
-        'SI', 'NO'
-    )
+    df_auditoria = st.session_state['auditoria_matches']
+    de_memoria = df_auditoria[df_auditoria['metodo'] == 'memoria']
+    
+    if de_memoria.empty:
+        return
     
-    df_nipd['incidencia_kg'] = np.where(
-        (df_nipd['kg_ervc'] != df_nipd['kg_extranet']) & 
-        (abs(df_nipd['porcentaje_diferencia']) > 15),
-        'SI', 'NO'
+    st.write("#### 🧹 Olvidar resoluciones de memoria")
+    opciones = {
+        f"{clave} · {zona} → NIPD {str(nipd).removesuffix('.0')}": (clave, zona)
+        for clave, zona, nipd in zip(de_memoria['clave'], de_memoria['zona'], de_memoria['nipd'])
+    }
+    seleccionadas = st.multiselect(
+        "Resoluciones confirmadas anteriormente que se aplicaron en esta declaración",
+        list(opciones),
+        key="olvidar_resoluciones",
+        help="Se eliminan de la memoria y sus registros vuelven a pasar por el matching"
     )
     
-    # Renombrar columnas para Excel
-    df_nipd = df_nipd.rename(columns={
-        'NIPD': 'nipd',
-        'kg_ervc': 'kgtotales rvc',
-        'kg_extranet': 'kgtotales extranet',
-        'diferencia': 'diferencia',
-        'porcentaje_diferencia': 'porcentaje diferencia',
-        'num_pesadas_ervc': 'cantidad pesadas rvc',
-        'num_pesadas_extranet': 'cantidad pesadas extranet',
-        'incidencia_pesadas': 'incidencia pesadas',
-        'incidencia_kg': 'incidencias kg'
-    })
-    
-    # Reordenar columnas según imagen
-    columnas_orden = [
-        'nipd', 'kgtotales rvc', 'kgtotales extranet', 'diferencia',
-        'porcentaje diferencia', 'cantidad pesadas rvc', 'cantidad pesadas extranet',
-        'incidencia pesadas', 'incidencias kg'
-    ]
+    if not st.button("🧹 Olvidar seleccionadas", disabled=not seleccionadas):
+        return
     
-    df_nipd = df_nipd[columnas_orden]
+    memoria = MemoriaMatches()
+    olvidadas = {opciones[etiqueta] for etiqueta in seleccionadas}
+    for clave, zona in olvidadas:
+        memoria.olvidar(clave, zona)
+    
+    # Rehacer el matching solo de los registros afectados, ya sin esas resoluciones
+    df_enriquecido = leer_de_sesion('df_enriquecido')
+    col_bodega, col_zona = detectar_columnas_bodega_zona(df_enriquecido)
+    afectadas = pd.Series(list(zip(
+        df_enriquecido[col_bodega].astype(str).str.strip().str.upper(),
+        df_enriquecido[col_zona].astype(str).str.strip().str.upper()
+    )), index=df_enriquecido.index).isin(olvidadas)
+    df_rehecho, df_auditoria_rehecha = enriquecer_con_nipd_mejorado(
+        df_enriquecido.loc[afectadas].drop(columns='NIPD'),
+        leer_de_sesion('datos_cargados')['bbdd'],
+        memoria.cargar()
+    )
+    nipd = df_enriquecido['NIPD'].astype(object)
+    nipd.loc[afectadas] = df_rehecho['NIPD'].astype(object)
+    df_enriquecido['NIPD'] = normalizar_nipd(nipd)
+    
+    conservadas = [clave not in olvidadas for clave in zip(df_auditoria['clave'], df_auditoria['zona'])]
+    df_auditoria = pd.concat([df_auditoria[conservadas], df_auditoria_rehecha], ignore_index=True)
+    
+    guardar_en_sesion('df_enriquecido', df_enriquecido)
+    # La tabla compartida del Paso 1 ya no refleja los NIPD rehechos
+    st.session_state.get('tablas_comprobaciones', {}).pop('df_enriquecido', None)
+    st.session_state['auditoria_matches'] = df_auditoria
+    # El reporte anterior se generó con los NIPD olvidados
+    borrar_de_sesion('reporte_agrupado')
+    st.toast(f"🧹 {len(olvidadas)} resoluciones olvidadas y su matching rehecho")
+    st.rerun()
+
+def mostrar_opciones_reporte():
+    """Opciones del reporte agrupado (Paso 2)"""
+    with st.expander("⚙️ Opciones del reporte"):
+        usar_almacen = st.checkbox(
+            "Reutilizar agregados de días ya procesados",
+            value=False,
+            help="Guarda los agregados por NIPD, NIF y día; en ejecuciones posteriores "
+                 "solo se recalculan los días nuevos o modificados"
+        )
+        campana = st.text_input(
+            "Campaña",
+            value=str(datetime.now().year),
+            disabled=not usar_almacen,
+            help="Los agregados guardados se separan por campaña"
+        )
+        
+        st.markdown("**Reglas de incidencia**")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            kg_absoluta = st.number_input(
+                "Tolerancia kg (absoluta)", min_value=0.0,
+                value=float(REGLAS_INCIDENCIA_POR_DEFECTO['kg_absoluta']), step=10.0,
+                help="Diferencia de kg por NIPD que nunca se marca como incidencia"
+            )
+        with col2:
+            kg_relativa = st.number_input(
+                "Tolerancia kg (%)", min_value=0.0,
+                value=float(REGLAS_INCIDENCIA_POR_DEFECTO['kg_relativa']), step=1.0,
+                help="Porcentaje de diferencia de kg por NIPD tolerado"
+            )
+        with col3:
+            ventana_dias = st.number_input(
+                "Ventana de días (±)", min_value=0, max_value=30,
+                value=int(REGLAS_INCIDENCIA_POR_DEFECTO['ventana_dias']), step=1,
+                help="Una pesada registrada con este desfase de días en el otro sistema sigue teniendo pareja. "
+                     "Con 0 se usa el criterio original: incidencia si el número de días distintos no coincide"
+            )
+        with col4:
+            tolerancia_kg_pesada = st.number_input(
+                "Tolerancia kg por pesada", min_value=0.0,
+                value=float(TOLERANCIA_KG_PESADA), step=1.0,
+                help="Diferencia máxima de kg para emparejar dos pesadas individuales"
+            )
+    return {
+        'usar_almacen': usar_almacen,
+        'campana': campana.strip(),
+        'reglas': {
+            'kg_absoluta': kg_absoluta,
+            'kg_relativa': kg_relativa,
+            'ventana_dias': int(ventana_dias)
+        },
+        'tolerancia_kg_pesada': tolerancia_kg_pesada
+    }
+
+def generar_reporte_agrupado(opciones=None, nombre_archivo=None):
+    """Envía al servicio de trabajos el reporte agrupado por NIPD y NIF (Paso 2)"""
+    if 'df_enriquecido' not in st.session_state:
+        st.error("❌ No se encontró el DataFrame enriquecido")
+        return
     
-    return df_nipd
+    borrar_de_sesion('reporte_agrupado')
+    
+    # Se reutilizan las tablas compartidas del Paso 1 mientras sigan en disco
+    tablas = {
+        clave: ruta for clave, ruta in st.session_state.get('tablas_comprobaciones', {}).items()
+        if os.path.exists(ruta)
+    }
+    entradas = [
+        tablas.get('df_enriquecido') or (leer_de_sesion('df_enriquecido'), 'df_enriquecido'),
+        tablas.get('datos_cargados.ervc') or (st.session_state['datos_cargados']['ervc'], 'ervc')
+    ]
+    enviar_trabajo(
+        'trabajo_reporte', 'reporte',
+        entradas,
+        opciones,
+        f"Comprobaciones · Paso 2: {nombre_archivo}" if nombre_archivo else None
+    )
 
-def agrupar_por_nif(df_extranet, df_ervc):
-    """Agrupa datos por NIF y calcula diferencias"""
-    
-    # Asegurarse de que las columnas NIF también son de tipo string
-    df_extranet['Nif Viticultor'] = df_extranet['Nif Viticultor'].astype(str)
-    df_ervc['nifLLiurador'] = df_ervc['nifLLiurador'].astype(str)
-    
-    # Agrupar Extranet por NIF
-    extranet_nif = df_extranet.groupby('Nif Viticultor').agg({
-        'Total Kg:': 'sum',
-        'fecha_pesada': 'nunique',
-        'NIPD': 'first'  # Para mantener referencia al NIPD
-    }).rename(columns={
-        'Total Kg:': 'kg_extranet',
-        'fecha_pesada': 'num_pesadas_extranet'
-    }).reset_index()
-    
-    # --- INICIO DE LA CORRECCIÓN ---
-    # Se corrige el orden de las operaciones: groupby -> reset_index -> rename
-    
-    # Agrupar eRVC por NIF
-    ervc_nif = df_ervc.groupby('nifLLiurador').agg({
-        'kgTotals': 'sum',
-        'fecha_pesada': 'nunique',
-        'nipd': 'first'
-    }).reset_index().rename(columns={  # Renombrar DESPUÉS de reset_index
-        'kgTotals': 'kg_ervc',
-        'fecha_pesada': 'num_pesadas_ervc',
-        'nifLLiurador': 'nif' # Ahora sí renombra la columna correctamente
-    })
-    # --- FIN DE LA CORRECCIÓN ---
-    
-    # Merge por NIF (Ahora 'nif' sí existe en ervc_nif)
-    df_nif = pd.merge(
-        ervc_nif, extranet_nif, 
-        left_on='nif', right_on='Nif Viticultor', 
-        how='outer'
+def mostrar_reporte_agrupado(reporte):
+    """Muestra los resúmenes, la descarga y el desglose de un reporte guardado en la sesión"""
+    st.markdown("### 📊 Reporte Agrupado")
+    
+    mostrar_resumen_nipd(reporte['df_nipd'])
+    mostrar_resumen_nif(reporte['df_nif'])
+    mostrar_resumen_pesadas(reporte['df_pesadas'], reporte['tolerancia_kg_pesada'])
+    if 'df_consistencia' in reporte:
+        mostrar_resumen_consistencia(reporte['df_consistencia'])
+    
+    # Botón de descarga
+    st.download_button(
+        label="📥 Descargar Reporte Completo (Excel)",
+        data=reporte['archivo_excel'],
+        file_name="reporte_agrupado_pesadas.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        help="Descarga el Excel con pestañas NIPD, NIF Viticultor, conciliación de pesadas y consistencia de NIF"
     )
-    df_nif = df_nif.fillna(0)
     
-    # Usar el NIF de la columna que no sea 0
-    df_nif['nif_final'] = np.where(
-        df_nif['nif'] != 0, df_nif['nif'], df_nif['Nif Viticultor']
-    )
+    mostrar_desglose(reporte)
+
+def mostrar_desglose(reporte):
+    """Desglose por día y por pesada de un NIPD o NIF del reporte"""
+    st.markdown("#### 🔎 Desglose por NIPD / NIF")
     
-    # Usar el NIPD de la columna que no sea 0
-    df_nif['nipd_final'] = np.where(
-        df_nif['nipd'] != 0, df_nif['nipd'], df_nif['NIPD']
-    )
+    col1, col2 = st.columns([1, 3])
     
-    # Calcular diferencias y porcentajes
-    df_nif['diferencia'] = df_nif['kg_extranet'] - df_nif['kg_ervc']
-    df_nif['porcentaje_diferencia'] = np.where(
-        df_nif['kg_ervc'] != 0,
-        (df_nif['diferencia'] / df_nif['kg_ervc']) * 100,
-        np.inf
-    )
+    with col1:
+        tipo = st.radio("Desglosar por", ['NIPD', 'NIF'], horizontal=True, key='desglose_tipo')
+    
+    # Primero las claves con incidencias
+    if tipo == 'NIPD':
+        clave = 'nipd'
+        df_resumen = reporte['df_nipd']
+        con_incidencia = (df_resumen['incidencia pesadas'] == 'SI') | (df_resumen['incidencias kg'] == 'SI')
+    else:
+        clave = 'nif'
+        df_resumen = reporte['df_nif']
+        con_incidencia = df_resumen['incidencia pesadas'] == 'SI'
+    
+    opciones = pd.concat([
+        df_resumen.loc[con_incidencia, clave], df_resumen.loc[~con_incidencia, clave]
+    ]).dropna().tolist()
+    
+    if not opciones:
+        st.info("ℹ️ No hay claves para desglosar")
+        return
     
-    # Calcular incidencias
-    df_nif['incidencia_pesadas'] = np.where(
-        df_nif['num_pesadas_ervc'] != df_nif['num_pesadas_extranet'],
-        'SI', 'NO'
-    )
+    con_incidencia_claves = set(df_resumen.loc[con_incidencia, clave].dropna().tolist())
     
-    # Limpiar y renombrar columnas para Excel
-    df_nif = df_nif[[
-        'nipd_final', 'nif_final', 'kg_ervc', 'kg_extranet', 'diferencia',
-        'porcentaje_diferencia', 'num_pesadas_ervc', 'num_pesadas_extranet',
-        'incidencia_pesadas'
-    ]].rename(columns={
-        'nipd_final': 'nipd',
-        'nif_final': 'nif',
-        'kg_ervc': 'KgTotales RVC',
-        'kg_extranet': 'KgTotales Extranet',
-        'diferencia': 'diferencia porcentual',
-        'porcentaje_diferencia': 'porcentaje diferencia pesadas',
-        'num_pesadas_ervc': 'numero pesadas viticultor rvc',
-        'num_pesadas_extranet': 'numero pesadas viticultor extranet',
-        'incidencia_pesadas': 'incidencia pesadas'
-    })
-    
-    return df_nif
-
-def crear_excel_agrupado(df_nipd, df_nif):
-    """Crea archivo Excel con 2 pestañas"""
+    with col2:
+        valor = st.selectbox(
+            f"{tipo} a desglosar",
+            opciones,
+            key=f'desglose_{clave}',
+            format_func=lambda v: f"⚠️ {v}" if v in con_incidencia_claves else str(v),
+            help="Las claves con incidencias aparecen primero"
+        )
     
-    try:
-        from io import BytesIO
-        import pandas as pd
-        
-        output = BytesIO()
-        
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # Pestaña NIPD
-            df_nipd.to_excel(writer, sheet_name='nipd', index=False)
-            
-            # Pestaña NIF
-            df_nif.to_excel(writer, sheet_name='nifViticultor', index=False)
-        
-        output.seek(0)
-        return output.getvalue()
-        
-    except Exception as e:
-        st.error(f"❌ Error al crear Excel: {str(e)}")
-        return None
+    df_diario, df_pesadas = consultar_desglose(reporte['indice_desglose'], clave, valor)
+    
+    st.markdown(f"**📅 Por día ({len(df_diario)} días)**")
+    st.dataframe(df_diario, use_container_width=True, hide_index=True)
+    
+    st.markdown(f"**⚖️ Por pesada ({len(df_pesadas)} líneas)**")
+    st.dataframe(df_pesadas, use_container_width=True, hide_index=True)
 
 def mostrar_resumen_nipd(df_nipd):
     """Muestra resumen de agrupación por NIPD"""
@@ -673,6 +588,54 @@ def mostrar_resumen_nif(df_nif):
     # Mostrar tabla resumida
     st.dataframe(df_nif, use_container_width=True, height=300)
 
+def mostrar_resumen_pesadas(df_pesadas, tolerancia_kg=TOLERANCIA_KG_PESADA):
+    """Muestra resumen de la conciliación pesada a pesada"""
+    st.markdown("#### ⚖️ Conciliación por Pesada")
+    st.caption(f"Pesadas emparejadas por NIPD, NIF y día con tolerancia de {tolerancia_kg:g} kg")
+    
+    resumen = resumir_conciliacion(df_pesadas)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("✅ Emparejadas", resumen['emparejada'])
+    
+    with col2:
+        st.metric("❓ Ambiguas", resumen['ambigua'])
+    
+    with col3:
+        st.metric("📊 Solo Extranet", resumen['solo_extranet'])
+    
+    with col4:
+        st.metric("⚖️ Solo eRVC", resumen['solo_ervc'])
+    
+    # Mostrar solo las líneas que requieren revisión
+    st.dataframe(df_pesadas[df_pesadas['estado'] != ESTADO_EMPAREJADA], use_container_width=True, height=300)
+
+def mostrar_resumen_consistencia(df_consistencia):
+    """Muestra los NIF con incidencias de consistencia entre Extranet y eRVC"""
+    st.markdown("#### 🔗 Consistencia de NIF entre Extranet y eRVC")
+    st.caption("NIF comparados sin guiones, espacios ni ceros a la izquierda")
+    
+    resumen = resumir_consistencia(df_consistencia)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("✏️ Formato distinto", resumen['formato'])
+    
+    with col2:
+        st.metric("🏭 NIPD distinto", resumen['nipd_distinto'])
+    
+    with col3:
+        st.metric("📊 Solo Extranet", resumen['solo_extranet'])
+    
+    with col4:
+        st.metric("⚖️ Solo eRVC", resumen['solo_ervc'])
+    
+    if len(df_consistencia):
+        st.dataframe(df_consistencia, use_container_width=True, height=300, hide_index=True)
+
 # Para poder ejecutar este script directamente (si es necesario)
 if __name__ == '__main__':
     mostrar_pagina()
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Servicio local de trabajos (utils.trabajos) y cliente por línea de comandos.
+
+Uso:
+    python servidor_trabajos.py servir --max-concurrentes 4
+    python servidor_trabajos.py enviar verificador declaracion.xlsx
+    python servidor_trabajos.py enviar comprobaciones declaracion_corregida.xlsx BBDD_FINAL.xlsx eRVC.xlsx \
+        --opciones '{"reglas": {"ventana_dias": 1}}' --esperar --salida reporte.xlsx
+    python servidor_trabajos.py listar
+
+Si la aplicación de Streamlit no encuentra el servicio, arranca uno propio; con
+este script el servicio (y sus trabajos) sobrevive a los reinicios de la web.
+Los archivos de 'enviar' se copian antes al directorio de entradas del servicio,
+y 'estado' solo muestra trabajos del usuario indicado.
+"""
+import argparse
+import asyncio
+import getpass
+import json
+import os
+import sys
+
+from utils.trabajos import (
+    ServicioTrabajos, ClienteTrabajos, ErrorTrabajos, TIPOS_TRABAJO,
+    HOST_TRABAJOS, PUERTO_TRABAJOS, MAX_TRABAJOS_CONCURRENTES, MEMORIA_TRABAJOS_MB,
+    ESTADO_EN_COLA, ESTADO_TERMINADO
+)
+
+# Archivo que guarda --salida según el tipo de trabajo
+SALIDA_POR_TIPO = {
+    'verificador': 'archivo_corregido',
+    'comprobaciones': 'archivo_excel',
+    'reporte': 'archivo_excel'
+}
+
+def describir(trabajo):
+    linea = f"{trabajo['id']}  {trabajo['estado']:<10}  {trabajo['usuario'][:12]:<12}  {trabajo['descripcion']}"
+    linea += f"  ~{trabajo['memoria_mb']:,.0f} MB"
+    if trabajo.get('procesos', 1) > 1:
+        linea += f", {trabajo['procesos']} procesos"
+    if trabajo['estado'] == ESTADO_EN_COLA:
+        linea += f"  (posición {trabajo['posicion']} de {trabajo['en_cola']})"
+        if trabajo.get('espera'):
+            linea += f"  {trabajo['espera']}"
+    if trabajo.get('error'):
+        linea += f"  ❌ {trabajo['error']}"
+    return linea
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio local de trabajos de verificación y comprobaciones")
+    parser.add_argument('--puerto', type=int, default=PUERTO_TRABAJOS)
+    subparsers = parser.add_subparsers(dest='orden', required=True)
+
+    servir = subparsers.add_parser('servir', help="Arranca el servicio")
+    servir.add_argument('--max-concurrentes', type=int, default=MAX_TRABAJOS_CONCURRENTES)
+    servir.add_argument('--memoria-mb', type=float, default=MEMORIA_TRABAJOS_MB,
+                        help="Memoria estimada máxima de los trabajos en curso")
+    servir.add_argument('--procesos-por-trabajo', type=int, default=None,
+                        help="Procesos hijos por trabajo de comprobaciones (por defecto CPU / max-concurrentes)")
+
+    enviar = subparsers.add_parser('enviar', help="Encola un trabajo")
+    enviar.add_argument('tipo', choices=list(TIPOS_TRABAJO))
+    enviar.add_argument('rutas', nargs='+')
+    enviar.add_argument('--opciones', default='{}', help="Opciones del trabajo en JSON")
+    enviar.add_argument('--esperar', action='store_true', help="Esperar a que termine")
+    enviar.add_argument('--salida', default=None, help="Con --esperar, guardar aquí el Excel resultante")
+    enviar.add_argument('--usuario', default=getpass.getuser(), help="Usuario para el reparto de la cola")
+
+    estado = subparsers.add_parser('estado', help="Estado de un trabajo")
+    estado.add_argument('id')
+    estado.add_argument('--usuario', default=getpass.getuser(), help="Usuario que envió el trabajo")
+
+    listar = subparsers.add_parser('listar', help="Lista los trabajos del servicio")
+    listar.add_argument('--usuario', default=None, help="Solo los trabajos de este usuario")
+
+    args = parser.parse_args()
+
+    if args.orden == 'servir':
+        print(f"Servicio de trabajos en {HOST_TRABAJOS}:{args.puerto} "
+              f"({args.max_concurrentes} a la vez, {args.memoria_mb:,.0f} MB)")
+        try:
+            servicio = ServicioTrabajos(
+                args.max_concurrentes, memoria_mb=args.memoria_mb, procesos_por_trabajo=args.procesos_por_trabajo
+            )
+            asyncio.run(servicio.servir(HOST_TRABAJOS, args.puerto))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    cliente = ClienteTrabajos(HOST_TRABAJOS, args.puerto)
+    try:
+        if args.orden == 'enviar':
+            rutas = []
+            for ruta in args.rutas:
+                with open(ruta, 'rb') as f:
+                    rutas.append(cliente.guardar_entrada(f.read(), os.path.basename(ruta)))
+            id_trabajo = cliente.enviar(args.tipo, rutas, json.loads(args.opciones), usuario=args.usuario)
+            print(id_trabajo)
+            if args.esperar:
+                final = cliente.esperar(id_trabajo, args.usuario)
+                print(describir(final))
+                if final['estado'] != ESTADO_TERMINADO:
+                    return 1
+                if args.salida and args.tipo in SALIDA_POR_TIPO:
+                    with open(args.salida, 'wb') as f:
+                        f.write(cliente.resultado(id_trabajo, args.usuario)[SALIDA_POR_TIPO[args.tipo]])
+                    print(f"Guardado: {args.salida}")
+        elif args.orden == 'estado':
+            print(describir(cliente.estado(args.id, args.usuario)))
+        else:
+            for trabajo in cliente.listar(args.usuario):
+                print(describir(trabajo))
+    except ConnectionRefusedError:
+        print(f"❌ No hay servicio de trabajos en {HOST_TRABAJOS}:{args.puerto} (python servidor_trabajos.py servir)", file=sys.stderr)
+        return 1
+    except ErrorTrabajos as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
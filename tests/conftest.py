@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+# Columnas de las pesadas preparadas de cada sistema: NIPD, NIF, fecha y kg
+COLUMNAS_EXTRANET = ['NIPD', 'Nif Viticultor', 'fecha_pesada', 'Total Kg:']
+COLUMNAS_ERVC = ['nipd', 'nifLLiurador', 'fecha_pesada', 'kgTotals']
+
+
+def _tabla(filas, columnas):
+    """filas: tuplas con las primeras columnas que necesite la prueba (p. ej. solo NIPD y NIF)"""
+    return pd.DataFrame(filas, columns=columnas[:len(filas[0]) if filas else len(columnas)])
+
+
+@pytest.fixture
+def tabla_extranet():
+    """Pesadas de Extranet a partir de tuplas (nipd, nif[, fecha, kg])"""
+    return lambda filas: _tabla(filas, COLUMNAS_EXTRANET)
+
+
+@pytest.fixture
+def tabla_ervc():
+    """Pesadas de eRVC a partir de tuplas (nipd, nif[, fecha, kg])"""
+    return lambda filas: _tabla(filas, COLUMNAS_ERVC)
+
+
+@pytest.fixture
+def filas_ordenadas():
+    """Tuplas ordenadas de las columnas indicadas; -1 en los enteros nulos (p. ej. una línea que no hay)"""
+    def ordenar(df, *columnas):
+        valores = [
+            df[col].fillna(-1).astype(int) if pd.api.types.is_integer_dtype(df[col]) else df[col]
+            for col in columnas
+        ]
+        return sorted(zip(*valores))
+    return ordenar
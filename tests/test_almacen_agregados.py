@@ -0,0 +1,95 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.agregacion import construir_cubo, consolidar_por_nif
+from utils.almacen_agregados import AlmacenAgregados, actualizar_cubo_incremental
+
+COLUMNAS = ('NIPD', 'Nif Viticultor', 'Total Kg:')
+
+
+def _preparado(filas=600, semilla=0):
+    """Pesadas preparadas de 10 días, en un orden de archivo que no es cronológico"""
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({
+        'NIPD': pd.array(rng.integers(1, 6, filas), dtype='Int64'),
+        'Nif Viticultor': pd.Categorical(rng.choice([f'{i:08d}Z' for i in range(30)], filas)),
+        'Total Kg:': rng.integers(50, 500, filas),
+        'fecha_pesada': [date(2025, 9, 1) + timedelta(days=int(d)) for d in rng.integers(0, 10, filas)]
+    })
+
+
+def _comparable(cubo):
+    return cubo.astype({'nif': object, 'kg': 'float64'}).reset_index(drop=True)
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    return AlmacenAgregados(str(tmp_path / 'agregados.sqlite'))
+
+
+def test_cubo_incremental_igual_al_completo(almacen):
+    df = _preparado()
+
+    cubo, resumen = actualizar_cubo_incremental(almacen, 'ana', '2025', 'extranet', df, *COLUMNAS)
+    assert resumen == {'nuevas': 10, 'modificadas': 0, 'reutilizadas': 0}
+    pd.testing.assert_frame_equal(_comparable(cubo), _comparable(construir_cubo(df, *COLUMNAS)))
+
+    cubo, resumen = actualizar_cubo_incremental(almacen, 'ana', '2025', 'extranet', df, *COLUMNAS)
+    assert resumen == {'nuevas': 0, 'modificadas': 0, 'reutilizadas': 10}
+    pd.testing.assert_frame_equal(_comparable(cubo), _comparable(construir_cubo(df, *COLUMNAS)))
+
+
+def test_primera_fila_sigue_el_orden_del_archivo_al_reutilizar(almacen):
+    df = _preparado()
+    actualizar_cubo_incremental(almacen, 'ana', '2025', 'extranet', df, *COLUMNAS)
+
+    # Misma campaña exportada en otro orden y con un día modificado
+    reordenado = df.sample(frac=1, random_state=1).reset_index(drop=True)
+    dia = reordenado['fecha_pesada'].iloc[0]
+    reordenado.loc[reordenado['fecha_pesada'] == dia, 'Total Kg:'] += 1
+
+    cubo, resumen = actualizar_cubo_incremental(almacen, 'ana', '2025', 'extranet', reordenado, *COLUMNAS)
+    referencia = construir_cubo(reordenado, *COLUMNAS)
+
+    assert resumen == {'nuevas': 0, 'modificadas': 1, 'reutilizadas': 9}
+    pd.testing.assert_frame_equal(_comparable(cubo), _comparable(referencia))
+    # El "primer NIPD" de cada NIF no depende de si se usa el almacén
+    assert consolidar_por_nif(cubo)['nipd'].equals(consolidar_por_nif(referencia)['nipd'])
+
+
+def test_ambitos_separados_y_transaccion(almacen):
+    df = _preparado()
+    otro = _preparado(semilla=1)
+    actualizar_cubo_incremental(almacen, 'ana', '2025', 'extranet', df, *COLUMNAS)
+
+    # Otra declaración de la misma campaña, de otro usuario, no pisa las particiones de ana
+    cubo, resumen = actualizar_cubo_incremental(almacen, 'bea', '2025', 'extranet', otro, *COLUMNAS)
+    assert resumen == {'nuevas': 10, 'modificadas': 0, 'reutilizadas': 0}
+    pd.testing.assert_frame_equal(_comparable(cubo), _comparable(construir_cubo(otro, *COLUMNAS)))
+    cubo, resumen = actualizar_cubo_incremental(almacen, 'ana', '2025', 'extranet', df, *COLUMNAS)
+    assert resumen == {'nuevas': 0, 'modificadas': 0, 'reutilizadas': 10}
+    pd.testing.assert_frame_equal(_comparable(cubo), _comparable(construir_cubo(df, *COLUMNAS)))
+
+    # Un fallo dentro de la transacción no deja particiones a medias
+    dia = df['fecha_pesada'].iloc[0]
+    cubo_dia = construir_cubo(df[df['fecha_pesada'] == dia], *COLUMNAS)
+    with pytest.raises(RuntimeError):
+        with almacen.transaccion() as conn:
+            almacen.guardar_particiones('ana', '2025', 'extranet', cubo_dia, {dia: 'modificada'}, conn)
+            raise RuntimeError
+    assert almacen.huellas('ana', '2025', 'extranet')[dia] != 'modificada'
+
+    # Mientras otra ejecución tiene la transacción abierta, la actualización espera
+    hilo = threading.Thread(
+        target=actualizar_cubo_incremental, args=(almacen, 'bea', '2025', 'extranet', df, *COLUMNAS)
+    )
+    with almacen.transaccion():
+        hilo.start()
+        hilo.join(0.5)
+        assert hilo.is_alive()
+    hilo.join()
+    assert almacen.huellas('bea', '2025', 'extranet') == almacen.huellas('ana', '2025', 'extranet')
@@ -0,0 +1,14 @@
+import pandas as pd
+
+from utils.claves import normalizar_nipd
+
+
+def test_normalizar_nipd_mismo_entero_para_texto_y_numero():
+    serie = pd.Series(['802400022', 802400022, 802400022.0, ' 802400022.00 '], dtype=object)
+    assert normalizar_nipd(serie).tolist() == [802400022] * 4
+
+
+def test_normalizar_nipd_no_trunca_decimales():
+    serie = pd.Series(['1.5', 1.5, '2', 'abc', None, float('inf')], dtype=object)
+    assert normalizar_nipd(serie).tolist() == [pd.NA, pd.NA, 2, pd.NA, pd.NA, pd.NA]
+    assert normalizar_nipd(pd.Series([1.0, 2.5])).tolist() == [1, pd.NA]
@@ -0,0 +1,91 @@
+from datetime import date
+
+from utils.conciliacion import (
+    conciliar_pesadas, resumir_conciliacion,
+    ESTADO_EMPAREJADA, ESTADO_AMBIGUA, ESTADO_SOLO_EXTRANET, ESTADO_SOLO_ERVC
+)
+
+DIA = date(2025, 9, 10)
+# Estado y líneas de cada fila conciliada (-1 donde no hay línea)
+LINEAS = ('estado', 'linea_extranet', 'linea_ervc')
+
+
+def test_emparejamiento_exacto_uno_a_uno_con_repeticiones(tabla_extranet, tabla_ervc):
+    extranet = tabla_extranet([(1, 'A', DIA, 100), (1, 'A', DIA, 100), (1, 'A', DIA, 100)])
+    ervc = tabla_ervc([(1, 'A', DIA, 100), (1, 'A', DIA, 100)])
+
+    resultado = conciliar_pesadas(extranet, ervc)
+
+    assert resumir_conciliacion(resultado) == {
+        ESTADO_EMPAREJADA: 2, ESTADO_AMBIGUA: 0, ESTADO_SOLO_EXTRANET: 1, ESTADO_SOLO_ERVC: 0
+    }
+
+
+def test_emparejamiento_por_tolerancia_y_ambiguas(tabla_extranet, tabla_ervc, filas_ordenadas):
+    extranet = tabla_extranet([
+        (1, 'A', DIA, 100),   # dentro de tolerancia de la eRVC 0
+        (2, 'B', DIA, 200),   # las dos apuntan a la misma eRVC: ambiguas
+        (2, 'B', DIA, 202),
+        (3, 'C', DIA, 300),   # fuera de tolerancia
+    ])
+    ervc = tabla_ervc([(1, 'A', DIA, 103), (2, 'B', DIA, 201), (3, 'C', DIA, 320)])
+
+    resultado = conciliar_pesadas(extranet, ervc, tolerancia_kg=5)
+
+    assert filas_ordenadas(resultado, *LINEAS) == sorted([
+        (ESTADO_EMPAREJADA, 0, 0),
+        (ESTADO_AMBIGUA, 1, -1),
+        (ESTADO_AMBIGUA, 2, -1),
+        (ESTADO_AMBIGUA, -1, 1),
+        (ESTADO_SOLO_EXTRANET, 3, -1),
+        (ESTADO_SOLO_ERVC, -1, 2),
+    ])
+    emparejada = resultado[resultado['estado'] == ESTADO_EMPAREJADA].iloc[0]
+    assert emparejada['diferencia_kg'] == -3
+
+
+def test_kg_enteros_frente_a_decimales(tabla_extranet, tabla_ervc):
+    # Extranet con kg enteros y eRVC con decimales: el merge_asof necesita el mismo tipo
+    extranet = tabla_extranet([(1, 'A', DIA, 100)]).astype({'Total Kg:': 'int32'})
+    ervc = tabla_ervc([(1, 'A', DIA, 101.5)])
+
+    resultado = conciliar_pesadas(extranet, ervc, tolerancia_kg=5)
+
+    assert list(resultado['estado']) == [ESTADO_EMPAREJADA]
+
+
+def test_ventana_de_dias(tabla_extranet, tabla_ervc, filas_ordenadas):
+    extranet = tabla_extranet([(1, 'A', DIA, 100)])
+    ervc = tabla_ervc([(1, 'A', date(2025, 9, 12), 100)])
+
+    assert resumir_conciliacion(conciliar_pesadas(extranet, ervc))[ESTADO_EMPAREJADA] == 0
+
+    resultado = conciliar_pesadas(extranet, ervc, ventana_dias=2)
+    assert list(resultado['estado']) == [ESTADO_EMPAREJADA]
+    assert resultado['desfase_dias'].iloc[0] == 2
+
+    assert resumir_conciliacion(conciliar_pesadas(extranet, ervc, ventana_dias=1))[ESTADO_EMPAREJADA] == 0
+
+    # Una pesada más cercana pero fuera de tolerancia no tapa la que sí cuadra en kg
+    extranet = tabla_extranet([(1, 'A', DIA, 1000)])
+    ervc = tabla_ervc([(1, 'A', date(2025, 9, 11), 5000), (1, 'A', date(2025, 9, 12), 1000)])
+    resultado = conciliar_pesadas(extranet, ervc, ventana_dias=3)
+    assert filas_ordenadas(resultado, *LINEAS) == [(ESTADO_EMPAREJADA, 0, 1), (ESTADO_SOLO_ERVC, -1, 0)]
+    assert resultado.loc[resultado['estado'] == ESTADO_EMPAREJADA, 'desfase_dias'].iloc[0] == 2
+
+    # Dos candidatas a la misma distancia (un día antes y uno después): ambiguas
+    ervc = tabla_ervc([(1, 'A', date(2025, 9, 9), 1000), (1, 'A', date(2025, 9, 11), 1002)])
+    assert filas_ordenadas(conciliar_pesadas(extranet, ervc, ventana_dias=3), *LINEAS) == sorted([
+        (ESTADO_AMBIGUA, 0, -1), (ESTADO_AMBIGUA, -1, 0), (ESTADO_AMBIGUA, -1, 1)
+    ])
+
+
+def test_pesadas_sin_clave_no_se_emparejan(tabla_extranet, tabla_ervc):
+    extranet = tabla_extranet([(None, 'A', DIA, 100), (1, 'A', None, 100)])
+    ervc = tabla_ervc([(None, 'A', DIA, 100), (1, 'A', None, 100)])
+
+    resultado = conciliar_pesadas(extranet.astype({'NIPD': 'Int64'}), ervc.astype({'nipd': 'Int64'}))
+
+    assert resumir_conciliacion(resultado) == {
+        ESTADO_EMPAREJADA: 0, ESTADO_AMBIGUA: 0, ESTADO_SOLO_EXTRANET: 2, ESTADO_SOLO_ERVC: 2
+    }
@@ -0,0 +1,62 @@
+import pandas as pd
+
+from utils.consistencia import (
+    clave_nif, comprobar_consistencia, resumir_consistencia, COLUMNAS_CONSISTENCIA,
+    TIPO_FORMATO, TIPO_NIPD_DISTINTO, TIPO_SOLO_EXTRANET, TIPO_SOLO_ERVC
+)
+
+
+def test_clave_nif_normaliza_escritura():
+    serie = pd.Series(['12345678-z', ' 012345678Z', '12345678Z', None, '---', '00'])
+    assert clave_nif(serie).tolist() == ['12345678Z', '12345678Z', '12345678Z', None, None, None]
+
+
+def test_sin_incidencias(tabla_extranet, tabla_ervc):
+    df_extranet = tabla_extranet([(1, '11111111A'), (1, '11111111A'), (2, '22222222B')])
+    df_ervc = tabla_ervc([(1, '11111111A'), (2, '22222222B')])
+    df = comprobar_consistencia(df_extranet, df_ervc)
+    assert list(df.columns) == COLUMNAS_CONSISTENCIA
+    assert df.empty
+    assert resumir_consistencia(df) == {
+        TIPO_FORMATO: 0, TIPO_NIPD_DISTINTO: 0, TIPO_SOLO_EXTRANET: 0, TIPO_SOLO_ERVC: 0
+    }
+
+
+def test_formato_no_cuenta_como_ausente(tabla_extranet, tabla_ervc, filas_ordenadas):
+    df_extranet = tabla_extranet([(1, '11111111-a'), (1, '11111111-a')])
+    df_ervc = tabla_ervc([(1, '011111111A')])
+    df = comprobar_consistencia(df_extranet, df_ervc)
+
+    assert filas_ordenadas(df, 'tipo', 'nif') == [(TIPO_FORMATO, '11111111-a')]
+    fila = df.iloc[0]
+    assert fila['variantes_extranet'] == '11111111-a'
+    assert fila['variantes_ervc'] == '011111111A'
+    assert (fila['pesadas_extranet'], fila['pesadas_ervc']) == (2, 1)
+
+
+def test_nipd_distinto(tabla_extranet, tabla_ervc, filas_ordenadas):
+    df_extranet = tabla_extranet([(1, '11111111A'), (2, '11111111A')])
+    df_ervc = tabla_ervc([(1, '11111111A'), (3, '11111111A')])
+    df = comprobar_consistencia(df_extranet, df_ervc)
+
+    assert filas_ordenadas(df, 'tipo', 'nif') == [(TIPO_NIPD_DISTINTO, '11111111A')]
+    assert df.iloc[0]['nipd_extranet'] == '1, 2'
+    assert df.iloc[0]['nipd_ervc'] == '1, 3'
+
+
+def test_solo_en_un_sistema(tabla_extranet, tabla_ervc, filas_ordenadas):
+    df_extranet = tabla_extranet([(1, '11111111A'), (2, '22222222B')])
+    # 33333333C comparte NIPD con la declaración; 44444444D es de otra bodega y se ignora
+    df_ervc = tabla_ervc([(1, '11111111A'), (2, '33333333C'), (9, '44444444D')])
+    df = comprobar_consistencia(df_extranet, df_ervc)
+
+    assert filas_ordenadas(df, 'tipo', 'nif') == [(TIPO_SOLO_ERVC, '33333333C'), (TIPO_SOLO_EXTRANET, '22222222B')]
+    solo_extranet = df[df['tipo'] == TIPO_SOLO_EXTRANET].iloc[0]
+    assert (solo_extranet['variantes_ervc'], solo_extranet['pesadas_ervc']) == ('', 0)
+    assert resumir_consistencia(df)[TIPO_SOLO_ERVC] == 1
+
+
+def test_nif_vacios_se_ignoran(tabla_extranet, tabla_ervc):
+    df_extranet = tabla_extranet([(1, '11111111A'), (1, None), (1, ' - ')])
+    df_ervc = tabla_ervc([(1, '11111111A'), (1, None)])
+    assert comprobar_consistencia(df_extranet, df_ervc).empty
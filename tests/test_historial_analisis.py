@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.historial_analisis import HistorialAnalisis, comparar_analisis, huellas_filas
+
+
+def _declaracion(filas=20):
+    return pd.DataFrame({
+        'Verificador': ['V1'] * filas,
+        'Nif Viticultor': [f'{i:08d}Z' for i in range(filas)],
+        'Total Kg:': [100 + i for i in range(filas)]
+    })
+
+
+def _anterior(df, filas_con_error):
+    huellas = huellas_filas(df)
+    return {
+        'huellas': huellas,
+        'huellas_con_error': huellas[filas_con_error],
+        'actualizado': '2026-01-01T00:00:00'
+    }
+
+
+def test_huellas_independientes_de_tipos_compactos_pero_no_de_texto_y_numero():
+    df = _declaracion()
+    compacto = df.astype({'Total Kg:': 'int16', 'Verificador': 'category'})
+    assert (huellas_filas(df) == huellas_filas(compacto)).all()
+
+    como_texto = df.astype({'Total Kg:': str})
+    assert not (huellas_filas(df) == huellas_filas(como_texto)).any()
+
+
+def test_comparar_sin_cambios():
+    df = _declaracion()
+    huellas = huellas_filas(df)
+    con_error = np.zeros(len(df), dtype=bool)
+    con_error[[3, 7]] = True
+
+    resumen = comparar_analisis(_anterior(df, [3, 7]), huellas, con_error)
+
+    assert resumen['comparable']
+    assert resumen['filas_reutilizadas'] == len(df)
+    assert (resumen['modificadas'], resumen['nuevas'], resumen['eliminadas']) == (0, 0, 0)
+    assert (resumen['errores_resueltos'], resumen['errores_nuevos']) == (0, 0)
+
+
+def test_comparar_filas_modificadas_nuevas_y_eliminadas():
+    df = _declaracion()
+    anterior = _anterior(df, [3, 7])
+
+    editado = df.copy()
+    editado.loc[3, 'Nif Viticultor'] = '12345678Z'   # corrige un error
+    editado.loc[5, 'Nif Viticultor'] = 'XXX'         # introduce otro
+    editado = editado.drop(index=10)                 # elimina una fila sin error
+    editado = pd.concat([editado, _declaracion(1).assign(**{'Total Kg:': 999})], ignore_index=True)
+    con_error = np.zeros(len(editado), dtype=bool)
+    con_error[[5, 6]] = True  # la 7 original queda en la posición 6
+
+    resumen = comparar_analisis(anterior, huellas_filas(editado), con_error)
+
+    assert resumen['comparable']
+    assert resumen['modificadas'] == 2
+    assert resumen['filas_modificadas'] == [3, 5]
+    assert resumen['eliminadas'] == 1
+    assert resumen['nuevas'] == 1
+    assert resumen['errores_resueltos'] == 1
+    assert resumen['errores_nuevos'] == 1
+
+
+def test_comparar_archivo_distinto_no_es_comparable():
+    anterior = _anterior(_declaracion(), [])
+    otro = _declaracion().assign(**{'Total Kg:': 1})
+    resumen = comparar_analisis(anterior, huellas_filas(otro), np.zeros(len(otro), dtype=bool))
+
+    assert not resumen['comparable']
+    assert resumen['filas_reutilizadas'] == 0
+    assert resumen['modificadas'] == 0
+
+
+@pytest.fixture
+def historial(tmp_path):
+    return HistorialAnalisis(str(tmp_path / 'historial.sqlite'))
+
+
+def test_historial_por_usuario_y_version(historial):
+    df = _declaracion()
+    huellas = huellas_filas(df)
+    resultados = {int(huellas[3]): ('NIF no válido', '')}
+    historial.guardar('ana', 'declaracion.xlsx', df.columns, 1, huellas, resultados)
+
+    cargado = historial.cargar('ana', 'declaracion.xlsx', df.columns, 1)
+    assert (cargado['huellas'] == huellas).all()
+    assert cargado['resultados'] == resultados
+
+    assert historial.cargar('bea', 'declaracion.xlsx', df.columns, 1) is None
+    assert historial.cargar('ana', 'declaracion.xlsx', df.columns, 2) is None
+    assert historial.cargar('ana', 'declaracion.xlsx', list(df.columns)[:2], 1) is None
+
+
+def test_historial_purga_analisis_antiguos(historial):
+    df = _declaracion()
+    huellas = huellas_filas(df)
+    historial.guardar('ana', 'declaracion.xlsx', df.columns, 1, huellas, {int(huellas[0]): ('x', '')})
+
+    historial.purgar(dias=1)
+    assert historial.cargar('ana', 'declaracion.xlsx', df.columns, 1) is not None
+
+    historial.purgar(dias=-1)
+    assert historial.cargar('ana', 'declaracion.xlsx', df.columns, 1) is None
+    with historial._conectar() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM errores").fetchone()[0] == 0
@@ -0,0 +1,113 @@
+import json
+import os
+import pickle
+
+import pandas as pd
+import pytest
+
+from utils.intercambio import (
+    escribir_tabla, abrir_tabla, publicar_tablas, adjuntar_tablas, rutas_tablas,
+    TablaCompartida, ErrorTabla, EXTENSION_TABLA, EXTENSION_PICKLE
+)
+
+
+def _df():
+    df = pd.DataFrame({
+        'nipd': pd.array([10, 20, 30, 40], dtype='int64'),
+        'kg': [1.5, 2.5, None, 4.0],
+        'nif': ['11111111A', None, '33333333C', '44444444D'],
+        'zona': pd.Series(['Penedès', 'Anoia', 'Penedès', 'Garraf'], dtype='category'),
+        'estado': pd.Series(['ok', 'error', 'ok', 'ok'], dtype='string').astype('category'),
+        'dia': pd.to_datetime(['2025-09-01', '2025-09-02', '2025-09-02', '2025-09-03'])
+    }, index=pd.Index([7, 3, 5, 1], name='linea'))
+    df.attrs = {'origen': 'extranet'}
+    return df
+
+
+def test_ida_y_vuelta(tmp_path):
+    df = _df()
+    tabla = escribir_tabla(df, str(tmp_path / 'tabla'))
+    assert tabla.ruta.endswith(EXTENSION_TABLA)
+    assert (tabla.filas, tabla.columnas) == (4, list(df.columns))
+
+    abierta = abrir_tabla(tabla.ruta)
+    pd.testing.assert_frame_equal(abierta, df)
+    assert abierta.attrs == {'origen': 'extranet'}
+    assert isinstance(abierta['estado'].cat.categories.dtype, pd.StringDtype)
+
+
+def test_solo_filas_pedidas(tmp_path):
+    df = _df()
+    tabla = escribir_tabla(df, str(tmp_path / 'tabla'))
+    pd.testing.assert_frame_equal(tabla.abrir(filas=[2, 0]), df.iloc[[2, 0]])
+    assert tabla.abrir(filas=[]).empty
+
+
+def test_columnas_mapeadas_de_solo_lectura(tmp_path):
+    tabla = escribir_tabla(_df(), str(tmp_path / 'tabla'))
+    abierta = abrir_tabla(tabla.ruta)
+
+    assert not abierta['nipd'].to_numpy().flags.writeable
+    with pytest.raises(ValueError, match='read-only'):
+        abierta.loc[7, 'nipd'] = 99
+
+    # Asignar columnas nuevas sí está permitido, y una copia es modificable
+    abierta['nueva'] = 1
+    copia = abierta.copy()
+    copia.loc[7, 'nipd'] = 99
+    assert copia.loc[7, 'nipd'] == 99
+    assert abrir_tabla(tabla.ruta).loc[7, 'nipd'] == 10
+
+
+def test_columnas_no_textuales_en_pickle(tmp_path):
+    df = pd.DataFrame({0: [1, 2], 'a': ['x', 'y']})
+    tabla = escribir_tabla(df, str(tmp_path / 'tabla'))
+    assert tabla.ruta.endswith(EXTENSION_PICKLE)
+    pd.testing.assert_frame_equal(tabla.abrir(), df)
+    pd.testing.assert_frame_equal(tabla.abrir(filas=[1]), df.iloc[[1]])
+
+
+def test_publicar_y_adjuntar_estructura(tmp_path):
+    df = _df()
+    valor = {'df_nipd': df, 'tablas': {'resumen': df.head(2), 'total': 3}, 'nombre': 'informe'}
+
+    publicado = publicar_tablas(valor, str(tmp_path / 'resultado'))
+    assert isinstance(publicado['df_nipd'], TablaCompartida)
+    assert publicado['tablas']['total'] == 3 and publicado['nombre'] == 'informe'
+    assert set(rutas_tablas(publicado)) == {'df_nipd', 'tablas.resumen'}
+
+    # La referencia viaja por pickle sin los datos
+    publicado = pickle.loads(pickle.dumps(publicado))
+    adjuntado = adjuntar_tablas(publicado)
+    pd.testing.assert_frame_equal(adjuntado['df_nipd'], df)
+    pd.testing.assert_frame_equal(adjuntado['tablas']['resumen'], df.head(2))
+    assert adjuntado['tablas']['total'] == 3
+
+
+def test_metadatos_en_json(tmp_path):
+    import pyarrow as pa
+    from utils.intercambio import CLAVE_METADATOS
+
+    tabla = escribir_tabla(_df(), str(tmp_path / 'tabla'))
+    esquema = pa.ipc.open_file(pa.memory_map(tabla.ruta, 'r')).schema
+    assert json.loads(esquema.metadata[CLAVE_METADATOS]) == {
+        'attrs': {'origen': 'extranet'}, 'categorias_texto': ['estado']
+    }
+
+
+def test_pickle_solo_desde_directorio_de_confianza(tmp_path):
+    df = pd.DataFrame({0: [1, 2]})
+    (tmp_path / 'propia').mkdir()
+    tabla = escribir_tabla(df, str(tmp_path / 'propia' / 'tabla'))
+    assert os.stat(tabla.ruta).st_mode & 0o777 == 0o600
+
+    with pytest.raises(ErrorTabla):
+        abrir_tabla(tabla.ruta)
+    with pytest.raises(ErrorTabla):
+        abrir_tabla(tabla.ruta, directorio=str(tmp_path / 'otro'))
+    pd.testing.assert_frame_equal(abrir_tabla(tabla.ruta, directorio=str(tmp_path)), df)
+
+    # Un pickle que otros pueden escribir no es de confianza
+    os.chmod(tabla.ruta, 0o666)
+    with pytest.raises(ErrorTabla):
+        abrir_tabla(tabla.ruta, directorio=str(tmp_path))
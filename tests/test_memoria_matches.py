@@ -0,0 +1,26 @@
+import sqlite3
+
+from utils.memoria_matches import MemoriaMatches
+
+
+def test_confirmar_solo_nipd_numericos(tmp_path):
+    memoria = MemoriaMatches(str(tmp_path / 'memoria.sqlite'))
+    guardados = memoria.confirmar([
+        ('bodega a', 'penedès', '802400022'),
+        ('Bodega B', 'Anoia', 802400023.0),
+        ('Bodega C', 'Anoia', '80240002X'),
+        ('Bodega D', 'Anoia', '1.5'),
+        ('Bodega E', 'Anoia', ''),
+        ('Bodega F', 'Anoia', None),
+    ])
+
+    assert guardados == 2
+    assert memoria.cargar() == {('BODEGA A', 'PENEDÈS'): 802400022, ('BODEGA B', 'ANOIA'): 802400023}
+
+
+def test_cargar_ignora_nipd_de_texto_guardados_antes(tmp_path):
+    ruta = str(tmp_path / 'memoria.sqlite')
+    memoria = MemoriaMatches(ruta)
+    with sqlite3.connect(ruta) as conn:
+        conn.execute("INSERT INTO resoluciones (clave, zona, nipd) VALUES ('BODEGA', 'ANOIA', 'sin nipd')")
+    assert memoria.cargar() == {}
@@ -0,0 +1,168 @@
+import io
+import zipfile
+
+import openpyxl
+import pytest
+
+from utils.parche_xlsx import parchear_hoja_activa, ErrorParcheXlsx, _Desplazamiento
+
+NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+CADENAS = ['Declaración', 'Verificador', 'Nif Viticultor', 'Total Kg:', 'V1', '1234567-8Z', '00000001Z']
+
+
+def _libro(prefijo='', cadena_calculo=True, formulas_compartidas=False):
+    """
+    Libro mínimo escrito a mano como los que exporta Excel: cadenas compartidas,
+    estilos, celdas combinadas, validaciones y (opcional) calcChain y prefijo de
+    espacio de nombres. Encabezado en la fila 7 y 10 filas de datos (8 a 17).
+    """
+    x = f'{prefijo}:' if prefijo else ''
+    xmlns = f'xmlns{":" + prefijo if prefijo else ""}="{NS}"'
+
+    filas = [
+        f'<{x}row r="1"><{x}c r="A1" t="s"><{x}v>0</{x}v></{x}c></{x}row>',
+        f'<{x}row r="7"><{x}c r="A7" t="s"><{x}v>1</{x}v></{x}c><{x}c r="B7" t="s"><{x}v>2</{x}v></{x}c>'
+        f'<{x}c r="C7" t="s"><{x}v>3</{x}v></{x}c></{x}row>'
+    ]
+    for i in range(10):
+        fila = 8 + i
+        kg = 0 if i in (1, 4) else 100 + i
+        if formulas_compartidas:
+            formula = f'<{x}f t="shared" ref="D8:D17" si="0">C8*2</{x}f>' if i == 0 else f'<{x}f t="shared" si="0"/>'
+        else:
+            formula = f'<{x}f>C{fila}*2</{x}f>'
+        filas.append(
+            f'<{x}row r="{fila}" spans="1:4"><{x}c r="A{fila}" t="s"><{x}v>4</{x}v></{x}c>'
+            f'<{x}c r="B{fila}" s="1" t="s"><{x}v>{5 if i % 3 == 0 else 6}</{x}v></{x}c>'
+            f'<{x}c r="C{fila}"><{x}v>{kg}</{x}v></{x}c>'
+            f'<{x}c r="D{fila}">{formula}<{x}v>{kg * 2}</{x}v></{x}c></{x}row>'
+        )
+    hoja = (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<{x}worksheet {xmlns}>'
+        f'<{x}dimension ref="A1:D17"/><{x}sheetData>{"".join(filas)}</{x}sheetData>'
+        f'<{x}mergeCells count="2"><{x}mergeCell ref="A1:C1"/><{x}mergeCell ref="A9:A9"/></{x}mergeCells>'
+        f'<{x}dataValidations count="1"><{x}dataValidation type="whole" sqref="C8:C17 C9"/></{x}dataValidations>'
+        f'</{x}worksheet>'
+    )
+
+    tipos = (
+        '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        + ('<Override PartName="/xl/calcChain.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.calcChain+xml"/>'
+           if cadena_calculo else '')
+        + '</Types>'
+    )
+    relaciones = (
+        '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    )
+    libro = (
+        f'<?xml version="1.0" encoding="UTF-8"?><workbook xmlns="{NS}" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Datos" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    )
+    relaciones_libro = (
+        '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+        '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        + ('<Relationship Id="rId4" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/calcChain" Target="calcChain.xml"/>'
+           if cadena_calculo else '')
+        + '</Relationships>'
+    )
+    estilos = (
+        f'<?xml version="1.0" encoding="UTF-8"?><styleSheet xmlns="{NS}">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border/></borders><cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="2"><xf/><xf fontId="1" applyFont="1"/></cellXfs></styleSheet>'
+    )
+    cadenas = (
+        f'<?xml version="1.0" encoding="UTF-8"?><sst xmlns="{NS}" count="{len(CADENAS)}" uniqueCount="{len(CADENAS)}">'
+        + ''.join(f'<si><t>{cadena}</t></si>' for cadena in CADENAS) + '</sst>'
+    )
+
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('[Content_Types].xml', tipos)
+        z.writestr('_rels/.rels', relaciones)
+        z.writestr('xl/workbook.xml', libro)
+        z.writestr('xl/_rels/workbook.xml.rels', relaciones_libro)
+        z.writestr('xl/worksheets/sheet1.xml', hoja)
+        z.writestr('xl/styles.xml', estilos)
+        z.writestr('xl/sharedStrings.xml', cadenas)
+        if cadena_calculo:
+            z.writestr('xl/calcChain.xml', f'<?xml version="1.0"?><calcChain xmlns="{NS}"><c r="D8" i="1"/></calcChain>')
+    return salida.getvalue()
+
+
+def _hoja(contenido):
+    return openpyxl.load_workbook(io.BytesIO(contenido)).active
+
+
+@pytest.mark.parametrize('prefijo', ['', 'x'])
+def test_corrige_celdas_y_elimina_filas(prefijo):
+    parcheado = parchear_hoja_activa(
+        _libro(prefijo), {(8, 2): '12345678Z', (11, 2): 'A&B<1>'}, [9, 12]
+    )
+    ws = _hoja(parcheado)
+
+    datos = [[celda.value for celda in fila] for fila in ws.iter_rows(min_row=8, max_col=3)]
+    kg_esperados = [100] + [100 + i for i in range(2, 10) if i != 4]
+    assert [fila[2] for fila in datos] == kg_esperados
+    assert ws.max_row == 15
+    # Las correcciones siguen en su fila tras subir las siguientes (la 11 pasa a la 10)
+    assert ws['B8'].value == '12345678Z'
+    assert ws['B10'].value == 'A&B<1>'
+    assert ws['B9'].value == '00000001Z'
+    # El texto corregido conserva el estilo de la celda
+    assert ws['B8'].font.b
+
+
+@pytest.mark.parametrize('prefijo', ['', 'x'])
+def test_desplaza_rangos_y_quita_los_de_filas_eliminadas(prefijo):
+    ws = _hoja(parchear_hoja_activa(_libro(prefijo), {}, [9, 12]))
+
+    assert {str(rango) for rango in ws.merged_cells.ranges} == {'A1:C1'}
+    assert [str(validacion.sqref) for validacion in ws.data_validations.dataValidation] == ['C8:C15']
+
+
+def test_elimina_la_cadena_de_calculo_solo_al_quitar_filas():
+    sin_cambios_de_filas = zipfile.ZipFile(io.BytesIO(parchear_hoja_activa(_libro(), {(8, 2): 'X'}, [])))
+    assert 'xl/calcChain.xml' in sin_cambios_de_filas.namelist()
+
+    con_filas = zipfile.ZipFile(io.BytesIO(parchear_hoja_activa(_libro(), {}, [9])))
+    assert 'xl/calcChain.xml' not in con_filas.namelist()
+    assert b'calcChain' not in con_filas.read('[Content_Types].xml')
+    assert b'calcChain' not in con_filas.read('xl/_rels/workbook.xml.rels')
+
+
+def test_formulas_compartidas_al_quitar_filas_lanzan_error():
+    with pytest.raises(ErrorParcheXlsx):
+        parchear_hoja_activa(_libro(formulas_compartidas=True), {}, [9])
+    # Sin eliminar filas no hace falta reescribirlas
+    ws = _hoja(parchear_hoja_activa(_libro(formulas_compartidas=True), {(8, 2): 'X'}, []))
+    assert ws['B8'].value == 'X'
+
+
+def test_archivo_no_valido():
+    with pytest.raises(ErrorParcheXlsx):
+        parchear_hoja_activa(b'no es un xlsx', {}, [])
+
+
+@pytest.mark.parametrize('rango, esperado', [
+    ('A8', 'A8'),
+    ('A9', None),
+    ('A10:B20', 'A9:B18'),
+    ('A9:A9', None),
+    ('$A$8:$D$17', '$A$8:$D$15'),
+    ('A:C', 'A:C'),
+])
+def test_desplazamiento_de_rangos(rango, esperado):
+    assert _Desplazamiento([9, 12]).rango(rango) == esperado
@@ -0,0 +1,47 @@
+import pytest
+
+import utils.pipeline_comprobaciones as pipeline
+from benchmarks.datos_sinteticos import generar_datos
+from utils.carga import cargar_archivos_comprobaciones
+
+HOJAS = ('df_nipd', 'df_nif', 'df_pesadas', 'df_consistencia')
+
+
+@pytest.fixture(scope='module')
+def enriquecido():
+    """Datos sintéticos cargados y enriquecidos con NIPD (Paso 1), en el proceso actual"""
+    datos_sinteticos = generar_datos(3000)
+    datos = cargar_archivos_comprobaciones(
+        datos_sinteticos['extranet'], datos_sinteticos['bbdd'], datos_sinteticos['ervc'], max_workers=1
+    )
+    df_enriquecido, _ = pipeline.enriquecer_declaracion(datos)
+    return df_enriquecido, datos['ervc']
+
+
+@pytest.fixture
+def sin_minimo_particionado(monkeypatch):
+    monkeypatch.setattr(pipeline, 'MIN_FILAS_PARTICIONADO', 0)
+
+
+def _reporte(enriquecido, **opciones):
+    df_enriquecido, df_ervc = enriquecido
+    return pipeline.generar_reporte(df_enriquecido.copy(), df_ervc, opciones)
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_particiones_equivalen_a_un_solo_proceso(enriquecido, sin_minimo_particionado, max_workers):
+    referencia = _reporte(enriquecido, particiones=1)
+    particionado = _reporte(enriquecido, particiones=4, max_workers=max_workers)
+
+    assert len(referencia['df_pesadas'])
+    for hoja in HOJAS:
+        assert referencia[hoja].equals(particionado[hoja]), hoja
+
+
+def test_ventana_de_dias_con_particiones(enriquecido, sin_minimo_particionado):
+    reglas = {'ventana_dias': 2}
+    referencia = _reporte(enriquecido, particiones=1, reglas=reglas)
+    particionado = _reporte(enriquecido, particiones=3, max_workers=1, reglas=reglas)
+
+    for hoja in HOJAS:
+        assert referencia[hoja].equals(particionado[hoja]), hoja
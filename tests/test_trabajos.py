@@ -0,0 +1,188 @@
+import asyncio
+import itertools
+import os
+import time
+
+import pytest
+
+import utils.trabajos as trabajos
+from utils.trabajos import (
+    ServicioTrabajos, ErrorTrabajos, ESTADO_EN_COLA, ESTADO_EN_CURSO, ESTADO_TERMINADO, ESTADO_ERROR
+)
+
+_contador = itertools.count()
+
+
+@pytest.fixture
+def entrada(tmp_path, monkeypatch):
+    """Crea un .arrow cuya memoria estimada (sin procesos hijos) es 'mb' (con un factor alto, archivos pequeños)"""
+    monkeypatch.setitem(trabajos.FACTOR_MEMORIA_ENTRADA, '.arrow', trabajos.MB)
+
+    directorio = tmp_path / 'trabajos' / 'entradas'
+    directorio.mkdir(parents=True, exist_ok=True)
+
+    def crear(mb):
+        ruta = directorio / f'entrada_{next(_contador)}.arrow'
+        tamano = (mb - trabajos.MEMORIA_BASE_TRABAJO_MB) / trabajos.FACTOR_MEMORIA_ENTRADA['.arrow']
+        ruta.write_bytes(b'\0' * int(tamano * trabajos.MB))
+        return str(ruta)
+    return crear
+
+
+@pytest.fixture(autouse=True)
+def memoria_libre_holgada(monkeypatch):
+    monkeypatch.setattr(trabajos, 'memoria_libre_mb', lambda: 1_000_000)
+
+
+def _servicio(tmp_path, **opciones):
+    """
+    Servicio sin pool real: cada trabajo queda en curso hasta que se llama a
+    terminar(id), que lo marca como terminado y vuelve a despachar
+    """
+    servicio = ServicioTrabajos(directorio=str(tmp_path / 'trabajos'), **opciones)
+    servicio._executor = object()
+    eventos = {}
+
+    async def ejecutar(id_trabajo):
+        await eventos.setdefault(id_trabajo, asyncio.Event()).wait()
+        servicio.trabajos[id_trabajo]['estado'] = ESTADO_TERMINADO
+        servicio._despachar()
+
+    async def terminar(*ids):
+        for id_trabajo in ids:
+            eventos.setdefault(id_trabajo, asyncio.Event()).set()
+        await asyncio.sleep(0.01)
+
+    servicio._ejecutar = ejecutar
+    return servicio, terminar
+
+
+def _en_curso(servicio):
+    return [t['usuario'] for t in servicio.trabajos.values() if t['estado'] == ESTADO_EN_CURSO]
+
+
+def test_reparto_por_turnos_entre_usuarios(tmp_path, entrada):
+    async def escenario():
+        servicio, terminar = _servicio(tmp_path, max_concurrentes=2, memoria_mb=10_000)
+        ana = [servicio.enviar('verificador', [entrada(300)], usuario='ana') for _ in range(4)]
+        bea = servicio.enviar('verificador', [entrada(300)], usuario='bea')
+        carlos = servicio.enviar('verificador', [entrada(300)], usuario='carlos')
+
+        assert _en_curso(servicio) == ['ana', 'ana']
+        # Pasan antes los usuarios sin trabajos en curso, aunque hayan llegado después
+        orden = servicio._orden_despacho()
+        assert orden == [bea, carlos, ana[2], ana[3]]
+        assert servicio.estado(carlos)['posicion'] == 2
+        assert servicio.estado(carlos)['en_cola'] == 4
+
+        await terminar(ana[0])
+        assert sorted(_en_curso(servicio)) == ['ana', 'bea']
+        # A igualdad de trabajos en curso pasa el que lleva más esperando (ana antes que carlos)
+        await terminar(ana[1])
+        assert sorted(_en_curso(servicio)) == ['ana', 'bea']
+        await terminar(bea)
+        assert sorted(_en_curso(servicio)) == ['ana', 'carlos']
+
+        assert [t['id'] for t in servicio.listar('carlos')] == [carlos]
+        assert len(servicio.listar()) == 6
+        await terminar(*servicio.trabajos)
+
+    asyncio.run(escenario())
+
+
+def test_rechaza_trabajos_que_no_caben_nunca(tmp_path, entrada):
+    servicio, _ = _servicio(tmp_path, memoria_mb=1000)
+    servicio._executor = None  # sin despachar: solo la admisión
+    with pytest.raises(ErrorTrabajos, match='VERIFICACION_MEMORIA_TRABAJOS_MB'):
+        servicio.enviar('verificador', [entrada(1500)], usuario='ana')
+    with pytest.raises(ErrorTrabajos, match='No existen'):
+        servicio.enviar('verificador', [str(tmp_path / 'trabajos' / 'entradas' / 'no_existe.xlsx')])
+
+
+def test_espera_memoria_y_adelantamiento_limitado(tmp_path, entrada, monkeypatch):
+    async def escenario(segundos_adelantamiento):
+        monkeypatch.setattr(trabajos, 'SEGUNDOS_MAX_ADELANTAMIENTO', segundos_adelantamiento)
+        servicio, terminar = _servicio(tmp_path, max_concurrentes=3, memoria_mb=1000)
+        primero = servicio.enviar('verificador', [entrada(600)], usuario='ana')
+        grande = servicio.enviar('verificador', [entrada(500)], usuario='bea')
+        pequeno = servicio.enviar('verificador', [entrada(250)], usuario='carlos')
+
+        assert servicio.trabajos[grande]['estado'] == ESTADO_EN_COLA
+        assert 'esperando memoria' in servicio.trabajos[grande]['espera']
+        estado_pequeno = servicio.trabajos[pequeno]['estado']
+
+        await terminar(primero)
+        assert servicio.trabajos[grande]['estado'] != ESTADO_EN_COLA
+        await terminar(*servicio.trabajos)
+        return estado_pequeno
+
+    # El pequeño adelanta al que espera memoria mientras no se pase el límite
+    assert asyncio.run(escenario(120)) == ESTADO_EN_CURSO
+    assert asyncio.run(escenario(-1)) == ESTADO_EN_COLA
+
+
+def test_procesos_hijos_acotados_y_presupuestados(tmp_path, entrada):
+    servicio, _ = _servicio(tmp_path, max_concurrentes=2, memoria_mb=100_000, procesos_por_trabajo=4)
+    servicio._executor = None
+    ruta = entrada(500)
+    datos_mb = 500 - trabajos.MEMORIA_BASE_TRABAJO_MB
+
+    reporte = servicio.trabajos[servicio.enviar('reporte', [ruta], {'max_workers': 16}, usuario='ana')]
+    assert reporte['procesos'] == 4
+    assert reporte['opciones']['max_workers'] == 4
+    assert reporte['opciones']['usuario'] == 'ana'
+    assert reporte['memoria_mb'] == pytest.approx(
+        500 + 4 * trabajos.MEMORIA_BASE_PROCESO_HIJO_MB + datos_mb * trabajos.FACTOR_MEMORIA_PROCESOS_HIJOS, abs=0.5
+    )
+
+    uno = servicio.trabajos[servicio.enviar('comprobaciones', [ruta], {'max_workers': 1, 'particiones': 8})]
+    assert (uno['procesos'], uno['opciones']['max_workers'], uno['opciones']['particiones']) == (1, 1, 1)
+    assert uno['memoria_mb'] == pytest.approx(500, abs=0.5)
+
+    verificador = servicio.trabajos[servicio.enviar('verificador', [ruta])]
+    assert verificador['procesos'] == 1
+    assert 'max_workers' not in verificador['opciones']
+
+
+def test_rutas_token_y_propietario(tmp_path, entrada):
+    servicio, _ = _servicio(tmp_path, token='secreto')
+    servicio._executor = None
+    fuera = tmp_path / 'fuera.pkl'
+    fuera.write_bytes(b'')
+    with pytest.raises(ErrorTrabajos, match='fuera del directorio'):
+        servicio.enviar('reporte', [str(fuera)], usuario='ana')
+    with pytest.raises(ErrorTrabajos, match='fuera del directorio'):
+        servicio.enviar('reporte', [str(tmp_path / 'trabajos' / 'entradas' / '..' / '..' / 'fuera.pkl')], usuario='ana')
+
+    peticion = {'accion': 'enviar', 'tipo': 'verificador', 'rutas': [entrada(300)], 'usuario': 'ana'}
+    assert 'en_curso' in servicio._responder({'accion': 'ping'})
+    with pytest.raises(ErrorTrabajos, match='Token'):
+        servicio._responder(peticion)
+    with pytest.raises(ErrorTrabajos, match='Token'):
+        servicio._responder({**peticion, 'token': 'otro'})
+    id_trabajo = servicio._responder({**peticion, 'token': 'secreto'})['id']
+
+    # El estado solo se le da a quien envió el trabajo
+    consulta = {'accion': 'estado', 'id': id_trabajo, 'token': 'secreto'}
+    assert servicio._responder({**consulta, 'usuario': 'ana'})['trabajo']['usuario'] == 'ana'
+    for usuario in ('bea', None):
+        with pytest.raises(ErrorTrabajos, match='desconocido'):
+            servicio._responder({**consulta, 'usuario': usuario})
+
+
+def test_purga_trabajos_y_archivos_antiguos(tmp_path, entrada):
+    servicio, _ = _servicio(tmp_path)
+    servicio._executor = None
+    antiguo = servicio.enviar('verificador', [entrada(300)], usuario='ana')
+    reciente = servicio.enviar('verificador', [entrada(300)], usuario='ana')
+    pendiente = servicio.enviar('verificador', [entrada(300)], usuario='ana')
+    servicio.trabajos[antiguo].update(estado=ESTADO_ERROR, fin='2000-01-01T00:00:00')
+    servicio.trabajos[reciente].update(estado=ESTADO_TERMINADO, fin=trabajos._ahora())
+
+    # Todas las entradas tienen más de 'horas': solo se conserva la del trabajo en cola
+    hace_dos_horas = time.time() - 2 * 3600
+    for trabajo in servicio.trabajos.values():
+        os.utime(trabajo['rutas'][0], (hace_dos_horas, hace_dos_horas))
+    servicio.purgar(horas=1)
+    assert [t['id'] for t in servicio.listar()] == [reciente, pendiente]
+    assert [os.path.exists(servicio.trabajos[i]['rutas'][0]) for i in (reciente, pendiente)] == [False, True]
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+# Columnas del cubo de agregación (una fila por NIPD, NIF y día)
+COLUMNAS_CUBO = ['nipd', 'nif', 'fecha', 'kg', 'pesadas', 'primera_fila']
+
+def construir_cubo(df, col_nipd, col_nif, col_kg, col_fecha='fecha_pesada'):
+    """
+    Agrega un DataFrame preparado a granularidad (NIPD, NIF, día) en una sola pasada.
+    Espera las claves ya canónicas (NIPD Int64, NIF categórico) y no modifica
+    el DataFrame de entrada. Los NIPD nulos se conservan como grupo propio.
+
+    - kg: suma de kg del día
+    - pesadas: número de pesadas (filas) del día
+    - primera_fila: posición de la primera fila del grupo, para poder
+      reproducir 'first' al consolidar por NIF
+    """
+    claves = pd.DataFrame({
+        'nipd': df[col_nipd].values,
+        'nif': df[col_nif].values,
+        'fecha': df[col_fecha].values,
+        'kg': df[col_kg].values,
+        'fila': np.arange(len(df))
+    })
+
+    cubo = claves.groupby(['nipd', 'nif', 'fecha'], sort=False, observed=True, dropna=False).agg(
+        kg=('kg', 'sum'),
+        pesadas=('fila', 'size'),
+        primera_fila=('fila', 'min')
+    ).reset_index()
+
+    return cubo[COLUMNAS_CUBO]
+
+def consolidar_por_nipd(cubo):
+    """Consolida el cubo por NIPD: kg totales y días distintos con pesadas"""
+    return cubo.groupby('nipd', dropna=False).agg(
+        kg=('kg', 'sum'),
+        dias=('fecha', 'nunique')
+    ).reset_index()
+
+def consolidar_por_nif(cubo):
+    """Consolida el cubo por NIF: kg totales, días distintos y NIPD de su primera pesada"""
+    return cubo.sort_values('primera_fila').groupby('nif', observed=True, dropna=False).agg(
+        kg=('kg', 'sum'),
+        dias=('fecha', 'nunique'),
+        nipd=('nipd', 'first')
+    ).reset_index()
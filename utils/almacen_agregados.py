@@ -0,0 +1,252 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.agregacion import construir_cubo, COLUMNAS_CUBO
+
+# Ruta por defecto del almacén de agregados (configurable por variable de entorno)
+RUTA_ALMACEN_POR_DEFECTO = os.environ.get(
+    'VERIFICACION_ALMACEN_AGREGADOS',
+    os.path.join(os.path.expanduser('~'), '.verificacion', 'agregados.sqlite')
+)
+
+# Espera máxima por el bloqueo del almacén mientras otra ejecución actualiza sus particiones
+SEGUNDOS_ESPERA_ALMACEN = 120
+
+def hash_por_fecha(df, columnas, col_fecha='fecha_pesada'):
+    """
+    Huella del contenido de cada día: suma de los hashes de sus filas (no depende
+    del orden de las filas en la exportación) más el número de filas.
+    Devuelve {fecha: huella}.
+    """
+    hashes_filas = pd.util.hash_pandas_object(df[columnas], index=False).values
+    por_fecha = pd.DataFrame({'fecha': df[col_fecha].values, 'hash': hashes_filas}).groupby('fecha')['hash']
+    sumas = por_fecha.agg(lambda h: int(np.add.reduce(h.values, dtype=np.uint64)))
+    conteos = por_fecha.size()
+    return {fecha: f"{sumas[fecha]:016x}-{conteos[fecha]}" for fecha in sumas.index}
+
+class AlmacenAgregados:
+    """
+    Almacén persistente (SQLite) de cubos (NIPD, NIF, día) por ámbito (usuario),
+    campaña y fuente, particionado por fecha. Cada partición guarda la huella del
+    contenido del día para saber si hay que recalcularla.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or RUTA_ALMACEN_POR_DEFECTO
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        with self._conectar() as conn:
+            # Almacenes anteriores sin ámbito: son una caché, se empiezan de cero
+            columnas = [fila[1] for fila in conn.execute("PRAGMA table_info(particiones)")]
+            if columnas and 'ambito' not in columnas:
+                conn.execute("DROP TABLE particiones")
+                conn.execute("DROP TABLE IF EXISTS cubo")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS particiones (
+                    ambito TEXT NOT NULL,
+                    campana TEXT NOT NULL,
+                    fuente TEXT NOT NULL,
+                    fecha TEXT NOT NULL,
+                    huella TEXT NOT NULL,
+                    actualizado TEXT,
+                    PRIMARY KEY (ambito, campana, fuente, fecha)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cubo (
+                    ambito TEXT NOT NULL,
+                    campana TEXT NOT NULL,
+                    fuente TEXT NOT NULL,
+                    fecha TEXT NOT NULL,
+                    nipd INTEGER,
+                    nif TEXT,
+                    kg REAL,
+                    pesadas INTEGER,
+                    primera_fila INTEGER
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_cubo_particion ON cubo (ambito, campana, fuente, fecha)
+            """)
+
+    @contextmanager
+    def _conectar(self):
+        """Abre una conexión, confirma la transacción y la cierra al salir"""
+        conn = sqlite3.connect(self.ruta, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaccion(self):
+        """
+        Conexión en una transacción BEGIN IMMEDIATE: hasta salir, ninguna otra
+        ejecución puede escribir en el almacén (comparar, cargar y sustituir
+        particiones dentro de ella es atómico)
+        """
+        conn = sqlite3.connect(self.ruta, timeout=SEGUNDOS_ESPERA_ALMACEN, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _en(self, conn):
+        """La conexión de una transacción en curso o una nueva"""
+        if conn is not None:
+            yield conn
+        else:
+            with self._conectar() as nueva:
+                yield nueva
+
+    def huellas(self, ambito, campana, fuente, conn=None):
+        """Devuelve {fecha: huella} de las particiones guardadas"""
+        with self._en(conn) as conn:
+            filas = conn.execute(
+                "SELECT fecha, huella FROM particiones WHERE ambito = ? AND campana = ? AND fuente = ?",
+                (ambito, campana, fuente)
+            ).fetchall()
+        return {date.fromisoformat(fecha): huella for fecha, huella in filas}
+
+    def guardar_particiones(self, ambito, campana, fuente, cubo, huellas, conn=None):
+        """Sustituye las particiones de las fechas de 'huellas' por las filas del cubo"""
+        if not huellas:
+            return
+
+        ahora = datetime.now().isoformat(timespec='seconds')
+        fechas = [fecha.isoformat() for fecha in huellas]
+        filas_cubo = [
+            (
+                ambito, campana, fuente, fila.fecha.isoformat(),
+                None if pd.isna(fila.nipd) else int(fila.nipd),
+                None if pd.isna(fila.nif) else str(fila.nif),
+                float(fila.kg), int(fila.pesadas), int(fila.primera_fila)
+            )
+            for fila in cubo.itertuples(index=False)
+        ]
+
+        with self._en(conn) as conn:
+            conn.executemany(
+                "DELETE FROM cubo WHERE ambito = ? AND campana = ? AND fuente = ? AND fecha = ?",
+                [(ambito, campana, fuente, fecha) for fecha in fechas]
+            )
+            conn.executemany("""
+                INSERT INTO cubo (ambito, campana, fuente, fecha, nipd, nif, kg, pesadas, primera_fila)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, filas_cubo)
+            conn.executemany("""
+                INSERT INTO particiones (ambito, campana, fuente, fecha, huella, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ambito, campana, fuente, fecha) DO UPDATE SET
+                    huella = excluded.huella,
+                    actualizado = excluded.actualizado
+            """, [(ambito, campana, fuente, fecha.isoformat(), huella, ahora) for fecha, huella in huellas.items()])
+
+    def cargar_particiones(self, ambito, campana, fuente, fechas, conn=None):
+        """Devuelve el cubo guardado de las fechas indicadas"""
+        fechas = [fecha.isoformat() for fecha in fechas]
+        if not fechas:
+            return pd.DataFrame(columns=COLUMNAS_CUBO)
+
+        with self._en(conn) as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS fechas_consulta (fecha TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM fechas_consulta")
+            conn.executemany("INSERT INTO fechas_consulta VALUES (?)", [(f,) for f in fechas])
+            cubo = pd.read_sql_query("""
+                SELECT c.nipd, c.nif, c.fecha, c.kg, c.pesadas, c.primera_fila
+                FROM cubo c JOIN fechas_consulta f ON c.fecha = f.fecha
+                WHERE c.ambito = ? AND c.campana = ? AND c.fuente = ?
+            """, conn, params=(ambito, campana, fuente))
+
+        cubo['nipd'] = cubo['nipd'].astype('Int64')
+        cubo['nif'] = cubo['nif'].astype('category')
+        cubo['fecha'] = cubo['fecha'].map(date.fromisoformat)
+        return cubo[COLUMNAS_CUBO]
+
+def primeras_filas(df, col_nipd, col_nif, mascara, col_fecha='fecha_pesada'):
+    """
+    Posición en df de la primera fila de cada grupo (NIPD, NIF, día) entre las
+    filas marcadas en 'mascara'. Devuelve un DataFrame con nipd, nif, fecha y
+    primera_fila, en el mismo formato que construir_cubo.
+    """
+    posiciones = np.flatnonzero(mascara)
+    claves = pd.DataFrame({
+        'nipd': df[col_nipd].values[posiciones],
+        'nif': df[col_nif].values[posiciones],
+        'fecha': df[col_fecha].values[posiciones]
+    })
+    primeras = ~claves.duplicated().values
+    return claves[primeras].assign(primera_fila=posiciones[primeras]).reset_index(drop=True)
+
+def actualizar_cubo_incremental(almacen, ambito, campana, fuente, df_prep, col_nipd, col_nif, col_kg):
+    """
+    Devuelve el cubo (NIPD, NIF, día) de df_prep reutilizando las particiones
+    guardadas del ámbito (usuario) cuyos días no han cambiado. Solo se agregan
+    los días nuevos o con huella distinta, que se guardan en el almacén.
+    Comparar huellas, sustituir y cargar particiones van en una sola transacción:
+    otra ejecución a la vez espera y no mezcla sus particiones con estas.
+
+    'primera_fila' es siempre la posición en df_prep, como en construir_cubo:
+    de los días reutilizados solo se busca la primera fila de cada grupo (sin
+    volver a agregar kg ni pesadas), así que el cubo es idéntico al de
+    construir_cubo sobre todo df_prep.
+
+    Devuelve (cubo, resumen) con el número de días nuevos, modificados y reutilizados.
+    """
+    huellas_actuales = hash_por_fecha(df_prep, [col_nipd, col_nif, col_kg])
+    with almacen.transaccion() as conn:
+        huellas_guardadas = almacen.huellas(ambito, campana, fuente, conn)
+
+        nuevas = [f for f in huellas_actuales if f not in huellas_guardadas]
+        modificadas = [f for f in huellas_actuales if f in huellas_guardadas and huellas_guardadas[f] != huellas_actuales[f]]
+        reutilizadas = [f for f in huellas_actuales if huellas_guardadas.get(f) == huellas_actuales[f]]
+        a_calcular = set(nuevas) | set(modificadas)
+
+        # Agregar solo las filas de los días nuevos o modificados
+        mascara_calcular = df_prep['fecha_pesada'].isin(a_calcular).values
+        cubo_nuevo = construir_cubo(df_prep[mascara_calcular], col_nipd, col_nif, col_kg)
+        cubo_nuevo['primera_fila'] = np.flatnonzero(mascara_calcular)[cubo_nuevo['primera_fila'].values]
+        almacen.guardar_particiones(
+            ambito, campana, fuente, cubo_nuevo, {f: huellas_actuales[f] for f in a_calcular}, conn
+        )
+
+        # Días reutilizados: kg y pesadas del almacén, primera fila del archivo actual
+        cubo_reutilizado = almacen.cargar_particiones(ambito, campana, fuente, reutilizadas, conn)
+
+    if len(cubo_reutilizado):
+        cubo_reutilizado['nif'] = cubo_reutilizado['nif'].astype(object)
+        primeras = primeras_filas(df_prep, col_nipd, col_nif, ~mascara_calcular)
+        primeras['nif'] = primeras['nif'].astype(object)
+        cubo_reutilizado = cubo_reutilizado.drop(columns='primera_fila').merge(
+            primeras, on=['nipd', 'nif', 'fecha'], how='left', validate='one_to_one'
+        )
+
+    # Sin días reutilizados el cubo guardado viene vacío y sin tipos: no se concatena
+    partes = [parte for parte in (cubo_reutilizado, cubo_nuevo) if len(parte)] or [cubo_nuevo]
+    cubo = pd.concat(partes, ignore_index=True)
+    cubo['nif'] = cubo['nif'].astype('category')
+    cubo['nipd'] = cubo['nipd'].astype('Int64')
+    # Mismo orden que construir_cubo: grupos por orden de aparición en df_prep
+    cubo = cubo.sort_values('primera_fila', kind='stable').reset_index(drop=True)
+
+    resumen = {
+        'nuevas': len(nuevas),
+        'modificadas': len(modificadas),
+        'reutilizadas': len(reutilizadas)
+    }
+    return cubo[COLUMNAS_CUBO], resumen
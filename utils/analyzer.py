@@ -5,16 +5,73 @@ from datetime import datetime
 import numpy as np
 from io import BytesIO
 import os
+from utils.memoria_sesion import EntradaSesion
+from utils.carga import resolver_columnas, CATEGORICAS_EXTRANET
+from utils.tipos import compactar_tipos, informe_memoria
+from utils.historial_analisis import huellas_filas, comparar_analisis
+from utils.parche_xlsx import parchear_hoja_activa, ErrorParcheXlsx
+
+# Versión de las reglas de _validar_fila_original: subirla al cambiarlas para que
+# el historial de análisis no reutilice resultados validados con las anteriores
+VERSION_REGLAS_VALIDACION = 1
 
 class VerificadorAnalyzer:
-    def __init__(self):
+    def __init__(self, historial=None, usuario=None):
+        """
+        historial: HistorialAnalisis opcional; con él, al volver a analizar un
+        archivo con el mismo nombre solo se validan las filas nuevas o modificadas
+        usuario: clave del usuario con la que se guarda su historial
+        """
+        self.historial = historial
+        self.usuario = usuario or 'anonimo'
+        self.diferencias_analisis = None
+        self._marcos = {}
+        self._gestor_memoria = None
+        self._id_sesion = None
         self.df = None
         self.df_original = None
         self.errores_originales = []
         self.errores_post_correccion = []
         self.archivo_original_path = None
-        self.workbook_original = None
         self.archivo_temporal = None
+        self.informe_memoria = None
+    
+    def vincular_memoria(self, gestor, id_sesion):
+        """
+        Guarda df y df_original en el gestor de memoria de sesiones, que puede
+        volcarlos a disco y recargarlos al leerlos
+        """
+        self._gestor_memoria = gestor
+        self._id_sesion = id_sesion
+        for nombre, valor in list(self._marcos.items()):
+            self._guardar_marco(nombre, valor)
+    
+    def _guardar_marco(self, nombre, valor):
+        if isinstance(valor, EntradaSesion):
+            valor = valor.valor
+        if self._gestor_memoria is not None and isinstance(valor, pd.DataFrame):
+            valor = self._gestor_memoria.guardar(self._id_sesion, f"verificador/{nombre}", valor)
+        self._marcos[nombre] = valor
+    
+    def _leer_marco(self, nombre):
+        valor = self._marcos.get(nombre)
+        return valor.valor if isinstance(valor, EntradaSesion) else valor
+    
+    @property
+    def df(self):
+        return self._leer_marco('df')
+    
+    @df.setter
+    def df(self, valor):
+        self._guardar_marco('df', valor)
+    
+    @property
+    def df_original(self):
+        return self._leer_marco('df_original')
+    
+    @df_original.setter
+    def df_original(self, valor):
+        self._guardar_marco('df_original', valor)
         
     def corregir_nif(self, nif):
         """
@@ -66,6 +123,40 @@ class VerificadorAnalyzer:
         else:
             return False, f"Formato inválido: {nif_str}"
     
+    def _validar_fila_original(self, row, col_kg, col_nif):
+        """
+        Errores de una fila del archivo original (sin corregir).
+        Devuelve (errores, correcciones_posibles) como texto, o None si la fila es válida.
+        """
+        fila_errores = []
+        correcciones_posibles = []
+        
+        # Verificar valores nulos o ceros en todas las columnas
+        for col in self.df.columns:
+            valor = row[col]
+            if pd.isna(valor) or valor == 0 or valor == "":
+                if col == col_kg and valor == 0:
+                    fila_errores.append(f"Campo '{col}' = 0 (se eliminará)")
+                else:
+                    fila_errores.append(f"Campo '{col}' vacío/nulo/cero")
+        
+        # Validar NIF y verificar si es corregible
+        if col_nif and col_nif in row:
+            es_valido, mensaje = self.validar_nif(row[col_nif])
+            if not es_valido:
+                # Verificar si se puede corregir
+                nif_corregido, es_corregible, detalle_correccion = self.corregir_nif(row[col_nif])
+                if es_corregible:
+                    fila_errores.append(f"NIF: {mensaje} - CORREGIBLE")
+                    correcciones_posibles.append(f"NIF: {detalle_correccion}")
+                else:
+                    fila_errores.append(f"NIF: {mensaje} - NO CORREGIBLE")
+                    correcciones_posibles.append(f"NIF: {detalle_correccion}")
+        
+        if not fila_errores:
+            return None
+        return '; '.join(fila_errores), '; '.join(correcciones_posibles) if correcciones_posibles else 'Ninguna'
+    
     def analizar_errores_originales(self, archivo_bytes, nombre_archivo):
         """
         Analiza el archivo original sin hacer correcciones
@@ -81,11 +172,15 @@ class VerificadorAnalyzer:
             self.archivo_temporal = temp_path
             self.archivo_original_path = temp_path
             
-            # Cargar el workbook original para preservar formato
-            self.workbook_original = openpyxl.load_workbook(temp_path)
-            
             # Leer el archivo saltando las primeras 6 filas y usando la fila 7 como encabezado
-            self.df_original = pd.read_excel(temp_path, skiprows=6, header=0)
+            df_leido = pd.read_excel(temp_path, skiprows=6, header=0)
+            
+            # Tipos compactos: enteros reducidos y verificador/razón social/zona como categóricos
+            self.df_original = compactar_tipos(
+                df_leido, categoricas=resolver_columnas(df_leido.columns, CATEGORICAS_EXTRANET)
+            )
+            self.informe_memoria = informe_memoria(df_leido, self.df_original)
+            del df_leido
             self.df = self.df_original.copy()
             
             print(f"✅ Archivo cargado correctamente")
@@ -113,45 +208,58 @@ class VerificadorAnalyzer:
             
             # Limpiar la lista de errores originales
             self.errores_originales = []
+            self.diferencias_analisis = None
             
-            # Analizar cada fila SIN hacer correcciones
-            for index, row in self.df.iterrows():
-                fila_errores = []
-                correcciones_posibles = []
-                
-                # Verificar valores nulos o ceros en todas las columnas
-                for col in self.df.columns:
-                    valor = row[col]
-                    if pd.isna(valor) or valor == 0 or valor == "":
-                        if col == col_kg and valor == 0:
-                            fila_errores.append(f"Campo '{col}' = 0 (se eliminará)")
-                        else:
-                            fila_errores.append(f"Campo '{col}' vacío/nulo/cero")
-                
-                # Validar NIF y verificar si es corregible
-                if col_nif and col_nif in row:
-                    es_valido, mensaje = self.validar_nif(row[col_nif])
-                    if not es_valido:
-                        # Verificar si se puede corregir
-                        nif_corregido, es_corregible, detalle_correccion = self.corregir_nif(row[col_nif])
-                        if es_corregible:
-                            fila_errores.append(f"NIF: {mensaje} - CORREGIBLE")
-                            correcciones_posibles.append(f"NIF: {detalle_correccion}")
-                        else:
-                            fila_errores.append(f"NIF: {mensaje} - NO CORREGIBLE")
-                            correcciones_posibles.append(f"NIF: {detalle_correccion}")
-                
-                # Si hay errores, agregar la fila completa
-                if fila_errores:
-                    error_info = {
-                        'Fila': index + 7 + 1,  # +7 por las filas saltadas, +1 por índice base 0
-                        'Verificador': row.get(col_verificador, 'N/A'),
-                        'Errores': '; '.join(fila_errores),
-                        'Correcciones_Posibles': '; '.join(correcciones_posibles) if correcciones_posibles else 'Ninguna',
-                        'Datos_Completos': row.to_dict(),
-                        'Index_Original': index
-                    }
-                    self.errores_originales.append(error_info)
+            # Huella de cada fila: con historial, las filas que ya estaban en el
+            # análisis anterior de este archivo reutilizan su resultado
+            huellas = huellas_filas(self.df)
+            anterior = self.historial.cargar(
+                self.usuario, nombre_archivo, self.df.columns, VERSION_REGLAS_VALIDACION
+            ) if self.historial else None
+            resultados = {}
+            if anterior is not None:
+                por_validar = ~np.isin(huellas, anterior['huellas'])
+                reutilizadas = set(huellas[~por_validar].tolist())
+                resultados = {
+                    huella: resultado for huella, resultado in anterior['resultados'].items()
+                    if huella in reutilizadas
+                }
+            else:
+                por_validar = np.ones(len(huellas), dtype=bool)
+            
+            # Analizar cada fila nueva o modificada SIN hacer correcciones
+            for huella, (index, row) in zip(huellas[por_validar].tolist(), self.df[por_validar].iterrows()):
+                resultado = self._validar_fila_original(row, col_kg, col_nif)
+                if resultado is not None:
+                    resultados[huella] = resultado
+            
+            # Si hay errores, agregar la fila completa
+            con_error = np.isin(huellas, np.fromiter(resultados, dtype=np.uint64, count=len(resultados)))
+            posiciones_error = np.flatnonzero(con_error)
+            for posicion, datos in zip(posiciones_error, self.df.iloc[posiciones_error].to_dict('records')):
+                index = self.df.index[posicion]
+                errores, correcciones_posibles = resultados[huellas[posicion].item()]
+                error_info = {
+                    'Fila': index + 7 + 1,  # +7 por las filas saltadas, +1 por índice base 0
+                    'Verificador': datos.get(col_verificador, 'N/A'),
+                    'Errores': errores,
+                    'Correcciones_Posibles': correcciones_posibles,
+                    'Datos_Completos': datos,
+                    'Index_Original': index
+                }
+                self.errores_originales.append(error_info)
+            
+            if self.historial is not None:
+                if anterior is not None:
+                    self.diferencias_analisis = comparar_analisis(anterior, huellas, con_error)
+                    self.diferencias_analisis['filas_revalidadas'] = int(por_validar.sum())
+                    self.diferencias_analisis['filas_modificadas'] = [
+                        self.df.index[posicion] + 7 + 1 for posicion in self.diferencias_analisis['filas_modificadas']
+                    ]
+                    print(f"🔁 Reanálisis: {int(por_validar.sum())} de {len(huellas)} filas validadas")
+                self.historial.guardar(
+                    self.usuario, nombre_archivo, self.df.columns, VERSION_REGLAS_VALIDACION, huellas, resultados
+                )
             
             # NO llamar a ninguna función de mostrar resultados aquí
             # Solo retornar True para indicar éxito
@@ -254,17 +362,15 @@ class VerificadorAnalyzer:
     
     def generar_archivo_corregido(self):
         """
-        Genera el archivo Excel corregido manteniendo el formato original
+        Genera el archivo Excel corregido manteniendo el formato original.
+        Se parchea el XML de la hoja sobre el propio .xlsx (utils.parche_xlsx);
+        si el libro tiene algo que el parche no sabe desplazar, se usa openpyxl.
         """
         try:
             if self.df is None or self.archivo_temporal is None:
                 print("❌ No hay datos o archivo temporal disponible")
                 return None
             
-            # Cargar el workbook original nuevamente
-            wb = openpyxl.load_workbook(self.archivo_temporal)
-            ws = wb.active
-            
             # Buscar columnas importantes en el DataFrame
             col_nif = None
             col_kg = None
@@ -280,60 +386,46 @@ class VerificadorAnalyzer:
             print(f"   NIF: {col_nif}")
             print(f"   Kg: {col_kg}")
             
-            # Leer el archivo original completo para obtener las filas eliminadas
-            df_completo = pd.read_excel(self.archivo_temporal, skiprows=6, header=0)
+            df_original = self.df_original
             
-            # Identificar qué filas fueron eliminadas (las que tenían kg = 0)
+            # Identificar qué filas se eliminan (las que tenían kg = 0)
             filas_a_eliminar = []
             if col_kg:
-                for index, row in df_completo.iterrows():
-                    if row[col_kg] == 0:
-                        fila_excel = index + 8  # +7 por skiprows, +1 por ser 1-indexado
-                        filas_a_eliminar.append(fila_excel)
-                        print(f"   📍 Fila a eliminar: {fila_excel} (Kg=0)")
+                for index in df_original.index[df_original[col_kg] == 0]:
+                    fila_excel = index + 8  # +7 por skiprows, +1 por ser 1-indexado
+                    filas_a_eliminar.append(fila_excel)
+                    print(f"   📍 Fila a eliminar: {fila_excel} (Kg=0)")
             
-            # Aplicar correcciones de NIFs al workbook
+            # NIFs corregidos por fila de Excel
+            nifs_corregidos = {}
             if col_nif:
-                col_index_nif = None
-                # Buscar la columna de NIF en la fila de encabezados (fila 7)
-                for col_idx in range(1, ws.max_column + 1):
-                    header_value = ws.cell(row=7, column=col_idx).value
-                    if header_value and 'nif' in str(header_value).lower() and 'viticultor' in str(header_value).lower():
-                        col_index_nif = col_idx
-                        break
-                
-                print(f"   📍 Columna NIF en Excel: {col_index_nif}")
-                
-                if col_index_nif:
-                    nifs_corregidos_excel = 0
-                    for df_index, row in self.df_original.iterrows():
-                        excel_row = df_index + 8  # +7 por skiprows, +1 por ser 1-indexado
-                        
-                        # Verificar si este NIF necesita corrección
-                        nif_original = str(row[col_nif]).strip().upper()
-                        nif_corregido, fue_corregido, detalle = self.corregir_nif(nif_original)
-                        
-                        if fue_corregido:
-                            ws.cell(row=excel_row, column=col_index_nif, value=nif_corregido)
-                            nifs_corregidos_excel += 1
-                            print(f"   ✅ Excel fila {excel_row}: {nif_original} → {nif_corregido}")
+                for df_index, nif in df_original[col_nif].items():
+                    excel_row = df_index + 8  # +7 por skiprows, +1 por ser 1-indexado
                     
-                    print(f"📝 Total NIFs corregidos en Excel: {nifs_corregidos_excel}")
-            
-            # Eliminar filas con kg = 0 (desde abajo hacia arriba para no afectar índices)
-            if filas_a_eliminar:
-                print(f"🗑️ Eliminando {len(filas_a_eliminar)} filas con Kg=0...")
-                for fila_excel in sorted(filas_a_eliminar, reverse=True):
-                    print(f"   🗑️ Eliminando fila {fila_excel}")
-                    ws.delete_rows(fila_excel)
+                    # Verificar si este NIF necesita corrección
+                    nif_original = str(nif).strip().upper()
+                    nif_corregido, fue_corregido, detalle = self.corregir_nif(nif_original)
+                    
+                    if fue_corregido:
+                        nifs_corregidos[excel_row] = nif_corregido
+                        print(f"   ✅ Excel fila {excel_row}: {nif_original} → {nif_corregido}")
+                
+                print(f"📝 Total NIFs corregidos en Excel: {len(nifs_corregidos)}")
             
-            # Guardar en memoria
-            output = BytesIO()
-            wb.save(output)
-            output.seek(0)
+            try:
+                # Las columnas del DataFrame empiezan en la columna A de la hoja
+                col_index_nif = df_original.columns.get_loc(col_nif) + 1 if col_nif else None
+                contenido = parchear_hoja_activa(
+                    self.archivo_temporal,
+                    {(fila, col_index_nif): nif for fila, nif in nifs_corregidos.items()},
+                    filas_a_eliminar
+                )
+            except ErrorParcheXlsx as e:
+                print(f"⚠️ No se puede parchear el libro ({e}); se genera con openpyxl")
+                contenido = self._generar_con_openpyxl(nifs_corregidos, filas_a_eliminar)
             
             print("✅ Archivo Excel generado exitosamente")
-            return output.getvalue()
+            return contenido
             
         except Exception as e:
             print(f"❌ Error detallado al generar archivo corregido: {str(e)}")
@@ -341,6 +433,41 @@ class VerificadorAnalyzer:
             traceback.print_exc()
             return None
     
+    def _generar_con_openpyxl(self, nifs_corregidos, filas_a_eliminar):
+        """
+        Aplica las correcciones cargando el libro completo en openpyxl
+        nifs_corregidos: {fila de Excel: NIF}
+        """
+        wb = openpyxl.load_workbook(self.archivo_temporal)
+        ws = wb.active
+        
+        if nifs_corregidos:
+            col_index_nif = None
+            # Buscar la columna de NIF en la fila de encabezados (fila 7)
+            for col_idx in range(1, ws.max_column + 1):
+                header_value = ws.cell(row=7, column=col_idx).value
+                if header_value and 'nif' in str(header_value).lower() and 'viticultor' in str(header_value).lower():
+                    col_index_nif = col_idx
+                    break
+            
+            print(f"   📍 Columna NIF en Excel: {col_index_nif}")
+            
+            if col_index_nif:
+                for excel_row, nif_corregido in nifs_corregidos.items():
+                    ws.cell(row=excel_row, column=col_index_nif, value=nif_corregido)
+        
+        # Eliminar filas con kg = 0 (desde abajo hacia arriba para no afectar índices)
+        if filas_a_eliminar:
+            print(f"🗑️ Eliminando {len(filas_a_eliminar)} filas con Kg=0...")
+            for fila_excel in sorted(filas_a_eliminar, reverse=True):
+                ws.delete_rows(fila_excel)
+        
+        # Guardar en memoria
+        output = BytesIO()
+        wb.save(output)
+        output.seek(0)
+        return output.getvalue()
+    
     def cleanup(self):
         """
         Limpia archivos temporales
@@ -0,0 +1,301 @@
+import os
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from io import BytesIO
+
+import openpyxl
+import pandas as pd
+
+from utils.claves import normalizar_claves
+from utils.tipos import compactar_tipos, informe_memoria
+
+# Columnas mínimas de una pestaña de zona en BBDD_FINAL
+COLUMNAS_BBDD = ['EXTRANET', 'RVC', 'NIPD']
+
+# Pestaña con las bodegas de Cataluña, usada para las zonas sin pestaña propia
+HOJA_POR_DEFECTO = 'CAT'
+
+# Zonas de Extranet que no pertenecen a la pestaña CAT
+ZONAS_FUERA_CAT = ['Almendralejo', 'Cariñena', 'Requena']
+
+# Filas de preámbulo antes del encabezado en la declaración de Extranet
+FILAS_PREAMBULO_EXTRANET = 6
+
+# Posibles nombres de la columna de fecha de pesada en eRVC (por prioridad)
+COLUMNAS_FECHA_ERVC = ['dataPesada', 'dataPesai', 'fecha', 'dataGravacio']
+
+# Columnas de eRVC que usa la conciliación (el resto no se carga)
+COLUMNAS_ERVC = ['dos', 'nipd', 'nifLLiurador', 'kgTotals'] + COLUMNAS_FECHA_ERVC
+
+# Valor de 'dos' de las pesadas eRVC que se concilian
+DOS_ERVC = 'CV'
+
+# Columnas de texto repetitivo que se cargan como categóricas (se resuelven como las columnas de filtro)
+CATEGORICAS_EXTRANET = ['verificador', 'razón social', 'zona']
+CATEGORICAS_ERVC = ['dos']
+CATEGORICAS_BBDD = ['ZONA', 'HOJA']
+
+class ErrorColumna(ValueError):
+    """Falta una columna necesaria en uno de los archivos (columnas: las que tiene)"""
+    columnas = ()
+
+def normalizar_nombre_zona(valor):
+    """Normaliza un nombre de zona/pestaña: sin acentos, sin espacios extremos y en mayúsculas"""
+    texto = unicodedata.normalize('NFKD', str(valor).strip().upper())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+def _abrir_libro(archivo_bytes):
+    """Abre un libro en modo solo lectura (streaming, sin cargar estilos)"""
+    return openpyxl.load_workbook(BytesIO(archivo_bytes), read_only=True, data_only=True)
+
+def listar_hojas(archivo_bytes):
+    """Devuelve los nombres de las pestañas sin leer su contenido"""
+    wb = _abrir_libro(archivo_bytes)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+def valor_en(permitidos, valor):
+    """Predicado de filtro: el valor está en el conjunto de permitidos"""
+    return valor in permitidos
+
+@lru_cache(maxsize=1024)
+def zona_con_hoja(hojas, valor):
+    """
+    Predicado de filtro: la zona tiene pestaña en la BBDD según hoja_para_zona
+    (hojas: frozenset de nombres normalizados). Los valores repetidos salen de la caché.
+    """
+    return valor is None or hoja_para_zona(valor, hojas) is not None
+
+def _resolver_columna(columnas, nombre):
+    """
+    Índice de la columna 'nombre': coincidencia exacta o, si no existe,
+    la primera columna que lo contiene (sin distinguir mayúsculas)
+    """
+    if nombre in columnas:
+        return columnas.index(nombre)
+    for i, col in enumerate(columnas):
+        if str(nombre).lower() in str(col).lower():
+            return i
+    return None
+
+def leer_hoja(archivo_bytes, hoja=None, skiprows=0, columnas=None, filtros=None):
+    """
+    Lee una pestaña en modo solo lectura y la devuelve como DataFrame.
+    La fila skiprows (base 0) se usa como encabezado; hoja=None lee la activa.
+    
+    Los filtros se aplican mientras se recorren las filas, así que solo se
+    materializa lo que se va a usar:
+    - columnas: lista de columnas a conservar (las que no existan se ignoran)
+    - filtros: {columna: predicado(valor)}; se conservan las filas que cumplen
+      todos. Los predicados deben poder enviarse a otro proceso (funciones de
+      módulo o functools.partial).
+    El número de filas descartadas queda en df.attrs['filas_descartadas'].
+    """
+    wb = _abrir_libro(archivo_bytes)
+    try:
+        ws = wb[hoja] if hoja is not None else wb.active
+        filas = ws.iter_rows(values_only=True)
+
+        for _ in range(skiprows):
+            next(filas, None)
+
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return pd.DataFrame()
+
+        # Descartar columnas sin encabezado al final de la fila
+        ancho = len(encabezado)
+        while ancho > 0 and encabezado[ancho - 1] is None:
+            ancho -= 1
+        nombres = [f"Unnamed: {i}" if c is None else c for i, c in enumerate(encabezado[:ancho])]
+
+        # Proyección de columnas
+        if columnas is not None:
+            indices = [i for i, nombre in enumerate(nombres) if nombre in columnas]
+        else:
+            indices = list(range(ancho))
+
+        # Predicados por índice de columna
+        predicados = []
+        for nombre, predicado in (filtros or {}).items():
+            indice = _resolver_columna(nombres, nombre)
+            if indice is None:
+                error = ErrorColumna(f"No se encontró la columna '{nombre}' para filtrar")
+                error.columnas = nombres
+                raise error
+            predicados.append((indice, predicado))
+
+        # En modo solo lectura las filas pueden venir más cortas que el encabezado
+        relleno = (None,) * ancho
+        datos = []
+        descartadas = 0
+        for fila in filas:
+            fila = tuple(fila[:ancho]) + relleno[len(fila):]
+            if all(v is None for v in fila):
+                continue
+            if not all(predicado(fila[i]) for i, predicado in predicados):
+                descartadas += 1
+                continue
+            datos.append(tuple(fila[i] for i in indices))
+
+        df = pd.DataFrame(datos, columns=[nombres[i] for i in indices])
+        df.attrs['filas_descartadas'] = descartadas
+        return df
+    finally:
+        wb.close()
+
+def _leer_extranet(archivo_bytes, filtros):
+    """Tarea de un worker: lee la declaración de Extranet (error claro si falta la columna de zona)"""
+    try:
+        return leer_hoja(archivo_bytes, None, FILAS_PREAMBULO_EXTRANET, None, filtros)
+    except ErrorColumna as e:
+        raise ErrorColumna(
+            f"No se encontró columna 'Zona' en Extranet (columnas: {', '.join(map(str, e.columnas))})"
+        ) from None
+
+def _leer_ervc(archivo_bytes, filtros):
+    """Tarea de un worker: lee eRVC (error claro si falta la columna 'dos')"""
+    try:
+        return leer_hoja(archivo_bytes, None, 0, COLUMNAS_ERVC, filtros)
+    except ErrorColumna as e:
+        raise ErrorColumna(
+            f"No se encontró columna 'dos' en eRVC (columnas: {', '.join(map(str, e.columnas))})"
+        ) from None
+
+def _leer_hoja_bbdd(argumentos):
+    """Tarea de un worker: lee una pestaña de la BBDD"""
+    archivo_bytes, hoja = argumentos
+    return hoja, leer_hoja(archivo_bytes, hoja)
+
+def cargar_bbdd_zonas(archivo_bytes, max_workers=None):
+    """
+    Carga en paralelo (un proceso por pestaña) todas las pestañas de zona de la BBDD
+    y las une en un único DataFrame con la columna 'HOJA'.
+    Las pestañas sin las columnas EXTRANET/RVC/NIPD se ignoran.
+    Devuelve (df_bbdd, hojas_ignoradas).
+    """
+    hojas = listar_hojas(archivo_bytes)
+
+    workers = min(len(hojas), max_workers or os.cpu_count() or 1)
+    if workers <= 1:
+        resultados = [_leer_hoja_bbdd((archivo_bytes, hoja)) for hoja in hojas]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            resultados = list(executor.map(_leer_hoja_bbdd, [(archivo_bytes, hoja) for hoja in hojas]))
+
+    return _unir_hojas_bbdd(resultados)
+
+def _unir_hojas_bbdd(resultados):
+    """Une las pestañas leídas [(hoja, df)] en un único DataFrame con la columna 'HOJA'"""
+    partes = []
+    hojas_ignoradas = []
+    for hoja, df_hoja in resultados:
+        if not all(col in df_hoja.columns for col in COLUMNAS_BBDD):
+            hojas_ignoradas.append(hoja)
+            continue
+        df_hoja = df_hoja.copy()
+        df_hoja['HOJA'] = normalizar_nombre_zona(hoja)
+        partes.append(df_hoja)
+
+    if not partes:
+        return pd.DataFrame(columns=COLUMNAS_BBDD + ['ZONA', 'HOJA']), hojas_ignoradas
+
+    return pd.concat(partes, ignore_index=True), hojas_ignoradas
+
+def hoja_para_zona(zona, hojas):
+    """
+    Devuelve la pestaña de BBDD que corresponde a una zona de Extranet:
+    la pestaña con el mismo nombre si existe, si no la pestaña CAT
+    (salvo para las zonas fuera de CAT, que devuelven None).
+    """
+    zona_normalizada = normalizar_nombre_zona(zona)
+    if zona_normalizada in hojas:
+        return zona_normalizada
+    if zona_normalizada in {normalizar_nombre_zona(z) for z in ZONAS_FUERA_CAT}:
+        return None
+    return HOJA_POR_DEFECTO if HOJA_POR_DEFECTO in hojas else None
+
+def cargar_archivos_comprobaciones(bytes_extranet, bytes_bbdd, bytes_ervc, max_workers=None):
+    """
+    Parsea los tres archivos de comprobaciones a la vez en un único pool de procesos:
+    Extranet, eRVC y cada pestaña de la BBDD son tareas independientes, de modo que
+    el tiempo total es aproximadamente el del archivo más lento.
+    Extranet llega ya sin las zonas que no tienen pestaña en la BBDD y eRVC solo
+    con las pesadas 'dos'='CV' y las columnas de COLUMNAS_ERVC.
+    Los tres DataFrames llegan con tipos compactos (ver compactar_tipos).
+    Devuelve un diccionario con 'extranet', 'bbdd', 'hojas_ignoradas', 'ervc'
+    e 'informe_memoria' (memoria por columna tal como se leyó y con los tipos finales).
+    max_workers: procesos del pool (por defecto uno por CPU); con 1 todo se lee
+    en el proceso actual.
+    """
+    hojas_bbdd = listar_hojas(bytes_bbdd)
+    workers = min(2 + len(hojas_bbdd), max_workers or os.cpu_count() or 1)
+
+    # Filtros aplicados durante la lectura: zonas de Extranet sin pestaña en la BBDD
+    # (misma regla que hoja_para_zona) y pesadas eRVC con 'dos' distinto de CV
+    # (solo las columnas necesarias). Las pestañas que luego se ignoran por no
+    # tener las columnas de la BBDD las descarta después filtrar_por_zona.
+    hojas_normalizadas = frozenset(normalizar_nombre_zona(hoja) for hoja in hojas_bbdd)
+    filtros_extranet = {'zona': partial(zona_con_hoja, hojas_normalizadas)}
+    filtros_ervc = {'dos': partial(valor_en, {DOS_ERVC})}
+
+    if workers <= 1:
+        # Sin procesos hijos (p. ej. dentro de un trabajo del servicio con un solo proceso)
+        df_extranet = _leer_extranet(bytes_extranet, filtros_extranet)
+        df_ervc = _leer_ervc(bytes_ervc, filtros_ervc)
+        df_bbdd, hojas_ignoradas = _unir_hojas_bbdd(
+            [_leer_hoja_bbdd((bytes_bbdd, hoja)) for hoja in hojas_bbdd]
+        )
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futuro_extranet = executor.submit(_leer_extranet, bytes_extranet, filtros_extranet)
+            futuro_ervc = executor.submit(_leer_ervc, bytes_ervc, filtros_ervc)
+            futuros_bbdd = [executor.submit(_leer_hoja_bbdd, (bytes_bbdd, hoja)) for hoja in hojas_bbdd]
+
+            df_bbdd, hojas_ignoradas = _unir_hojas_bbdd([futuro.result() for futuro in futuros_bbdd])
+            df_extranet = futuro_extranet.result()
+            df_ervc = futuro_ervc.result()
+
+    leidos = {'extranet': df_extranet, 'bbdd': df_bbdd, 'ervc': df_ervc}
+
+    # Claves canónicas desde la carga: NIPD entero, NIF y zona categóricos
+    col_zona = _resolver_columna(list(df_extranet.columns), 'zona')
+    df_extranet = _con_attrs(df_extranet, normalizar_claves(
+        df_extranet, nif='Nif Viticultor',
+        zona=df_extranet.columns[col_zona] if col_zona is not None else None
+    ))
+    df_ervc = _con_attrs(df_ervc, normalizar_claves(df_ervc, nipd='nipd', nif='nifLLiurador'))
+    df_bbdd = normalizar_claves(df_bbdd, nipd='NIPD')
+
+    # Tipos compactos: enteros reducidos y texto repetitivo como categórico
+    datos = {'extranet': df_extranet, 'bbdd': df_bbdd, 'ervc': df_ervc}
+    informes = []
+    for nombre, categoricas in (
+        ('extranet', CATEGORICAS_EXTRANET), ('ervc', CATEGORICAS_ERVC), ('bbdd', CATEGORICAS_BBDD)
+    ):
+        datos[nombre] = compactar_tipos(
+            datos[nombre], categoricas=resolver_columnas(datos[nombre].columns, categoricas)
+        )
+        informes.append(informe_memoria(leidos[nombre], datos[nombre]).assign(archivo=nombre))
+
+    return {
+        'extranet': datos['extranet'],
+        'bbdd': datos['bbdd'],
+        'hojas_ignoradas': hojas_ignoradas,
+        'ervc': datos['ervc'],
+        'informe_memoria': pd.concat(informes, ignore_index=True)
+    }
+
+def resolver_columnas(columnas, nombres):
+    """Nombres reales de las columnas indicadas que existen (resueltas como _resolver_columna)"""
+    columnas = list(columnas)
+    indices = [_resolver_columna(columnas, nombre) for nombre in nombres]
+    return [columnas[i] for i in indices if i is not None]
+
+def _con_attrs(origen, destino):
+    """Copia los metadatos de lectura (attrs) de un DataFrame a otro"""
+    destino.attrs.update(origen.attrs)
+    return destino
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+def normalizar_nipd(serie):
+    """
+    Convierte NIPD a entero canónico (Int64): '802400022', 802400022 y 802400022.0
+    pasan a ser la misma clave. Los valores no numéricos o con decimales ('1.5')
+    quedan como <NA>: truncarlos los uniría a otro NIPD real.
+    """
+    if pd.api.types.is_integer_dtype(serie):
+        return serie.astype('Int64')
+    texto = serie.astype('string').str.strip().str.replace(r'\.0+$', '', regex=True)
+    numero = pd.to_numeric(texto, errors='coerce').astype('float64')
+    return numero.where(numero % 1 == 0).astype('Int64')
+
+def normalizar_nif(serie):
+    """Convierte NIF a categórico canónico (sin espacios extremos y en mayúsculas)"""
+    return serie.astype('string').str.strip().str.upper().astype('category')
+
+def normalizar_zona(serie):
+    """Convierte la zona a categórico (sin espacios extremos, conservando el texto original)"""
+    return serie.astype('string').str.strip().astype('category')
+
+def unificar_categorias(*series):
+    """
+    Devuelve las series categóricas con el mismo conjunto de categorías, de modo
+    que los merges entre ellas se resuelven sobre los códigos enteros
+    """
+    categorias = pd.Index([])
+    for serie in series:
+        categorias = categorias.union(serie.astype('category').cat.categories)
+    return [serie.astype(pd.CategoricalDtype(categorias)) for serie in series]
+
+def codificar_comun(*series):
+    """
+    Codifica varias series con un diccionario común y devuelve arrays int64
+    (-1 para valores nulos), aptos para joins y merge_asof sobre enteros
+    """
+    longitudes = [len(serie) for serie in series]
+    codigos, _ = pd.factorize(pd.concat([pd.Series(np.asarray(serie, dtype=object)) for serie in series], ignore_index=True))
+    codigos = codigos.astype('int64')
+    return np.split(codigos, np.cumsum(longitudes)[:-1])
+
+def normalizar_claves(df, nipd=None, nif=None, zona=None):
+    """Devuelve una copia de df con las columnas de clave indicadas en su forma canónica"""
+    df = df.copy()
+    if nipd is not None and nipd in df.columns:
+        df[nipd] = normalizar_nipd(df[nipd])
+    if nif is not None and nif in df.columns:
+        df[nif] = normalizar_nif(df[nif])
+    if zona is not None and zona in df.columns:
+        df[zona] = normalizar_zona(df[zona])
+    return df
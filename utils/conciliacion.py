@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+from utils.claves import codificar_comun
+from utils.incidencias import a_dias
+
+# Diferencia máxima de kg para emparejar dos pesadas del mismo NIPD, NIF y día
+TOLERANCIA_KG_PESADA = 5
+
+# Estados de una línea conciliada
+ESTADO_EMPAREJADA = 'emparejada'
+ESTADO_AMBIGUA = 'ambigua'
+ESTADO_SOLO_EXTRANET = 'solo_extranet'
+ESTADO_SOLO_ERVC = 'solo_ervc'
+
+COLUMNAS_CONCILIACION = [
+    'estado', 'nipd', 'nif', 'fecha', 'kg_extranet', 'kg_ervc',
+    'diferencia_kg', 'desfase_dias', 'linea_extranet', 'linea_ervc'
+]
+
+# Claves de salida y claves enteras equivalentes usadas en los joins
+CLAVES_PESADA = ['nipd', 'nif', 'fecha']
+CLAVES_JOIN = ['_k_nipd', '_k_nif', '_k_fecha']
+
+def _lineas(df, col_nipd, col_nif, col_kg, sufijo):
+    """Extrae las columnas de conciliación de un DataFrame preparado con un identificador de línea"""
+    return pd.DataFrame({
+        'nipd': df[col_nipd].values,
+        'nif': df[col_nif].values,
+        'fecha': df['fecha_pesada'].values,
+        f'kg_{sufijo}': pd.to_numeric(df[col_kg], errors='coerce').astype('float64').values,
+        f'linea_{sufijo}': df.index.values,
+        f'_dia_{sufijo}': a_dias(df['fecha_pesada'])
+    })
+
+def _codificar_claves(extranet, ervc):
+    """Añade a ambos lados las claves NIPD/NIF/fecha como enteros con un diccionario común"""
+    for clave, clave_join in zip(CLAVES_PESADA, CLAVES_JOIN):
+        extranet[clave_join], ervc[clave_join] = codificar_comun(extranet[clave], ervc[clave])
+
+def conciliar_pesadas(df_extranet, df_ervc, tolerancia_kg=TOLERANCIA_KG_PESADA, ventana_dias=0):
+    """
+    Empareja pesadas individuales de Extranet y eRVC por (NIPD, NIF, fecha).
+
+    1. Emparejamiento exacto: pesadas con los mismos kg se emparejan una a una
+       (la n-ésima repetición de un lado con la n-ésima del otro) mediante un hash join.
+    2. Emparejamiento con tolerancia: el resto se empareja con merge_asof sobre kg
+       (dirección 'nearest', hasta tolerancia_kg). Si varias pesadas de Extranet
+       apuntan a la misma de eRVC, todas quedan como ambiguas.
+    3. Emparejamiento con desfase de fecha (solo si ventana_dias > 0): para el
+       resto, candidatas por (NIPD, NIF) a ±ventana_dias (un hash join por desfase)
+       con los kg dentro de tolerancia_kg; de cada pesada de Extranet se queda la
+       del día más cercano, y si hay varias a esa distancia todas quedan como
+       ambiguas. 'desfase_dias' indica los días que la pesada de eRVC va por
+       detrás (o por delante) de Extranet.
+
+    Todos los pasos son ordenaciones y joins, así que el coste es casi lineal.
+    Devuelve un DataFrame con COLUMNAS_CONCILIACION y una línea por pesada o pareja.
+    """
+    extranet = _lineas(df_extranet, 'NIPD', 'Nif Viticultor', 'Total Kg:', 'extranet')
+    ervc = _lineas(df_ervc, 'nipd', 'nifLLiurador', 'kgTotals', 'ervc')
+    _codificar_claves(extranet, ervc)
+
+    # Las pesadas sin NIPD, NIF o fecha no pueden emparejarse
+    emparejables_extranet = (extranet[CLAVES_JOIN] >= 0).all(axis=1) & extranet['kg_extranet'].notna()
+    emparejables_ervc = (ervc[CLAVES_JOIN] >= 0).all(axis=1) & ervc['kg_ervc'].notna()
+
+    # 1. Emparejamiento exacto uno a uno (ordinal de la repetición dentro de clave + kg)
+    extranet['_ordinal'] = extranet.groupby(CLAVES_JOIN + ['kg_extranet'], dropna=False).cumcount()
+    ervc['_ordinal'] = ervc.groupby(CLAVES_JOIN + ['kg_ervc'], dropna=False).cumcount()
+
+    exactas = extranet[emparejables_extranet].merge(
+        ervc[emparejables_ervc].drop(columns=CLAVES_PESADA),
+        left_on=CLAVES_JOIN + ['kg_extranet', '_ordinal'],
+        right_on=CLAVES_JOIN + ['kg_ervc', '_ordinal'],
+        how='inner'
+    )
+
+    extranet_resto = extranet[~extranet['linea_extranet'].isin(exactas['linea_extranet'])]
+    ervc_resto = ervc[~ervc['linea_ervc'].isin(exactas['linea_ervc'])]
+
+    # 2. Emparejamiento por kg más cercano dentro de la tolerancia
+    izquierda = extranet_resto[emparejables_extranet.loc[extranet_resto.index]].sort_values('kg_extranet')
+    derecha = ervc_resto[emparejables_ervc.loc[ervc_resto.index]].sort_values('kg_ervc')
+
+    if len(izquierda) and len(derecha):
+        cercanas = pd.merge_asof(
+            izquierda.drop(columns='_ordinal'),
+            derecha.drop(columns=['_ordinal'] + CLAVES_PESADA),
+            left_on='kg_extranet', right_on='kg_ervc',
+            by=CLAVES_JOIN,
+            direction='nearest',
+            tolerance=tolerancia_kg
+        ).dropna(subset=['linea_ervc'])
+    else:
+        cercanas = pd.DataFrame(columns=COLUMNAS_CONCILIACION[1:])
+
+    # 3. Emparejamiento con desfase de fecha dentro de la ventana
+    if ventana_dias > 0:
+        izquierda = izquierda[~izquierda['linea_extranet'].isin(cercanas['linea_extranet'])].sort_values('_dia_extranet')
+        derecha = derecha[~derecha['linea_ervc'].isin(cercanas['linea_ervc'])].sort_values('_dia_ervc')
+        if len(izquierda) and len(derecha):
+            derecha = derecha.drop(columns=['_ordinal', '_k_fecha'] + CLAVES_PESADA)
+            candidatas = pd.concat([
+                izquierda.drop(columns='_ordinal').assign(_dia_objetivo=izquierda['_dia_extranet'] + desfase).merge(
+                    derecha,
+                    left_on=['_k_nipd', '_k_nif', '_dia_objetivo'],
+                    right_on=['_k_nipd', '_k_nif', '_dia_ervc'],
+                    how='inner'
+                )
+                for desfase in range(-int(ventana_dias), int(ventana_dias) + 1)
+            ], ignore_index=True).drop(columns='_dia_objetivo')
+            candidatas = candidatas[(candidatas['kg_extranet'] - candidatas['kg_ervc']).abs() <= tolerancia_kg]
+            # Solo el día más cercano; los empates quedan como varias candidatas de la misma pesada
+            distancia = (candidatas['_dia_ervc'] - candidatas['_dia_extranet']).abs()
+            desfasadas = candidatas[distancia == distancia.groupby(candidatas['linea_extranet']).transform('min')]
+            cercanas = pd.concat([cercanas, desfasadas], ignore_index=True)
+
+    # Pesadas eRVC reclamadas por más de una pesada de Extranet, o de Extranet con
+    # varias candidatas igual de cercanas
+    reclamaciones = cercanas['linea_ervc'].map(cercanas['linea_ervc'].value_counts())
+    candidatas_extranet = cercanas['linea_extranet'].map(cercanas['linea_extranet'].value_counts())
+    unicas = cercanas[(reclamaciones == 1) & (candidatas_extranet == 1)]
+    ambiguas_extranet = cercanas[(reclamaciones > 1) | (candidatas_extranet > 1)]
+    ambiguas_ervc = ervc_resto[ervc_resto['linea_ervc'].isin(ambiguas_extranet['linea_ervc'])].copy()
+
+    emparejadas = pd.concat([
+        exactas.drop(columns='_ordinal'),
+        unicas
+    ], ignore_index=True)
+    emparejadas['estado'] = ESTADO_EMPAREJADA
+
+    ambiguas = pd.concat([
+        ambiguas_extranet.drop_duplicates('linea_extranet').drop(columns=['kg_ervc']).assign(linea_ervc=np.nan),
+        ambiguas_ervc.drop(columns='_ordinal')
+    ], ignore_index=True)
+    ambiguas['estado'] = ESTADO_AMBIGUA
+
+    usadas_extranet = set(emparejadas['linea_extranet']) | set(ambiguas_extranet['linea_extranet'])
+    usadas_ervc = set(emparejadas['linea_ervc']) | set(ambiguas_ervc['linea_ervc'])
+
+    solo_extranet = extranet[~extranet['linea_extranet'].isin(usadas_extranet)].drop(columns='_ordinal')
+    solo_extranet['estado'] = ESTADO_SOLO_EXTRANET
+
+    solo_ervc = ervc[~ervc['linea_ervc'].isin(usadas_ervc)].drop(columns='_ordinal')
+    solo_ervc['estado'] = ESTADO_SOLO_ERVC
+
+    df_conciliacion = pd.concat(
+        [emparejadas, ambiguas, solo_extranet, solo_ervc], ignore_index=True
+    )
+    df_conciliacion['diferencia_kg'] = df_conciliacion['kg_extranet'] - df_conciliacion['kg_ervc']
+    df_conciliacion['desfase_dias'] = (
+        df_conciliacion['_dia_ervc'] - df_conciliacion['_dia_extranet']
+    ).where(df_conciliacion['estado'] == ESTADO_EMPAREJADA)
+    df_conciliacion = df_conciliacion.reindex(columns=COLUMNAS_CONCILIACION)
+    for col in ('desfase_dias', 'linea_extranet', 'linea_ervc'):
+        df_conciliacion[col] = df_conciliacion[col].astype('Int64')
+
+    return df_conciliacion.sort_values(CLAVES_PESADA + ['estado'], kind='stable').reset_index(drop=True)
+
+def resumir_conciliacion(df_conciliacion):
+    """Cuenta las líneas por estado de conciliación"""
+    conteos = df_conciliacion['estado'].value_counts()
+    return {
+        estado: int(conteos.get(estado, 0))
+        for estado in (ESTADO_EMPAREJADA, ESTADO_AMBIGUA, ESTADO_SOLO_EXTRANET, ESTADO_SOLO_ERVC)
+    }
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+# Lo que no es letra ni dígito en un NIF (guiones, espacios, puntos, barras...)
+PATRON_NO_ALFANUMERICO = r'[^0-9A-Z]'
+
+# Tipos de incidencia de consistencia entre Extranet y eRVC
+TIPO_FORMATO = 'formato'
+TIPO_NIPD_DISTINTO = 'nipd_distinto'
+TIPO_SOLO_EXTRANET = 'solo_extranet'
+TIPO_SOLO_ERVC = 'solo_ervc'
+TIPOS_CONSISTENCIA = [TIPO_FORMATO, TIPO_NIPD_DISTINTO, TIPO_SOLO_EXTRANET, TIPO_SOLO_ERVC]
+
+COLUMNAS_CONSISTENCIA = [
+    'tipo', 'nif', 'variantes_extranet', 'variantes_ervc',
+    'nipd_extranet', 'nipd_ervc', 'pesadas_extranet', 'pesadas_ervc'
+]
+
+def clave_nif(serie):
+    """
+    Forma compacta de un NIF para comparar entre sistemas: solo letras y dígitos,
+    en mayúsculas y sin ceros a la izquierda ('12345678-z', ' 012345678Z' y
+    '12345678Z' comparten clave). Se calcula una sola vez por valor distinto.
+    """
+    serie = serie.astype('category')
+    categorias = pd.Series(serie.cat.categories, dtype='string').str.upper()
+    categorias = categorias.str.replace(PATRON_NO_ALFANUMERICO, '', regex=True).str.lstrip('0')
+    categorias = categorias.where(categorias != '').to_numpy(dtype=object, na_value=None)
+
+    codigos = serie.cat.codes.to_numpy()
+    claves = np.full(len(codigos), None, dtype=object)
+    validos = codigos >= 0
+    claves[validos] = categorias[codigos[validos]]
+    return pd.Series(claves, index=serie.index, dtype=object)
+
+def _pares(df, col_nipd, col_nif):
+    """Combinaciones (clave NIF, NIF tal cual, NIPD) distintas de un sistema con su número de pesadas"""
+    pares = pd.DataFrame({
+        'clave': clave_nif(df[col_nif]).values,
+        'nif': df[col_nif].astype(object).values,
+        'nipd': df[col_nipd].astype('Int64').values
+    }).dropna(subset=['clave'])
+    return pares.groupby(['clave', 'nif', 'nipd'], sort=False, dropna=False).size().rename('pesadas').reset_index()
+
+def _resumir(pares, claves):
+    """Variantes de escritura, NIPD y pesadas de cada clave (solo las claves indicadas)"""
+    # En object: con Int64, pandas intentaría devolver la lista de NIPD como entero
+    seleccion = pares[pares['clave'].isin(claves)].astype({'nipd': object})
+    return seleccion.groupby('clave').agg(
+        variantes=('nif', lambda nifs: ', '.join(sorted(set(nifs)))),
+        nipd=('nipd', lambda nipds: ', '.join(str(nipd) for nipd in sorted(set(nipds.dropna())))),
+        pesadas=('pesadas', 'sum')
+    )
+
+def comprobar_consistencia(df_extranet, df_ervc, col_nipd_extranet='NIPD', col_nif_extranet='Nif Viticultor',
+                           col_nipd_ervc='nipd', col_nif_ervc='nifLLiurador'):
+    """
+    Cruza los NIF y NIPD de Extranet y eRVC con conjuntos hash de claves
+    normalizadas (una pasada por sistema, coste lineal) y detecta:
+
+    - formato: NIF escrito de más de una forma (guiones, espacios, ceros a la
+      izquierda...) que con clave_nif es el mismo viticultor
+    - nipd_distinto: NIF presente en ambos sistemas con conjuntos de NIPD distintos
+    - solo_extranet / solo_ervc: NIF que de verdad falta en el otro sistema
+      (ninguna variante de escritura aparece en él)
+
+    eRVC abarca toda Cataluña: solo se consideran sus pesadas de los NIPD de la
+    declaración o de viticultores que aparecen en ella.
+    Devuelve un DataFrame con COLUMNAS_CONSISTENCIA y una fila por NIF y tipo.
+    """
+    extranet = _pares(df_extranet, col_nipd_extranet, col_nif_extranet)
+    ervc = _pares(df_ervc, col_nipd_ervc, col_nif_ervc)
+
+    claves_extranet = pd.Index(extranet['clave'].unique())
+    nipd_extranet = pd.Index(extranet['nipd'].dropna().unique())
+    ervc = ervc[ervc['clave'].isin(claves_extranet) | ervc['nipd'].isin(nipd_extranet)]
+    claves_ervc = pd.Index(ervc['clave'].unique())
+
+    # Variantes de escritura de la misma clave en cualquiera de los dos sistemas
+    # (la primera, de Extranet si la hay, es la que se muestra como NIF)
+    variantes = pd.concat([extranet[['clave', 'nif']], ervc[['clave', 'nif']]]).drop_duplicates()
+    num_variantes = variantes['clave'].value_counts()
+    representante = variantes.drop_duplicates('clave').set_index('clave')['nif']
+
+    # Conjuntos de NIPD distintos: alguna pareja (clave, NIPD) está en un solo sistema
+    nipd_por_clave_extranet = extranet[['clave', 'nipd']].dropna().drop_duplicates()
+    nipd_por_clave_ervc = ervc[['clave', 'nipd']].dropna().drop_duplicates()
+    cruce = nipd_por_clave_extranet.merge(nipd_por_clave_ervc, how='outer', indicator=True)
+    con_nipd_en_ambos = pd.Index(nipd_por_clave_extranet['clave'].unique()).intersection(
+        pd.Index(nipd_por_clave_ervc['clave'].unique())
+    )
+
+    marcadas = {
+        TIPO_FORMATO: num_variantes.index[num_variantes > 1],
+        TIPO_NIPD_DISTINTO: pd.Index(cruce.loc[cruce['_merge'] != 'both', 'clave'].unique()).intersection(con_nipd_en_ambos),
+        TIPO_SOLO_EXTRANET: claves_extranet.difference(claves_ervc),
+        TIPO_SOLO_ERVC: claves_ervc.difference(claves_extranet)
+    }
+
+    filas = pd.concat([
+        pd.DataFrame({'tipo': tipo, 'clave': pd.Series(claves, dtype=object).sort_values().values})
+        for tipo, claves in marcadas.items()
+    ], ignore_index=True)
+    filas['nif'] = filas['clave'].map(representante)
+    todas = filas['clave'].unique()
+
+    df_consistencia = filas.join(
+        _resumir(extranet, todas).add_suffix('_extranet'), on='clave'
+    ).join(
+        _resumir(ervc, todas).add_suffix('_ervc'), on='clave'
+    ).reindex(columns=COLUMNAS_CONSISTENCIA)
+
+    for col in ('variantes_extranet', 'variantes_ervc', 'nipd_extranet', 'nipd_ervc'):
+        df_consistencia[col] = df_consistencia[col].fillna('')
+    for col in ('pesadas_extranet', 'pesadas_ervc'):
+        df_consistencia[col] = df_consistencia[col].fillna(0).astype('int64')
+
+    return df_consistencia
+
+def resumir_consistencia(df_consistencia):
+    """Cuenta los NIF por tipo de incidencia de consistencia"""
+    conteos = df_consistencia['tipo'].value_counts()
+    return {tipo: int(conteos.get(tipo, 0)) for tipo in TIPOS_CONSISTENCIA}
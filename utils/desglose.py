@@ -0,0 +1,64 @@
+import pandas as pd
+
+# Columnas del desglose diario (una fila por NIPD, NIF y día con ambos sistemas)
+COLUMNAS_DESGLOSE_DIARIO = [
+    'nipd', 'nif', 'fecha', 'kg_extranet', 'kg_ervc', 'diferencia_kg',
+    'pesadas_extranet', 'pesadas_ervc'
+]
+
+def construir_desglose_diario(cubo_extranet, cubo_ervc):
+    """Une los cubos de ambos sistemas en una tabla (NIPD, NIF, día) con kg y pesadas de cada lado"""
+    extranet = cubo_extranet[['nipd', 'nif', 'fecha', 'kg', 'pesadas']].rename(
+        columns={'kg': 'kg_extranet', 'pesadas': 'pesadas_extranet'}
+    )
+    ervc = cubo_ervc[['nipd', 'nif', 'fecha', 'kg', 'pesadas']].rename(
+        columns={'kg': 'kg_ervc', 'pesadas': 'pesadas_ervc'}
+    )
+
+    diario = pd.merge(extranet, ervc, on=['nipd', 'nif', 'fecha'], how='outer')
+    metricas = ['kg_extranet', 'kg_ervc', 'pesadas_extranet', 'pesadas_ervc']
+    diario[metricas] = diario[metricas].fillna(0)
+    diario[['pesadas_extranet', 'pesadas_ervc']] = diario[['pesadas_extranet', 'pesadas_ervc']].astype('int64')
+    diario['diferencia_kg'] = diario['kg_extranet'] - diario['kg_ervc']
+
+    return diario[COLUMNAS_DESGLOSE_DIARIO].sort_values(
+        ['nipd', 'nif', 'fecha'], kind='stable'
+    ).reset_index(drop=True)
+
+def _posiciones(df, clave):
+    """{valor de la clave: posiciones de sus filas en df} (sin claves nulas)"""
+    claves = pd.Series(df[clave].astype(object).values)
+    return {
+        valor: posiciones
+        for valor, posiciones in claves.groupby(claves, sort=False).indices.items()
+    }
+
+def construir_indice_desglose(cubo_extranet, cubo_ervc, df_pesadas):
+    """
+    Prepara el desglose por NIPD y por NIF una sola vez tras generar el reporte:
+    la tabla diaria, la conciliación por pesada y, para cada clave, las
+    posiciones de sus filas en ambas tablas
+    """
+    diario = construir_desglose_diario(cubo_extranet, cubo_ervc)
+    pesadas = df_pesadas.reset_index(drop=True)
+
+    return {
+        'diario': diario,
+        'pesadas': pesadas,
+        'posiciones': {
+            'nipd': (_posiciones(diario, 'nipd'), _posiciones(pesadas, 'nipd')),
+            'nif': (_posiciones(diario, 'nif'), _posiciones(pesadas, 'nif'))
+        }
+    }
+
+def consultar_desglose(indice, clave, valor):
+    """
+    Devuelve (desglose diario, pesadas) de un NIPD o NIF ('clave' = 'nipd' o 'nif')
+    a partir del índice, sin recorrer las tablas completas
+    """
+    posiciones_diario, posiciones_pesadas = indice['posiciones'][clave]
+    vacio = []
+    return (
+        indice['diario'].take(posiciones_diario.get(valor, vacio)),
+        indice['pesadas'].take(posiciones_pesadas.get(valor, vacio))
+    )
@@ -0,0 +1,182 @@
+import re
+import time
+import uuid
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils.memoria_sesion import gestor_global, DiccionarioSesion, EntradaSesion, MB
+from utils.perfilado import PERFILADO_POR_DEFECTO, INFORMES_POR_SESION
+from utils.trabajos import asegurar_servicio, ErrorTrabajos, ESTADOS_FINALES
+from utils.ui_components import mostrar_estado_trabajo
+
+# Segundos entre consultas al servicio mientras un trabajo de la sesión no termina
+INTERVALO_SONDEO_TRABAJOS = 1.0
+
+# Parámetro de la URL con la clave de usuario para el servicio de trabajos
+PARAMETRO_USUARIO = 'usuario'
+PATRON_CLAVE_USUARIO = re.compile(r'^[0-9a-f]{32}$')
+
+def id_sesion_actual():
+    """Identificador de la sesión de Streamlit en curso"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'local'
+
+def id_usuario_actual():
+    """
+    Clave aleatoria del usuario para el servicio de trabajos. Se guarda en la URL
+    (?usuario=...) para que, al volver a abrir la misma dirección tras cerrar la
+    pestaña, se vean sus trabajos y solo los suyos.
+    """
+    if 'id_usuario' not in st.session_state:
+        clave = st.experimental_get_query_params().get(PARAMETRO_USUARIO, [''])[0]
+        st.session_state['id_usuario'] = clave if PATRON_CLAVE_USUARIO.match(clave) else uuid.uuid4().hex
+    parametros = st.experimental_get_query_params()
+    if parametros.get(PARAMETRO_USUARIO, [None])[0] != st.session_state['id_usuario']:
+        st.experimental_set_query_params(**{**parametros, PARAMETRO_USUARIO: st.session_state['id_usuario']})
+    return st.session_state['id_usuario']
+
+def guardar_en_sesion(clave, valor):
+    """
+    Guarda en st.session_state un DataFrame o bytes (como entrada del gestor de
+    memoria) o un diccionario (sus DataFrames y bytes pasan a ser entradas)
+    """
+    gestor = gestor_global()
+    if isinstance(valor, dict):
+        gestor.descartar(id_sesion_actual(), clave)
+        st.session_state[clave] = DiccionarioSesion(gestor, id_sesion_actual(), clave, valor)
+    else:
+        st.session_state[clave] = gestor.guardar(id_sesion_actual(), clave, valor)
+
+def leer_de_sesion(clave, defecto=None):
+    """Lee un valor de st.session_state, recargándolo de disco si estaba volcado"""
+    valor = st.session_state.get(clave, defecto)
+    return valor.valor if isinstance(valor, EntradaSesion) else valor
+
+def borrar_de_sesion(*claves):
+    """Elimina las claves de st.session_state y libera sus datos en el gestor"""
+    for clave in claves:
+        st.session_state.pop(clave, None)
+        gestor_global().descartar(id_sesion_actual(), clave)
+
+def registrar_actividad():
+    """Marca la sesión como activa y aplica el volcado/expulsión de sesiones inactivas"""
+    gestor = gestor_global()
+    gestor.tocar(id_sesion_actual())
+    gestor.mantenimiento()
+
+def mostrar_uso_memoria():
+    """Resumen de memoria de la sesión y del servidor (para la barra lateral)"""
+    gestor = gestor_global()
+    sesion = gestor.uso(id_sesion_actual())
+    total = gestor.uso()
+    st.caption(
+        f"💾 Sesión: {sesion['memoria'] / MB:,.1f} MB en memoria, {sesion['disco'] / MB:,.1f} MB en disco · "
+        f"Servidor: {total['memoria'] / MB:,.0f} / {gestor.presupuesto_global / MB:,.0f} MB "
+        f"({total['sesiones']} sesiones)"
+    )
+
+def perfilado_activo():
+    """Modo perfilado de la sesión (interruptor de la barra lateral o VERIFICACION_PERFILADO)"""
+    return st.session_state.get('perfilado_activo', PERFILADO_POR_DEFECTO)
+
+def registrar_informe_perfilado(informe):
+    """Añade un informe de perfilado a los de la sesión (se conservan los últimos)"""
+    informes = st.session_state.setdefault('informes_perfilado', [])
+    informes.append(informe)
+    del informes[:-INFORMES_POR_SESION]
+
+def enviar_trabajo(clave, tipo, entradas, opciones=None, descripcion=None):
+    """
+    Envía un trabajo al servicio local y guarda su identificador en st.session_state[clave].
+    entradas: lista de (valor, nombre), cuyos bytes y DataFrames se dejan en disco para
+    el servicio, o rutas que ya están en disco (p. ej. tablas compartidas de otro trabajo).
+    Con el modo perfilado activo, el trabajo se perfila en el proceso que lo ejecuta.
+    El servicio reparte la cola por usuarios y puede rechazar el trabajo si no cabría
+    en memoria: en ese caso se muestra el motivo y devuelve False.
+    """
+    cliente = asegurar_servicio()
+    rutas = [
+        entrada if isinstance(entrada, str) else cliente.guardar_entrada(*entrada)
+        for entrada in entradas
+    ]
+    try:
+        st.session_state[clave] = cliente.enviar(
+            tipo, rutas, {**(opciones or {}), 'perfilar': perfilado_activo()}, descripcion,
+            usuario=id_usuario_actual()
+        )
+    except ErrorTrabajos as e:
+        st.error(f"❌ No se pudo encolar el trabajo: {e}")
+        return False
+    return True
+
+def trabajo_pendiente(clave):
+    return st.session_state.get(clave) is not None
+
+def recoger_trabajo(clave):
+    """
+    Sigue el trabajo de st.session_state[clave]. Mientras no termina muestra su estado
+    y vuelve a ejecutar la página; al terminar lo quita de la sesión y devuelve su
+    resultado (ErrorTrabajos si falló). Sin trabajo pendiente devuelve None.
+    """
+    id_trabajo = st.session_state.get(clave)
+    if id_trabajo is None:
+        return None
+    
+    cliente = asegurar_servicio()
+    try:
+        estado = cliente.estado(id_trabajo, id_usuario_actual())
+    except ErrorTrabajos:
+        # El servicio se reinició y ya no conoce el trabajo
+        st.session_state.pop(clave, None)
+        raise
+    
+    if estado['estado'] not in ESTADOS_FINALES:
+        mostrar_estado_trabajo(estado)
+        time.sleep(INTERVALO_SONDEO_TRABAJOS)
+        st.rerun()
+    
+    st.session_state.pop(clave, None)
+    resultado = cliente.resultado(id_trabajo, id_usuario_actual())
+    if 'informe_perfilado' in resultado:
+        registrar_informe_perfilado(resultado.pop('informe_perfilado'))
+    return resultado
+
+def retomar_trabajo_anterior(clave, tipos):
+    """
+    Lista los trabajos del usuario de los tipos indicados para retomar uno
+    (p. ej. tras cerrar la pestaña durante una ejecución larga). Con su
+    identificador solo se retoman trabajos del propio usuario.
+    """
+    if trabajo_pendiente(clave):
+        return
+    
+    cliente = asegurar_servicio()
+    trabajos = [t for t in reversed(cliente.listar(id_usuario_actual())) if t['tipo'] in tipos]
+    
+    with st.expander("🗂️ Mis trabajos del servicio"):
+        if trabajos:
+            indice = st.selectbox(
+                "Trabajo",
+                range(len(trabajos)),
+                format_func=lambda i: f"{trabajos[i]['creado'][11:]} · {trabajos[i]['descripcion']} · {trabajos[i]['estado']}",
+                key=f"{clave}_anterior"
+            )
+            if st.button("📂 Retomar este trabajo", key=f"{clave}_retomar"):
+                st.session_state[clave] = trabajos[indice]['id']
+                st.rerun()
+        else:
+            st.caption("No hay trabajos tuyos en el servicio. Para verlos tras cerrar la pestaña, vuelve a abrir esta misma dirección.")
+        
+        id_trabajo = st.text_input("Identificador de trabajo", key=f"{clave}_id").strip()
+        if id_trabajo and st.button("🔑 Retomar por identificador", key=f"{clave}_retomar_id"):
+            try:
+                estado = cliente.estado(id_trabajo, id_usuario_actual())
+            except ErrorTrabajos:
+                st.error("❌ No existe ningún trabajo tuyo con ese identificador")
+                return
+            if estado['tipo'] not in tipos:
+                st.error("❌ Ese trabajo no es de esta página")
+                return
+            st.session_state[clave] = id_trabajo
+            st.rerun()
@@ -0,0 +1,108 @@
+import math
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+# Filas que se convierten a valores Python de una vez (acota la memoria por bloque)
+FILAS_POR_BLOQUE = 10000
+
+# Resaltado de incidencias ('SI')
+RELLENO_INCIDENCIA = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
+FUENTE_INCIDENCIA = Font(color='9C0006')
+FUENTE_ENCABEZADO = Font(bold=True)
+
+# Formato por defecto de las columnas de fecha
+FORMATO_FECHA = 'DD/MM/YYYY'
+
+def _valor_celda(valor):
+    """Convierte un valor de pandas a uno que openpyxl pueda escribir"""
+    if valor is None or valor is pd.NA or valor is pd.NaT:
+        return None
+    if isinstance(valor, float):
+        if math.isnan(valor):
+            return None
+        if math.isinf(valor):
+            # Mismo criterio que DataFrame.to_excel (inf_rep='inf')
+            return 'inf' if valor > 0 else '-inf'
+    return valor
+
+def _filas(df):
+    """Genera las filas del DataFrame como listas de valores Python, bloque a bloque"""
+    for inicio in range(0, len(df), FILAS_POR_BLOQUE):
+        bloque = df.iloc[inicio:inicio + FILAS_POR_BLOQUE].astype(object)
+        for fila in bloque.itertuples(index=False, name=None):
+            yield [_valor_celda(valor) for valor in fila]
+
+def escribir_hoja_streaming(wb, nombre, df, formatos=None, columnas_incidencia=None):
+    """
+    Añade una pestaña a un libro write_only escribiendo el DataFrame fila a fila.
+
+    - formatos: {columna: formato numérico}; las columnas de fecha usan FORMATO_FECHA
+    - columnas_incidencia: columnas cuyo valor 'SI' se resalta en rojo (formato condicional)
+    """
+    formatos = dict(formatos or {})
+    columnas_incidencia = [col for col in (columnas_incidencia or []) if col in df.columns]
+
+    for col in df.columns:
+        if col not in formatos and pd.api.types.is_datetime64_any_dtype(df[col]):
+            formatos[col] = FORMATO_FECHA
+
+    ws = wb.create_sheet(title=nombre)
+    ws.freeze_panes = 'A2'
+
+    # Encabezado
+    encabezado = []
+    for col in df.columns:
+        celda = WriteOnlyCell(ws, value=str(col))
+        celda.font = FUENTE_ENCABEZADO
+        encabezado.append(celda)
+    ws.append(encabezado)
+
+    # Datos: solo se crea una celda con estilo en las columnas con formato numérico
+    posiciones_formato = [
+        (i, formatos[col]) for i, col in enumerate(df.columns) if col in formatos
+    ]
+    for valores in _filas(df):
+        for i, formato in posiciones_formato:
+            if valores[i] is not None:
+                celda = WriteOnlyCell(ws, value=valores[i])
+                celda.number_format = formato
+                valores[i] = celda
+        ws.append(valores)
+
+    ultima_fila = len(df) + 1
+    ultima_columna = get_column_letter(max(len(df.columns), 1))
+    ws.auto_filter.ref = f"A1:{ultima_columna}{ultima_fila}"
+
+    # Resaltado de incidencias como formato condicional: una regla por columna
+    for col in columnas_incidencia:
+        letra = get_column_letter(list(df.columns).index(col) + 1)
+        ws.conditional_formatting.add(
+            f"{letra}2:{letra}{max(ultima_fila, 2)}",
+            CellIsRule(operator='equal', formula=['"SI"'], fill=RELLENO_INCIDENCIA, font=FUENTE_INCIDENCIA)
+        )
+
+    return ws
+
+def crear_excel_streaming(hojas):
+    """
+    Crea un Excel en modo write_only (memoria constante por fila) y devuelve sus bytes.
+    hojas: lista de diccionarios con 'nombre', 'df' y opcionalmente 'formatos'
+    y 'columnas_incidencia' (ver escribir_hoja_streaming).
+    """
+    wb = Workbook(write_only=True)
+    for hoja in hojas:
+        escribir_hoja_streaming(
+            wb, hoja['nombre'], hoja['df'],
+            formatos=hoja.get('formatos'),
+            columnas_incidencia=hoja.get('columnas_incidencia')
+        )
+
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
@@ -0,0 +1,95 @@
+from datetime import date, datetime
+
+import pandas as pd
+
+# Formatos candidatos para fechas en texto (el orden desempata: dd/mm/yyyy primero)
+FORMATOS_FECHA = ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%Y/%m/%d', '%d/%m/%y', '%d.%m.%Y']
+
+# Número máximo de valores únicos usados para inferir el formato
+TAMANO_MUESTRA = 200
+
+def _parte_fecha(valor):
+    """Quita la hora de un texto 'fecha hora' o 'fechaThora'"""
+    return str(valor).strip().split(' ')[0].split('T')[0]
+
+def inferir_formato(textos):
+    """
+    Devuelve el formato de FORMATOS_FECHA que parsea más valores de la muestra,
+    o None si ninguno parsea ninguno
+    """
+    muestra = pd.Series(textos[:TAMANO_MUESTRA], dtype=object)
+    mejor_formato = None
+    mejor_parseados = 0
+    for formato in FORMATOS_FECHA:
+        parseados = pd.to_datetime(muestra, format=formato, errors='coerce').notna().sum()
+        if parseados > mejor_parseados:
+            mejor_formato, mejor_parseados = formato, parseados
+            if parseados == len(muestra):
+                break
+    return mejor_formato
+
+def normalizar_fechas(serie, dayfirst=True):
+    """
+    Convierte una serie de fechas (texto, datetime o mezcla) a objetos date.
+    Solo se parsean los valores únicos (una campaña tiene pocas decenas de días)
+    y el resultado se mapea de vuelta a cada fila. El formato de los textos se
+    infiere de una muestra; lo que no encaja se intenta con detección automática.
+
+    Devuelve (serie_fechas, resumen) donde resumen incluye 'formato',
+    'valores_unicos', 'fallidos' (filas no vacías sin fecha) y 'ejemplos_fallidos'.
+    """
+    resumen = {'formato': None, 'valores_unicos': 0, 'fallidos': 0, 'ejemplos_fallidos': []}
+
+    # Columna ya tipada como fecha: no hay nada que inferir
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        fechas = serie.dt.normalize()
+        resumen['formato'] = 'datetime'
+        resumen['valores_unicos'] = int(fechas.nunique())
+        return fechas.dt.date.where(fechas.notna(), None), resumen
+
+    unicos = pd.unique(serie.dropna())
+    resumen['valores_unicos'] = len(unicos)
+
+    mapeo = {}
+    textos = []
+    for valor in unicos:
+        if isinstance(valor, datetime):
+            mapeo[valor] = valor.date()
+        elif isinstance(valor, date):
+            mapeo[valor] = valor
+        else:
+            textos.append(valor)
+
+    if textos:
+        partes = pd.Series([_parte_fecha(valor) for valor in textos], dtype=object)
+        formato = inferir_formato(partes.tolist())
+        resumen['formato'] = formato or 'automático'
+
+        if formato:
+            parseadas = pd.to_datetime(partes, format=formato, errors='coerce')
+        else:
+            parseadas = pd.Series(pd.NaT, index=partes.index)
+
+        # Valores que no encajan con el formato inferido
+        pendientes = parseadas.isna()
+        if pendientes.any():
+            rescatadas = pd.to_datetime(
+                partes[pendientes], format='mixed', dayfirst=dayfirst, errors='coerce'
+            )
+            parseadas[pendientes] = rescatadas
+            if formato and rescatadas.notna().any():
+                resumen['formato'] = f"{formato} + automático"
+
+        for valor, fecha in zip(textos, parseadas):
+            mapeo[valor] = None if pd.isna(fecha) else fecha.date()
+    elif mapeo:
+        resumen['formato'] = 'datetime'
+
+    fechas = serie.map(mapeo)
+    fechas = fechas.where(fechas.notna(), None)
+
+    fallidos = serie.notna() & fechas.isna()
+    resumen['fallidos'] = int(fallidos.sum())
+    resumen['ejemplos_fallidos'] = [str(v) for v in pd.unique(serie[fallidos])[:5]]
+
+    return fechas, resumen
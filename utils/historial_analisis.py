@@ -0,0 +1,203 @@
+import difflib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Ruta por defecto del historial de análisis (configurable por variable de entorno)
+RUTA_HISTORIAL_POR_DEFECTO = os.environ.get(
+    'VERIFICACION_HISTORIAL_ANALISIS',
+    os.path.join(os.path.expanduser('~'), '.verificacion', 'historial_analisis.sqlite')
+)
+
+# Días que se conserva el análisis de una declaración sin volver a subirla
+DIAS_RETENCION_HISTORIAL = float(os.environ.get('VERIFICACION_DIAS_RETENCION_HISTORIAL', 30))
+
+# Por debajo de esta fracción de filas reutilizadas se trata como un archivo distinto
+# (no se alinea fila a fila con el análisis anterior)
+FRACCION_MINIMA_DIFERENCIAS = 0.5
+
+# Filas modificadas que se listan en el resumen de diferencias
+MAX_FILAS_LISTADAS = 50
+
+def huellas_filas(df):
+    """
+    Huella (uint64) del contenido de cada fila, independiente de su posición y de
+    los tipos compactos: las columnas numéricas se comparan como float64 y el resto
+    como texto más el tipo de cada valor (0 y '0' no se validan igual).
+    """
+    normalizado = {}
+    for posicion, col in enumerate(df.columns):
+        serie = df[col]
+        if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            normalizado[f'v{posicion}'] = serie.astype('float64')
+        else:
+            valores = serie.astype(object)
+            normalizado[f'v{posicion}'] = valores.astype('string')
+            normalizado[f't{posicion}'] = valores.map(lambda valor: type(valor).__name__)
+    return pd.util.hash_pandas_object(
+        pd.DataFrame(normalizado, index=df.index), index=False
+    ).to_numpy(dtype=np.uint64)
+
+def _firma(columnas, version_reglas):
+    """Firma de un análisis: versión de las reglas de validación y columnas del archivo"""
+    return json.dumps(
+        {'reglas': version_reglas, 'columnas': [str(col) for col in columnas]}, ensure_ascii=False
+    )
+
+def comparar_analisis(anterior, huellas, con_error):
+    """
+    Alinea las filas del análisis anterior con las actuales por su huella y
+    resume las diferencias: filas modificadas, nuevas y eliminadas y errores
+    resueltos o nuevos. con_error: array booleano por fila actual.
+    Con demasiadas filas distintas no se alinea ('comparable': False) y solo se
+    informa de las filas reutilizadas.
+    """
+    huellas_anteriores = anterior['huellas']
+    errores_anteriores = np.isin(huellas_anteriores, anterior['huellas_con_error'])
+    reutilizadas = int(np.isin(huellas, huellas_anteriores).sum())
+    resumen = {
+        'fecha_anterior': anterior['actualizado'],
+        'filas_reutilizadas': reutilizadas,
+        'comparable': not (len(huellas) and reutilizadas < FRACCION_MINIMA_DIFERENCIAS * len(huellas)),
+        'modificadas': 0, 'nuevas': 0, 'eliminadas': 0,
+        'errores_resueltos': 0, 'errores_nuevos': 0,
+        'filas_modificadas': []
+    }
+    if not resumen['comparable']:
+        return resumen
+
+    comparador = difflib.SequenceMatcher(None, huellas_anteriores.tolist(), huellas.tolist(), autojunk=False)
+    for operacion, i1, i2, j1, j2 in comparador.get_opcodes():
+        if operacion == 'equal':
+            continue
+        emparejadas = min(i2 - i1, j2 - j1) if operacion == 'replace' else 0
+        for i, j in zip(range(i1, i1 + emparejadas), range(j1, j1 + emparejadas)):
+            resumen['modificadas'] += 1
+            resumen['errores_resueltos'] += bool(errores_anteriores[i] and not con_error[j])
+            resumen['errores_nuevos'] += bool(con_error[j] and not errores_anteriores[i])
+            if len(resumen['filas_modificadas']) < MAX_FILAS_LISTADAS:
+                resumen['filas_modificadas'].append(j)
+        eliminadas = range(i1 + emparejadas, i2)
+        nuevas = range(j1 + emparejadas, j2)
+        resumen['eliminadas'] += len(eliminadas)
+        resumen['errores_resueltos'] += int(errores_anteriores[list(eliminadas)].sum()) if len(eliminadas) else 0
+        resumen['nuevas'] += len(nuevas)
+        resumen['errores_nuevos'] += int(con_error[list(nuevas)].sum()) if len(nuevas) else 0
+    return resumen
+
+class HistorialAnalisis:
+    """
+    Historial persistente (SQLite) del último análisis de cada declaración (por
+    usuario y nombre de archivo): firma (versión de las reglas y columnas),
+    huellas de las filas en orden y el resultado de las filas con errores. Al
+    volver a subir el archivo solo se validan las filas cuya huella no estaba en
+    el análisis anterior. Los análisis de más de DIAS_RETENCION_HISTORIAL días
+    se eliminan al guardar.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or RUTA_HISTORIAL_POR_DEFECTO
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analisis (
+                    usuario TEXT NOT NULL,
+                    archivo TEXT NOT NULL,
+                    firma TEXT NOT NULL,
+                    huellas BLOB NOT NULL,
+                    actualizado TEXT,
+                    PRIMARY KEY (usuario, archivo)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS errores (
+                    usuario TEXT NOT NULL,
+                    archivo TEXT NOT NULL,
+                    huella INTEGER NOT NULL,
+                    errores TEXT NOT NULL,
+                    correcciones TEXT NOT NULL,
+                    PRIMARY KEY (usuario, archivo, huella)
+                )
+            """)
+
+    @contextmanager
+    def _conectar(self):
+        """Abre una conexión, confirma la transacción y la cierra al salir"""
+        conn = sqlite3.connect(self.ruta, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def cargar(self, usuario, archivo, columnas, version_reglas):
+        """
+        Último análisis del archivo del usuario con la misma firma, o None.
+        Devuelve {'huellas', 'huellas_con_error', 'resultados': {huella: (errores, correcciones)},
+        'actualizado'}.
+        """
+        with self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT firma, huellas, actualizado FROM analisis WHERE usuario = ? AND archivo = ?",
+                (usuario, archivo)
+            ).fetchone()
+            if fila is None or fila[0] != _firma(columnas, version_reglas):
+                return None
+            errores = conn.execute(
+                "SELECT huella, errores, correcciones FROM errores WHERE usuario = ? AND archivo = ?",
+                (usuario, archivo)
+            ).fetchall()
+
+        # SQLite guarda enteros con signo: las huellas viajan como int64
+        resultados = {
+            int(np.int64(huella).view(np.uint64)): (texto_errores, correcciones)
+            for huella, texto_errores, correcciones in errores
+        }
+        return {
+            'huellas': np.frombuffer(fila[1], dtype=np.uint64),
+            'huellas_con_error': np.fromiter(resultados, dtype=np.uint64, count=len(resultados)),
+            'resultados': resultados,
+            'actualizado': fila[2]
+        }
+
+    def guardar(self, usuario, archivo, columnas, version_reglas, huellas, resultados):
+        """
+        Sustituye el análisis del archivo del usuario y purga los antiguos.
+        resultados: {huella: (errores, correcciones)} de las filas con errores
+        """
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analisis (usuario, archivo, firma, huellas, actualizado) VALUES (?, ?, ?, ?, ?)",
+                (usuario, archivo, _firma(columnas, version_reglas),
+                 np.asarray(huellas, dtype=np.uint64).tobytes(),
+                 datetime.now().isoformat(timespec='seconds'))
+            )
+            conn.execute("DELETE FROM errores WHERE usuario = ? AND archivo = ?", (usuario, archivo))
+            conn.executemany(
+                "INSERT OR REPLACE INTO errores (usuario, archivo, huella, errores, correcciones) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (usuario, archivo, int(np.uint64(huella).view(np.int64)), texto_errores, correcciones)
+                    for huella, (texto_errores, correcciones) in resultados.items()
+                ]
+            )
+        self.purgar()
+
+    def purgar(self, dias=None):
+        """Elimina los análisis (y sus errores) con más de 'dias' de antigüedad"""
+        dias = DIAS_RETENCION_HISTORIAL if dias is None else dias
+        limite = (datetime.now() - timedelta(days=dias)).isoformat(timespec='seconds')
+        with self._conectar() as conn:
+            conn.execute("""
+                DELETE FROM errores WHERE (usuario, archivo) IN (
+                    SELECT usuario, archivo FROM analisis WHERE actualizado < ?
+                )
+            """, (limite,))
+            conn.execute("DELETE FROM analisis WHERE actualizado < ?", (limite,))
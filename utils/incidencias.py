@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+from utils.claves import codificar_comun
+
+# Reglas de incidencia por defecto (reproducen el criterio original: >15% de diferencia
+# de kg y el mismo número de días distintos en ambos sistemas)
+REGLAS_INCIDENCIA_POR_DEFECTO = {
+    'kg_absoluta': 0.0,     # diferencia de kg que se tolera siempre
+    'kg_relativa': 15.0,    # porcentaje de diferencia de kg que se tolera
+    'ventana_dias': 0       # días de desfase con los que una fecha aún tiene pareja
+}
+
+def completar_reglas(reglas=None):
+    """Devuelve las reglas indicadas completadas con los valores por defecto"""
+    return {**REGLAS_INCIDENCIA_POR_DEFECTO, **(reglas or {})}
+
+def a_dias(fechas):
+    """Convierte una serie de fechas a días enteros (desde 1970-01-01); NaT pasa a ser -1"""
+    fechas = pd.to_datetime(pd.Series(fechas, dtype=object), errors='coerce')
+    dias = fechas.values.astype('datetime64[D]').astype('int64')
+    return np.where(fechas.isna().values, -1, dias)
+
+def incidencia_kg(kg_extranet, kg_ervc, porcentaje, reglas):
+    """
+    Marca 'SI' cuando la diferencia de kg supera a la vez la tolerancia absoluta
+    (kg) y la relativa (porcentaje sobre eRVC)
+    """
+    diferencia = np.abs(np.asarray(kg_extranet, dtype=float) - np.asarray(kg_ervc, dtype=float))
+    fuera = (
+        (diferencia > 0) &
+        (diferencia > reglas['kg_absoluta']) &
+        (np.abs(np.asarray(porcentaje, dtype=float)) > reglas['kg_relativa'])
+    )
+    return np.where(fuera, 'SI', 'NO')
+
+def fechas_en_ventana(fechas, fechas_otro, ventana_dias):
+    """
+    Máscara booleana: True si la fecha tiene alguna fecha del otro sistema a como
+    mucho ventana_dias de distancia. Ordena solo las fechas únicas del otro sistema
+    y localiza cada fecha con una búsqueda binaria vectorizada.
+    """
+    dias = a_dias(fechas)
+    otros = np.unique(a_dias(fechas_otro))
+    otros = otros[otros >= 0]
+    if len(otros) == 0:
+        return np.zeros(len(dias), dtype=bool)
+
+    posiciones = np.searchsorted(otros, dias)
+    anterior = otros[np.clip(posiciones - 1, 0, len(otros) - 1)]
+    siguiente = otros[np.clip(posiciones, 0, len(otros) - 1)]
+    distancia = np.minimum(np.abs(dias - anterior), np.abs(siguiente - dias))
+    return (dias >= 0) & (distancia <= ventana_dias)
+
+def dias_sin_pareja(cubo, cubo_otro, clave, ventana_dias):
+    """
+    Cuenta, por clave ('nipd' o 'nif'), los días del cubo sin ningún día de la
+    misma clave en cubo_otro a ±ventana_dias. Usa merge_asof (dirección 'nearest')
+    sobre los días únicos de cada clave.
+
+    Devuelve un DataFrame con la clave y 'dias_sin_pareja' (solo claves con días sin pareja).
+    """
+    dias = cubo[[clave, 'fecha']].drop_duplicates()
+    dias_otro = cubo_otro[[clave, 'fecha']].drop_duplicates()
+    codigos, codigos_otro = codificar_comun(dias[clave], dias_otro[clave])
+
+    izquierda = pd.DataFrame({
+        '_k': codigos, '_dia': a_dias(dias['fecha']), '_fila': np.arange(len(dias))
+    }).sort_values('_dia')
+    derecha = pd.DataFrame({
+        '_k': codigos_otro, '_dia_otro': a_dias(dias_otro['fecha'])
+    }).sort_values('_dia_otro')
+
+    cruce = pd.merge_asof(
+        izquierda, derecha,
+        left_on='_dia', right_on='_dia_otro',
+        by='_k',
+        direction='nearest',
+        tolerance=int(ventana_dias)
+    )
+    sin_pareja = cruce.loc[cruce['_dia_otro'].isna() | (cruce['_dia'] < 0), '_fila'].values
+
+    return dias.iloc[np.sort(sin_pareja)].groupby(
+        clave, observed=True, dropna=False
+    ).size().reset_index(name='dias_sin_pareja')
+
+def incidencia_dias(df, clave_df, cubo_a, cubo_b, clave_cubo, ventana_dias, columnas_dias=None):
+    """
+    Marca 'SI' en las filas de df cuya clave tiene días sin pareja en
+    cualquiera de los dos sistemas dentro de la ventana.
+    Con ventana_dias = 0 y columnas_dias (días distintos de cada sistema en df)
+    se mantiene el criterio original: 'SI' si el número de días no coincide.
+    """
+    if ventana_dias == 0 and columnas_dias is not None:
+        col_a, col_b = columnas_dias
+        return np.where(df[col_a] != df[col_b], 'SI', 'NO')
+
+    sin_pareja = pd.concat([
+        dias_sin_pareja(cubo_a, cubo_b, clave_cubo, ventana_dias),
+        dias_sin_pareja(cubo_b, cubo_a, clave_cubo, ventana_dias)
+    ], ignore_index=True)
+
+    claves_df = pd.Series(np.asarray(df[clave_df], dtype=object))
+    claves_sin_pareja = pd.Series(np.asarray(sin_pareja[clave_cubo], dtype=object))
+    codigos, codigos_sin_pareja = codificar_comun(claves_df, claves_sin_pareja)
+    return np.where(np.isin(codigos, codigos_sin_pareja), 'SI', 'NO')
@@ -0,0 +1,155 @@
+"""
+Intercambio de DataFrames intermedios entre procesos sin pickle.
+
+Una tabla se escribe una sola vez en Arrow IPC sin comprimir y cada proceso
+(trabajador del servicio, partición de la conciliación o la propia página) la
+abre mapeada en memoria: las columnas numéricas sin nulos apuntan directamente
+a las páginas del archivo, que el sistema operativo comparte entre procesos, y
+el resto se convierte desde el mapa sin pasar por un pipe. Con 'filas' solo se
+materializan las filas pedidas.
+
+Los DataFrames con columnas no representables en Arrow (nombres no textuales u
+objetos mezclados) se escriben en pickle, legible solo por el usuario que lo
+escribe. Un pickle solo se abre si está dentro del directorio de confianza que
+indica quien lo abre y es de ese mismo usuario: nunca una ruta cualquiera.
+"""
+import json
+import os
+import pickle
+
+import pandas as pd
+import pyarrow as pa
+
+EXTENSION_TABLA = '.arrow'
+EXTENSION_PICKLE = '.pkl'
+
+# Metadato del esquema Arrow (JSON) con lo que la conversión de pandas no conserva:
+# los attrs del DataFrame y las categóricas con categorías de tipo 'string'
+CLAVE_METADATOS = b'verificacion.metadatos'
+
+class ErrorTabla(ValueError):
+    """Tabla que no se puede abrir (pickle fuera del directorio de confianza)"""
+
+class TablaCompartida:
+    """Referencia ligera (se envía por pickle) a una tabla escrita con escribir_tabla"""
+
+    def __init__(self, ruta, filas, columnas):
+        self.ruta = ruta
+        self.filas = filas
+        self.columnas = columnas
+
+    def abrir(self, filas=None):
+        # La referencia solo llega por canales propios: su directorio es de confianza
+        return abrir_tabla(self.ruta, filas, os.path.dirname(self.ruta))
+
+    def __repr__(self):
+        return f"TablaCompartida({os.path.basename(self.ruta)}, {self.filas} filas, {len(self.columnas)} columnas)"
+
+def escribir_tabla(df, ruta_base):
+    """
+    Escribe df (con índice, categorías y attrs) para compartirlo entre procesos.
+    ruta_base va sin extensión; devuelve la TablaCompartida con la ruta final.
+    """
+    try:
+        if not all(isinstance(col, str) for col in df.columns) or df.columns.duplicated().any():
+            raise TypeError("columnas no representables en Arrow")
+        tabla = pa.Table.from_pandas(df, preserve_index=True)
+        categorias_texto = [
+            col for col, tipo in df.dtypes.items()
+            if isinstance(tipo, pd.CategoricalDtype) and isinstance(tipo.categories.dtype, pd.StringDtype)
+        ]
+        extra = json.dumps({'attrs': dict(df.attrs), 'categorias_texto': categorias_texto})
+    except (TypeError, ValueError, pa.ArrowException):
+        ruta = ruta_base + EXTENSION_PICKLE
+        temporal = f"{ruta}.tmp"
+        with open(os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+        return TablaCompartida(ruta, len(df), list(df.columns))
+
+    metadatos = dict(tabla.schema.metadata or {})
+    metadatos[CLAVE_METADATOS] = extra.encode('utf-8')
+    tabla = tabla.replace_schema_metadata(metadatos)
+
+    # Sin compresión: es lo que permite mapear los buffers tal cual
+    ruta = ruta_base + EXTENSION_TABLA
+    with pa.OSFile(f"{ruta}.tmp", 'wb') as destino, pa.ipc.new_file(destino, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    os.replace(f"{ruta}.tmp", ruta)
+    return TablaCompartida(ruta, len(df), list(df.columns))
+
+def pickle_de_confianza(ruta, directorio):
+    """Si el pickle de ruta está dentro de directorio, es del usuario actual y solo él puede escribirlo"""
+    if directorio is None:
+        return False
+    directorio = os.path.realpath(directorio)
+    real = os.path.realpath(ruta)
+    if os.path.commonpath([real, directorio]) != directorio:
+        return False
+    try:
+        datos = os.stat(real)
+    except OSError:
+        return False
+    propio = not hasattr(os, 'getuid') or datos.st_uid == os.getuid()
+    return propio and not datos.st_mode & 0o022
+
+def abrir_tabla(ruta, filas=None, directorio=None):
+    """
+    Abre una tabla de escribir_tabla mapeada en memoria. Las columnas que no se
+    copian son de solo lectura (asignar columnas nuevas sí está permitido).
+    filas: posiciones a materializar (None: todas).
+    directorio: de confianza para las tablas en pickle (sin él, ErrorTabla).
+    """
+    if ruta.endswith(EXTENSION_PICKLE):
+        if not pickle_de_confianza(ruta, directorio):
+            raise ErrorTabla(f"No se abre la tabla pickle {ruta}: fuera del directorio de confianza o de otro usuario")
+        with open(ruta, 'rb') as f:
+            df = pickle.load(f)
+        return df if filas is None else df.iloc[filas]
+
+    tabla = pa.ipc.open_file(pa.memory_map(ruta, 'r')).read_all()
+    if filas is not None:
+        tabla = tabla.take(pa.array(filas, type=pa.int64()))
+
+    df = tabla.to_pandas(split_blocks=True)
+    metadatos = (tabla.schema.metadata or {}).get(CLAVE_METADATOS)
+    if metadatos:
+        metadatos = json.loads(metadatos)
+        for col in metadatos['categorias_texto']:
+            df[col] = df[col].cat.rename_categories(df[col].cat.categories.astype('string'))
+        df.attrs = metadatos['attrs']
+    return df
+
+def publicar_tablas(valor, directorio, prefijo=''):
+    """
+    Escribe en directorio los DataFrames de valor (un DataFrame o diccionarios
+    anidados) y devuelve la misma estructura con TablaCompartida en su lugar
+    """
+    if isinstance(valor, pd.DataFrame):
+        os.makedirs(directorio, exist_ok=True)
+        return escribir_tabla(valor, os.path.join(directorio, prefijo or 'tabla'))
+    if isinstance(valor, dict):
+        return {
+            clave: publicar_tablas(v, directorio, f"{prefijo}.{clave}" if prefijo else str(clave))
+            for clave, v in valor.items()
+        }
+    return valor
+
+def adjuntar_tablas(valor):
+    """Inversa de publicar_tablas: abre (mapeadas) las TablaCompartida de la estructura"""
+    if isinstance(valor, TablaCompartida):
+        return valor.abrir()
+    if isinstance(valor, dict):
+        return {clave: adjuntar_tablas(v) for clave, v in valor.items()}
+    return valor
+
+def rutas_tablas(valor, prefijo=''):
+    """{'clave' o 'clave.subclave': ruta} de las TablaCompartida de la estructura"""
+    if isinstance(valor, TablaCompartida):
+        return {prefijo: valor.ruta}
+    if isinstance(valor, dict):
+        rutas = {}
+        for clave, v in valor.items():
+            rutas.update(rutas_tablas(v, f"{prefijo}.{clave}" if prefijo else str(clave)))
+        return rutas
+    return {}
@@ -0,0 +1,111 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+# Ruta por defecto de la memoria de matches (configurable por variable de entorno)
+RUTA_MEMORIA_POR_DEFECTO = os.environ.get(
+    'VERIFICACION_MEMORIA_MATCHES',
+    os.path.join(os.path.expanduser('~'), '.verificacion', 'memoria_matches.sqlite')
+)
+
+def nipd_valido(nipd):
+    """NIPD como entero si es numérico ('802400022', 802400022.0); None si no lo es"""
+    if nipd is None:
+        return None
+    texto = str(nipd).strip()
+    if texto.endswith('.0'):
+        texto = texto[:-2]
+    return int(texto) if texto.isdigit() else None
+
+class MemoriaMatches:
+    """
+    Memoria persistente (SQLite) de resoluciones bodega → NIPD confirmadas.
+    Las claves son el nombre de bodega y la zona normalizados (strip + upper),
+    igual que en el matching de comprobaciones.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or RUTA_MEMORIA_POR_DEFECTO
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS resoluciones (
+                    clave TEXT NOT NULL,
+                    zona TEXT NOT NULL,
+                    nipd INTEGER NOT NULL,
+                    origen TEXT,
+                    actualizado TEXT,
+                    PRIMARY KEY (clave, zona)
+                )
+            """)
+
+    @contextmanager
+    def _conectar(self):
+        """Abre una conexión, confirma la transacción y la cierra al salir"""
+        conn = sqlite3.connect(self.ruta, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def normalizar(valor):
+        """Normaliza un nombre o zona igual que el matcher"""
+        return str(valor).strip().upper()
+
+    def cargar(self):
+        """
+        Devuelve todas las resoluciones como diccionario {(clave, zona): nipd}
+        para consultarlas en O(1) durante el matching
+        """
+        with self._conectar() as conn:
+            filas = conn.execute("SELECT clave, zona, nipd FROM resoluciones").fetchall()
+        # Versiones anteriores guardaban como texto los NIPD no numéricos: no se aplican
+        return {(clave, zona): nipd for clave, zona, nipd in filas if isinstance(nipd, int)}
+
+    def confirmar(self, resoluciones, origen='manual'):
+        """
+        Guarda (o actualiza) resoluciones confirmadas.
+        resoluciones: iterable de tuplas (clave, zona, nipd)
+        Los NIPD vacíos o no numéricos se omiten (no se guardan como resolución).
+        Devuelve el número de resoluciones guardadas.
+        """
+        ahora = datetime.now().isoformat(timespec='seconds')
+        filas = []
+        for clave, zona, nipd in resoluciones:
+            nipd_valor = nipd_valido(nipd)
+            if nipd_valor is None:
+                continue
+            filas.append((self.normalizar(clave), self.normalizar(zona), nipd_valor, origen, ahora))
+
+        if not filas:
+            return 0
+
+        with self._conectar() as conn:
+            conn.executemany("""
+                INSERT INTO resoluciones (clave, zona, nipd, origen, actualizado)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (clave, zona) DO UPDATE SET
+                    nipd = excluded.nipd,
+                    origen = excluded.origen,
+                    actualizado = excluded.actualizado
+            """, filas)
+
+        return len(filas)
+
+    def olvidar(self, clave, zona):
+        """Elimina una resolución de la memoria"""
+        with self._conectar() as conn:
+            conn.execute(
+                "DELETE FROM resoluciones WHERE clave = ? AND zona = ?",
+                (self.normalizar(clave), self.normalizar(zona))
+            )
+
+    def __len__(self):
+        with self._conectar() as conn:
+            return conn.execute("SELECT COUNT(*) FROM resoluciones").fetchone()[0]
@@ -0,0 +1,293 @@
+import atexit
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+
+import pandas as pd
+
+# Presupuestos de memoria (MB) y tiempos de inactividad (minutos), configurables por entorno
+PRESUPUESTO_SESION_MB = float(os.environ.get('VERIFICACION_PRESUPUESTO_SESION_MB', 512))
+PRESUPUESTO_GLOBAL_MB = float(os.environ.get('VERIFICACION_PRESUPUESTO_GLOBAL_MB', 2048))
+MINUTOS_INACTIVIDAD_VOLCADO = float(os.environ.get('VERIFICACION_MINUTOS_VOLCADO', 10))
+MINUTOS_INACTIVIDAD_EXPULSION = float(os.environ.get('VERIFICACION_MINUTOS_EXPULSION', 120))
+
+# Directorio de volcado (un subdirectorio por proceso y por sesión)
+DIRECTORIO_VOLCADO = os.environ.get(
+    'VERIFICACION_DIRECTORIO_VOLCADO',
+    os.path.join(tempfile.gettempdir(), 'verificacion_sesiones')
+)
+
+# Por debajo de este tamaño no compensa volcar a disco
+TAMANO_MINIMO_VOLCADO = 1024 * 1024
+
+MB = 1024 * 1024
+
+class SesionCaducada(Exception):
+    """Los datos de la sesión se expulsaron por inactividad"""
+
+def tamano_valor(valor):
+    """Bytes aproximados que ocupa un DataFrame o un bloque de bytes en memoria"""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    return len(valor)
+
+class EntradaSesion:
+    """
+    Referencia a un DataFrame (o bytes) de una sesión. El valor puede estar en
+    memoria o volcado a disco; al leer 'valor' se recarga si hace falta.
+    """
+
+    def __init__(self, gestor, id_sesion, clave, valor):
+        self._gestor = gestor
+        self.id_sesion = id_sesion
+        self.clave = clave
+        self.es_dataframe = isinstance(valor, pd.DataFrame)
+        self.attrs = dict(valor.attrs) if self.es_dataframe else {}
+        self.bytes = tamano_valor(valor)
+        self.ruta = None
+        self.expulsada = False
+        self.ultimo_acceso = time.monotonic()
+        self._valor = valor
+
+    @property
+    def en_memoria(self):
+        return self._valor is not None
+
+    @property
+    def valor(self):
+        return self._gestor.cargar(self)
+
+class DiccionarioSesion(Mapping):
+    """
+    Diccionario de solo lectura cuyos valores grandes (DataFrames y bytes) se
+    guardan como entradas del gestor; los diccionarios anidados se tratan igual
+    y el resto se conserva tal cual
+    """
+
+    def __init__(self, gestor, id_sesion, prefijo, valores):
+        self._valores = {}
+        for nombre, valor in valores.items():
+            if isinstance(valor, (pd.DataFrame, bytes)):
+                valor = gestor.guardar(id_sesion, f"{prefijo}/{nombre}", valor)
+            elif isinstance(valor, dict):
+                valor = DiccionarioSesion(gestor, id_sesion, f"{prefijo}/{nombre}", valor)
+            self._valores[nombre] = valor
+
+    def __getitem__(self, nombre):
+        valor = self._valores[nombre]
+        return valor.valor if isinstance(valor, EntradaSesion) else valor
+
+    def __iter__(self):
+        return iter(self._valores)
+
+    def __len__(self):
+        return len(self._valores)
+
+class GestorMemoriaSesiones:
+    """
+    Controla la memoria de los datos de todas las sesiones del proceso.
+
+    - Presupuesto por sesión y global: al superarlo se vuelcan a disco (Feather,
+      columnar y comprimido) las entradas usadas hace más tiempo.
+    - Las entradas volcadas se recargan al leerlas.
+    - Sesiones inactivas: se vuelcan tras MINUTOS_INACTIVIDAD_VOLCADO y se
+      expulsan (se borran sus datos) tras MINUTOS_INACTIVIDAD_EXPULSION.
+    """
+
+    def __init__(self, directorio=None, presupuesto_sesion_mb=PRESUPUESTO_SESION_MB,
+                 presupuesto_global_mb=PRESUPUESTO_GLOBAL_MB,
+                 minutos_volcado=MINUTOS_INACTIVIDAD_VOLCADO,
+                 minutos_expulsion=MINUTOS_INACTIVIDAD_EXPULSION):
+        self.directorio = os.path.join(directorio or DIRECTORIO_VOLCADO, f"proceso_{os.getpid()}")
+        self.presupuesto_sesion = presupuesto_sesion_mb * MB
+        self.presupuesto_global = presupuesto_global_mb * MB
+        self.segundos_volcado = minutos_volcado * 60
+        self.segundos_expulsion = minutos_expulsion * 60
+        self._bloqueo = threading.RLock()
+        self._sesiones = {}
+
+    def _sesion(self, id_sesion):
+        sesion = self._sesiones.get(id_sesion)
+        if sesion is None:
+            sesion = self._sesiones[id_sesion] = {'entradas': {}, 'ultima_actividad': time.monotonic()}
+        return sesion
+
+    def tocar(self, id_sesion):
+        """Registra actividad de la sesión"""
+        with self._bloqueo:
+            self._sesion(id_sesion)['ultima_actividad'] = time.monotonic()
+
+    def guardar(self, id_sesion, clave, valor):
+        """Guarda un DataFrame o bytes de la sesión (sustituye la entrada anterior con la misma clave)"""
+        with self._bloqueo:
+            sesion = self._sesion(id_sesion)
+            self.descartar(id_sesion, clave)
+
+            entrada = EntradaSesion(self, id_sesion, clave, valor)
+            sesion['entradas'][clave] = entrada
+            sesion['ultima_actividad'] = entrada.ultimo_acceso
+            self._aplicar_presupuestos(id_sesion, proteger=entrada)
+            return entrada
+
+    def cargar(self, entrada):
+        """Devuelve el valor de la entrada, recargándolo de disco si estaba volcado"""
+        with self._bloqueo:
+            if entrada.expulsada:
+                raise SesionCaducada(
+                    "Los datos de la sesión se liberaron por inactividad. Vuelve a cargar los archivos."
+                )
+
+            entrada.ultimo_acceso = time.monotonic()
+            self._sesion(entrada.id_sesion)['ultima_actividad'] = entrada.ultimo_acceso
+
+            if entrada._valor is None:
+                entrada._valor = self._leer_volcado(entrada)
+                # El valor recargado puede modificarse: el próximo volcado lo reescribe
+                self._borrar_volcado(entrada)
+                self._aplicar_presupuestos(entrada.id_sesion, proteger=entrada)
+            return entrada._valor
+
+    def descartar(self, id_sesion, clave=None):
+        """
+        Elimina la entrada 'clave' y las que cuelgan de ella ('clave/...'),
+        o todas las de la sesión si clave es None
+        """
+        with self._bloqueo:
+            sesion = self._sesiones.get(id_sesion)
+            if sesion is None:
+                return
+            claves = [
+                c for c in sesion['entradas']
+                if clave is None or c == clave or c.startswith(f"{clave}/")
+            ]
+            for c in claves:
+                entrada = sesion['entradas'].pop(c, None)
+                if entrada is not None:
+                    self._borrar_volcado(entrada)
+                    entrada._valor = None
+                    entrada.expulsada = True
+
+    def mantenimiento(self):
+        """Vuelca las sesiones inactivas y expulsa las que llevan demasiado tiempo sin uso"""
+        ahora = time.monotonic()
+        with self._bloqueo:
+            for id_sesion, sesion in list(self._sesiones.items()):
+                inactividad = ahora - sesion['ultima_actividad']
+                if inactividad > self.segundos_expulsion:
+                    self.descartar(id_sesion)
+                    shutil.rmtree(os.path.join(self.directorio, id_sesion), ignore_errors=True)
+                    del self._sesiones[id_sesion]
+                elif inactividad > self.segundos_volcado:
+                    for entrada in sesion['entradas'].values():
+                        self._volcar(entrada)
+
+    def uso(self, id_sesion=None):
+        """Bytes en memoria y en disco (de una sesión o de todo el proceso)"""
+        with self._bloqueo:
+            entradas = self._entradas(id_sesion)
+            return {
+                'memoria': sum(e.bytes for e in entradas if e.en_memoria),
+                'disco': sum(os.path.getsize(e.ruta) for e in entradas if e.ruta and os.path.exists(e.ruta)),
+                'entradas': len(entradas),
+                'sesiones': len(self._sesiones) if id_sesion is None else 1
+            }
+
+    def limpiar(self):
+        """Borra todos los volcados del proceso"""
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    def _entradas(self, id_sesion=None):
+        if id_sesion is not None:
+            sesion = self._sesiones.get(id_sesion)
+            return list(sesion['entradas'].values()) if sesion else []
+        return [e for sesion in self._sesiones.values() for e in sesion['entradas'].values()]
+
+    def _aplicar_presupuestos(self, id_sesion, proteger=None):
+        """Vuelca las entradas menos usadas hasta cumplir el presupuesto de la sesión y el global"""
+        for entradas, presupuesto in (
+            (self._entradas(id_sesion), self.presupuesto_sesion),
+            (self._entradas(), self.presupuesto_global)
+        ):
+            en_memoria = [e for e in entradas if e.en_memoria]
+            ocupado = sum(e.bytes for e in en_memoria)
+            for entrada in sorted(en_memoria, key=lambda e: e.ultimo_acceso):
+                if ocupado <= presupuesto:
+                    break
+                if entrada is not proteger and self._volcar(entrada):
+                    ocupado -= entrada.bytes
+
+    def _volcar(self, entrada):
+        """Escribe la entrada a disco y libera su memoria"""
+        if not entrada.en_memoria or entrada.bytes < TAMANO_MINIMO_VOLCADO:
+            return False
+
+        directorio = os.path.join(self.directorio, entrada.id_sesion)
+        os.makedirs(directorio, exist_ok=True)
+        entrada.ruta = self._escribir(entrada._valor, os.path.join(directorio, uuid.uuid4().hex))
+        entrada._valor = None
+        return True
+
+    @staticmethod
+    def _escribir(valor, ruta):
+        """Escribe el valor en Feather (columnar, zstd); si no es representable en Arrow, en pickle"""
+        if not isinstance(valor, pd.DataFrame):
+            ruta += '.bin'
+            with open(ruta, 'wb') as f:
+                f.write(valor)
+            return ruta
+
+        nombre_indice = valor.index.name
+        try:
+            tabla = valor.reset_index(names='__indice__')
+            if not all(isinstance(col, str) for col in tabla.columns) or tabla.columns.duplicated().any():
+                raise TypeError("columnas no representables en Feather")
+            ruta_feather = ruta + '.feather'
+            tabla.to_feather(ruta_feather, compression='zstd')
+            # El nombre del índice se recupera al leer
+            with open(ruta_feather + '.indice', 'wb') as f:
+                pickle.dump(nombre_indice, f)
+            return ruta_feather
+        except Exception:
+            ruta += '.pkl'
+            valor.to_pickle(ruta)
+            return ruta
+
+    @staticmethod
+    def _leer_volcado(entrada):
+        """Recarga el valor volcado"""
+        if entrada.ruta.endswith('.bin'):
+            with open(entrada.ruta, 'rb') as f:
+                return f.read()
+        if entrada.ruta.endswith('.pkl'):
+            return pd.read_pickle(entrada.ruta)
+
+        df = pd.read_feather(entrada.ruta).set_index('__indice__')
+        with open(entrada.ruta + '.indice', 'rb') as f:
+            df.index.name = pickle.load(f)
+        df.attrs = dict(entrada.attrs)
+        return df
+
+    @staticmethod
+    def _borrar_volcado(entrada):
+        if entrada.ruta:
+            for ruta in (entrada.ruta, entrada.ruta + '.indice'):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            entrada.ruta = None
+
+_gestor = None
+_bloqueo_gestor = threading.Lock()
+
+def gestor_global():
+    """Gestor único del proceso (compartido por todas las sesiones)"""
+    global _gestor
+    with _bloqueo_gestor:
+        if _gestor is None:
+            _gestor = GestorMemoriaSesiones()
+            atexit.register(_gestor.limpiar)
+        return _gestor
@@ -0,0 +1,316 @@
+"""
+Corrección de un .xlsx sin pasar por el modelo de openpyxl.
+
+El libro se trata como el ZIP que es: todas las partes (estilos, cadenas
+compartidas, otras hojas, imágenes...) se copian tal cual y solo se reescribe
+el XML de la hoja activa, fila a fila y sin cargarlo entero en memoria: se
+sustituyen las celdas indicadas, se quitan las filas eliminadas y se
+renumeran las siguientes junto con la dimensión, las celdas combinadas, el
+autofiltro, los formatos condicionales, las validaciones y los hipervínculos.
+Como con openpyxl, el texto de las fórmulas no se traduce.
+
+Lo que no se sabe desplazar con seguridad (fórmulas compartidas o tablas por
+debajo de una fila eliminada, un rango que desaparece entero...) lanza
+ErrorParcheXlsx para que el llamador recurra a openpyxl.
+"""
+import bisect
+import codecs
+import posixpath
+import re
+import shutil
+import zipfile
+from io import BytesIO
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from openpyxl.utils import get_column_letter
+
+# Bytes del XML de la hoja que se leen de una vez
+TAMANO_BLOQUE = 1 << 20
+
+NS_RELACIONES = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+NS_LIBRO = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+NS_ID_RELACION = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+
+# Celda o extremo de rango: columna y fila opcionales ('A1', '$B$7', 'C', '12')
+PATRON_REFERENCIA = re.compile(r'^(\$?[A-Za-z]{0,3})(\$?)(\d*)$')
+
+class ErrorParcheXlsx(Exception):
+    """El libro tiene algo que el parche no sabe tratar"""
+    pass
+
+def _leer_xml(zin, nombre):
+    try:
+        return ElementTree.fromstring(zin.read(nombre))
+    except (KeyError, ElementTree.ParseError) as e:
+        raise ErrorParcheXlsx(f"Parte '{nombre}' ausente o ilegible") from e
+
+def _ruta_relacion(origen, destino):
+    """Ruta dentro del ZIP del destino de una relación de la parte origen"""
+    if destino.startswith('/'):
+        return destino.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(origen), destino))
+
+def _ruta_relaciones(parte):
+    return posixpath.join(posixpath.dirname(parte), '_rels', posixpath.basename(parte) + '.rels')
+
+def localizar_hoja_activa(zin):
+    """Devuelve (ruta del libro, ruta de la hoja activa) dentro del ZIP"""
+    libro = None
+    for relacion in _leer_xml(zin, '_rels/.rels').iter(f'{NS_RELACIONES}Relationship'):
+        if relacion.get('Type', '').endswith('/officeDocument'):
+            libro = _ruta_relacion('', relacion.get('Target'))
+    if libro is None:
+        raise ErrorParcheXlsx("El paquete no tiene libro")
+
+    xml_libro = _leer_xml(zin, libro)
+    vista = xml_libro.find(f'{NS_LIBRO}bookViews/{NS_LIBRO}workbookView')
+    activa = int(vista.get('activeTab', 0)) if vista is not None else 0
+    hojas = xml_libro.findall(f'{NS_LIBRO}sheets/{NS_LIBRO}sheet')
+    if not hojas:
+        raise ErrorParcheXlsx("El libro no tiene hojas")
+    id_relacion = hojas[min(activa, len(hojas) - 1)].get(NS_ID_RELACION)
+
+    for relacion in _leer_xml(zin, _ruta_relaciones(libro)).iter(f'{NS_RELACIONES}Relationship'):
+        if relacion.get('Id') == id_relacion:
+            return libro, _ruta_relacion(libro, relacion.get('Target'))
+    raise ErrorParcheXlsx("No se encuentra la hoja activa")
+
+class _Desplazamiento:
+    """Renumeración de filas tras quitar las filas eliminadas"""
+
+    def __init__(self, eliminadas):
+        self.eliminadas = sorted(set(eliminadas))
+        self._conjunto = set(self.eliminadas)
+
+    def eliminada(self, fila):
+        return fila in self._conjunto
+
+    def nueva(self, fila, final=False):
+        """Nuevo número de una fila; si está eliminada, el de la siguiente (o la anterior con final)"""
+        buscar = bisect.bisect_right if final else bisect.bisect_left
+        return fila - buscar(self.eliminadas, fila)
+
+    def rango(self, rango):
+        """Desplaza 'A1:B5' o 'A3'; None si todas sus filas desaparecen"""
+        extremos = rango.split(':')
+        if len(extremos) > 2:
+            raise ErrorParcheXlsx(f"Rango no reconocido: {rango}")
+        partes = []
+        for extremo in extremos:
+            m = PATRON_REFERENCIA.match(extremo)
+            if not m:
+                raise ErrorParcheXlsx(f"Referencia no reconocida: {extremo}")
+            partes.append(m.groups())
+        if all(not fila for _, _, fila in partes):
+            return rango  # rango de columnas completas
+
+        inicio = int(partes[0][2])
+        fin = int(partes[-1][2])
+        nuevo_inicio = self.nueva(inicio)
+        nuevo_fin = self.nueva(fin, final=True)
+        if nuevo_inicio > nuevo_fin:
+            return None
+        filas = [nuevo_inicio, nuevo_fin][:len(partes)]
+        return ':'.join(f"{columna}{dolar}{fila}" for (columna, dolar, _), fila in zip(partes, filas))
+
+    def lista(self, lista):
+        """Desplaza una lista sqref ('A1:A5 C3'); None si desaparece entera"""
+        rangos = [self.rango(rango) for rango in lista.split()]
+        rangos = [rango for rango in rangos if rango is not None]
+        return ' '.join(rangos) if rangos else None
+
+class _TransformadorHoja:
+    """Reescribe el XML de una hoja en streaming"""
+
+    def __init__(self, celdas, eliminadas):
+        self.celdas = celdas
+        self.desplazamiento = _Desplazamiento(eliminadas)
+        self.prefijo = ''
+
+    def _compilar(self, prefijo):
+        p = re.escape(prefijo)
+        self.prefijo = prefijo
+        self.re_fila = re.compile(rf'\s*(?:(<{p}row\b[^>]*?(?:/>|>.*?</{p}row>))|(</{p}sheetData>))', re.S)
+        self.re_etiqueta_fila = re.compile(rf'<{p}row\b([^>]*?)(/?)>')
+        self.re_celda = re.compile(rf'<{p}c\b([^>]*?)(?:/>|>(.*?)</{p}c>)', re.S)
+        self.re_atributo_r = re.compile(r'(\sr=")([A-Za-z]*)(\d+)(")')
+        self.re_atributo_t = re.compile(r'\st="[^"]*"')
+
+    def transformar(self, origen, destino):
+        """origen: parte de la hoja abierta del ZIP; destino: parte nueva abierta para escritura"""
+        decodificador = codecs.getincrementaldecoder('utf-8')()
+        texto = ''
+        estado = 'cabecera'
+        fin = False
+        while True:
+            if not fin:
+                datos = origen.read(TAMANO_BLOQUE)
+                fin = not datos
+                texto += decodificador.decode(datos, final=fin)
+
+            if estado == 'cabecera':
+                m = re.search(r'<(\w+:)?sheetData\b[^>]*?(/?)>', texto)
+                if m is None:
+                    if fin:
+                        raise ErrorParcheXlsx("La hoja no tiene sheetData")
+                    continue
+                self._compilar(m.group(1) or '')
+                destino.write(self._cabecera(texto[:m.end()]).encode('utf-8'))
+                texto = texto[m.end():]
+                estado = 'cola' if m.group(2) else 'filas'
+
+            if estado == 'filas':
+                salida = []
+                posicion = 0
+                while True:
+                    m = self.re_fila.match(texto, posicion)
+                    if m is None:
+                        break
+                    posicion = m.end()
+                    if m.group(2):
+                        salida.append(m.group(0))
+                        estado = 'cola'
+                        break
+                    fila = self._fila(m.group(1))
+                    if fila is not None:
+                        salida.append(texto[m.start():m.start(1)] + fila)
+                destino.write(''.join(salida).encode('utf-8'))
+                texto = texto[posicion:]
+                if estado == 'filas' and fin:
+                    raise ErrorParcheXlsx("sheetData sin cerrar o con contenido no reconocido")
+
+            if estado == 'cola' and fin:
+                destino.write(self._cola(texto).encode('utf-8'))
+                return
+
+    def _cabecera(self, cabecera):
+        p = re.escape(self.prefijo)
+
+        def dimension(m):
+            rango = self.desplazamiento.rango(m.group(2))
+            return f"{m.group(1)}{rango or 'A1'}{m.group(3)}"
+
+        return re.sub(rf'(<{p}dimension\b[^>]*?\bref=")([^"]*)(")', dimension, cabecera)
+
+    def _fila(self, fila):
+        etiqueta = self.re_etiqueta_fila.match(fila)
+        numero = re.search(r'\sr="(\d+)"', etiqueta.group(1))
+        if numero is None:
+            raise ErrorParcheXlsx("Fila sin número (atributo r)")
+        numero = int(numero.group(1))
+        if self.desplazamiento.eliminada(numero):
+            return None
+
+        nueva = self.desplazamiento.nueva(numero)
+        celdas = self.celdas.get(numero)
+        if nueva == numero and not celdas:
+            return fila
+        if nueva != numero and 't="shared"' in fila:
+            raise ErrorParcheXlsx(f"Fórmulas compartidas en la fila {numero}")
+
+        pendientes = dict(celdas or {})
+        p = self.prefijo
+
+        def celda(m):
+            atributos = m.group(1)
+            r = self.re_atributo_r.search(atributos)
+            if r is None:
+                raise ErrorParcheXlsx(f"Celda sin referencia en la fila {numero}")
+            atributos = self.re_atributo_r.sub(lambda a: f"{a.group(1)}{a.group(2)}{nueva}{a.group(4)}", atributos, count=1)
+            columna = r.group(2).upper()
+            if columna in pendientes:
+                atributos = self.re_atributo_t.sub('', atributos)
+                valor = escape(pendientes.pop(columna))
+                return f'<{p}c{atributos} t="inlineStr"><{p}is><{p}t>{valor}</{p}t></{p}is></{p}c>'
+            if nueva == numero:
+                return m.group(0)
+            return m.group(0).replace(m.group(1), atributos, 1)
+
+        etiqueta_nueva = re.sub(r'(\sr=")\d+(")', rf'\g<1>{nueva}\g<2>', etiqueta.group(0), count=1)
+        cuerpo = self.re_celda.sub(celda, fila[etiqueta.end():])
+        if pendientes:
+            raise ErrorParcheXlsx(f"Fila {numero}: no existen las celdas {sorted(pendientes)}")
+        return etiqueta_nueva + cuerpo
+
+    def _cola(self, cola):
+        """Rangos que siguen a sheetData: combinadas, autofiltro, formatos condicionales, validaciones, vínculos"""
+        if not self.desplazamiento.eliminadas:
+            return cola
+        p = re.escape(self.prefijo)
+        if re.search(rf'<{p}tablePart\b', cola):
+            raise ErrorParcheXlsx("La hoja tiene tablas")
+
+        def combinada(m):
+            rango = self.desplazamiento.rango(m.group(2))
+            return '' if rango is None else f"{m.group(1)}{rango}{m.group(3)}"
+
+        cola = re.sub(rf'(<{p}mergeCell\b[^>]*?\bref=")([^"]*)("[^>]*?/>)', combinada, cola)
+        combinadas = len(re.findall(rf'<{p}mergeCell\b', cola))
+        if combinadas:
+            cola = re.sub(rf'(<{p}mergeCells\b[^>]*?\bcount=")\d+(")', rf'\g<1>{combinadas}\g<2>', cola)
+        else:
+            cola = re.sub(rf'<{p}mergeCells\b[^>]*?(?:/>|>\s*</{p}mergeCells>)', '', cola)
+
+        def referencia(m):
+            desplazar = self.desplazamiento.lista if m.group(2) == 'sqref' else self.desplazamiento.rango
+            rango = desplazar(m.group(3))
+            if rango is None:
+                raise ErrorParcheXlsx(f"El rango {m.group(3)} desaparece al eliminar filas")
+            return f'{m.group(1)}{m.group(2)}="{rango}"'
+
+        return re.sub(
+            rf'(<{p}(?:autoFilter|conditionalFormatting|dataValidation|hyperlink)\b[^>]*?\s)(sqref|ref)="([^"]*)"',
+            referencia, cola
+        )
+
+def _sin_cadena_calculo(xml, ruta):
+    """Quita la referencia a calcChain.xml de [Content_Types].xml o de las relaciones del libro"""
+    nombre = re.escape(posixpath.basename(ruta))
+    return re.sub(rf'<(?:\w+:)?(?:Override|Relationship)\b[^>]*?{nombre}"[^>]*?/>', '', xml.decode('utf-8')).encode('utf-8')
+
+def parchear_hoja_activa(origen, celdas=None, filas_eliminar=None):
+    """
+    Corrige la hoja activa del .xlsx origen (ruta o bytes) y devuelve los bytes del libro.
+
+    - celdas: {(fila, columna): texto} con fila y columna de Excel (1 = A); se
+      escriben como texto en línea conservando el estilo de la celda
+    - filas_eliminar: números de fila de Excel que desaparecen; las siguientes suben
+
+    Lanza ErrorParcheXlsx si el libro no se puede parchear.
+    """
+    por_fila = {}
+    for (fila, columna), texto in (celdas or {}).items():
+        por_fila.setdefault(fila, {})[get_column_letter(columna)] = str(texto)
+    filas_eliminar = list(filas_eliminar or [])
+
+    if isinstance(origen, (bytes, bytearray)):
+        origen = BytesIO(origen)
+    salida = BytesIO()
+    try:
+        with zipfile.ZipFile(origen) as zin, zipfile.ZipFile(salida, 'w') as zout:
+            libro, hoja = localizar_hoja_activa(zin)
+            # La cadena de cálculo apunta a celdas por posición: Excel la rehace si falta
+            cadena_calculo = None
+            if filas_eliminar:
+                for relacion in _leer_xml(zin, _ruta_relaciones(libro)).iter(f'{NS_RELACIONES}Relationship'):
+                    if relacion.get('Type', '').endswith('/calcChain'):
+                        cadena_calculo = _ruta_relacion(libro, relacion.get('Target'))
+
+            for info in zin.infolist():
+                if info.filename == cadena_calculo:
+                    continue
+                nueva = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                nueva.compress_type = info.compress_type
+                nueva.external_attr = info.external_attr
+                if info.filename == hoja:
+                    with zin.open(info) as lectura, zout.open(nueva, 'w') as escritura:
+                        _TransformadorHoja(por_fila, filas_eliminar).transformar(lectura, escritura)
+                elif cadena_calculo and info.filename in ('[Content_Types].xml', _ruta_relaciones(libro)):
+                    zout.writestr(nueva, _sin_cadena_calculo(zin.read(info), cadena_calculo))
+                else:
+                    with zin.open(info) as lectura, zout.open(nueva, 'w') as escritura:
+                        shutil.copyfileobj(lectura, escritura, TAMANO_BLOQUE)
+    except (zipfile.BadZipFile, UnicodeDecodeError) as e:
+        raise ErrorParcheXlsx(f"Archivo no válido: {e}") from e
+    return salida.getvalue()
@@ -0,0 +1,122 @@
+import cProfile
+import marshal
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# Perfilado activo por defecto (además del interruptor de la barra lateral)
+PERFILADO_POR_DEFECTO = os.environ.get('VERIFICACION_PERFILADO', '').strip().lower() in ('1', 'true', 'si', 'sí')
+FUNCIONES_INFORME = 30
+LINEAS_INFORME = 20
+INFORMES_POR_SESION = 10
+MB = 1024 * 1024
+
+# tracemalloc es global del proceso: los perfilados simultáneos lo comparten
+# y solo el último en salir lo detiene (si lo arrancó el primero)
+_cerrojo_traza = threading.Lock()
+_perfilados_activos = 0
+_perfilados_iniciados = 0
+_traza_propia = False
+
+NOTA_PROCESOS_HIJOS = (
+    "Solo se mide el proceso que ejecuta el paso: el trabajo de sus procesos hijos "
+    "(lectura en paralelo, conciliación por particiones) no aparece en tiempos ni memoria."
+)
+NOTA_PICO_COMPARTIDO = (
+    "Hubo otro perfilado a la vez en este proceso: el pico de memoria incluye también sus asignaciones."
+)
+
+# Asignaciones internas del propio perfilado que no interesan en el informe
+FILTROS_ASIGNACIONES = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<unknown>')
+]
+
+def _tabla_funciones(estadisticas, limite=FUNCIONES_INFORME):
+    """Funciones con más tiempo acumulado (incluidas sus llamadas)"""
+    filas = [
+        {
+            'funcion': f"{funcion} ({os.path.basename(archivo)}:{linea})",
+            'llamadas': llamadas,
+            'tiempo_propio': tiempo_propio,
+            'tiempo_acumulado': tiempo_acumulado
+        }
+        for (archivo, linea, funcion), (_, llamadas, tiempo_propio, tiempo_acumulado, _) in estadisticas.items()
+    ]
+    tabla = pd.DataFrame(filas, columns=['funcion', 'llamadas', 'tiempo_propio', 'tiempo_acumulado'])
+    return tabla.sort_values('tiempo_acumulado', ascending=False).head(limite).reset_index(drop=True)
+
+def _tabla_asignaciones(inicio, fin, limite=LINEAS_INFORME):
+    """Líneas que más memoria han asignado durante el paso (vivas al terminar)"""
+    diferencias = fin.filter_traces(FILTROS_ASIGNACIONES).compare_to(
+        inicio.filter_traces(FILTROS_ASIGNACIONES), 'lineno'
+    )
+    filas = [
+        {
+            'linea': f"{os.path.basename(d.traceback[0].filename)}:{d.traceback[0].lineno}",
+            'archivo': d.traceback[0].filename,
+            'mb': d.size_diff / MB,
+            'bloques': d.count_diff
+        }
+        for d in diferencias[:limite] if d.size_diff > 0
+    ]
+    return pd.DataFrame(filas, columns=['linea', 'archivo', 'mb', 'bloques'])
+
+@contextmanager
+def perfilar(nombre):
+    """
+    Perfila el bloque con cProfile y tracemalloc. Produce un diccionario que se
+    completa al salir (también si el bloque lanza una excepción) con:
+    'nombre', 'fecha', 'segundos', 'pico_mb', 'funciones' (DataFrame por tiempo
+    acumulado), 'asignaciones' (DataFrame por línea), 'prof' (bytes del .prof,
+    legibles con pstats/snakeviz) y 'notas' (limitaciones de la medida).
+    """
+    global _perfilados_activos, _perfilados_iniciados, _traza_propia
+    informe = {'nombre': nombre, 'fecha': datetime.now(), 'notas': [NOTA_PROCESOS_HIJOS]}
+    with _cerrojo_traza:
+        if _perfilados_activos == 0:
+            _traza_propia = not tracemalloc.is_tracing()
+            if _traza_propia:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+        _perfilados_activos += 1
+        _perfilados_iniciados += 1
+        iniciados_al_entrar = _perfilados_iniciados
+        # Con otro perfilado en curso no se reinicia el pico, que es también el suyo
+        pico_compartido = _perfilados_activos > 1
+    inicio_memoria = tracemalloc.take_snapshot()
+    perfil = cProfile.Profile()
+
+    inicio = time.perf_counter()
+    perfil.enable()
+    try:
+        yield informe
+    finally:
+        perfil.disable()
+        informe['segundos'] = time.perf_counter() - inicio
+        with _cerrojo_traza:
+            fin_memoria = tracemalloc.take_snapshot()
+            _, pico = tracemalloc.get_traced_memory()
+            # Compartido si otro perfilado empezó antes y seguía, o empezó después
+            pico_compartido = pico_compartido or _perfilados_iniciados != iniciados_al_entrar
+            _perfilados_activos -= 1
+            if _perfilados_activos == 0 and _traza_propia:
+                tracemalloc.stop()
+        if pico_compartido:
+            informe['notas'].append(NOTA_PICO_COMPARTIDO)
+
+        # pstats.Stats se queda con las estadísticas del perfil (mismo formato que dump_stats)
+        estadisticas = pstats.Stats(perfil).stats
+        informe['pico_mb'] = pico / MB
+        informe['funciones'] = _tabla_funciones(estadisticas)
+        informe['asignaciones'] = _tabla_asignaciones(inicio_memoria, fin_memoria)
+        informe['prof'] = marshal.dumps(estadisticas)
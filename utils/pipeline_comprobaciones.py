@@ -0,0 +1,788 @@
+"""
+Pipeline de comprobaciones sin Streamlit: enriquecimiento con NIPD, preparación de
+fechas, agregación, conciliación y reporte Excel.
+
+El progreso se comunica con un callback progreso(nivel, mensaje), con nivel en
+NIVELES_PROGRESO; la página lo traduce a st.info/st.success/... y la línea de
+comandos (cli_comprobaciones.py) lo escribe por consola. Los errores que impiden
+continuar se lanzan como ErrorComprobaciones.
+"""
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.carga import (
+    cargar_archivos_comprobaciones, hoja_para_zona, HOJA_POR_DEFECTO,
+    COLUMNAS_FECHA_ERVC, DOS_ERVC
+)
+from utils.fechas import normalizar_fechas
+from utils.claves import normalizar_nipd, unificar_categorias
+from utils.excel import crear_excel_streaming, FORMATO_FECHA
+from utils.agregacion import construir_cubo, consolidar_por_nipd, consolidar_por_nif
+from utils.almacen_agregados import AlmacenAgregados, actualizar_cubo_incremental
+from utils.incidencias import completar_reglas, incidencia_kg, incidencia_dias, fechas_en_ventana
+from utils.desglose import construir_indice_desglose
+from utils.conciliacion import conciliar_pesadas, TOLERANCIA_KG_PESADA, CLAVES_PESADA
+from utils.intercambio import escribir_tabla
+from utils.consistencia import comprobar_consistencia, resumir_consistencia
+
+# Niveles de los mensajes de progreso
+NIVELES_PROGRESO = ['titulo', 'info', 'exito', 'aviso', 'detalle']
+
+# NIPD fijos de CODORNIU, S.A. según la zona de la declaración
+NIPD_CODORNIU = {
+    'LLEIDA': 2501200003,
+    'PENEDÈS': 802400022
+}
+
+# Columnas de la tabla de auditoría de matching
+COLUMNAS_AUDITORIA = ['clave', 'zona', 'metodo', 'nombre_match', 'nipd', 'registros']
+
+# Formatos numéricos de las pestañas del reporte agrupado
+FORMATO_KG = '#,##0'
+FORMATO_PORCENTAJE = '0.00'
+FORMATO_ENTERO = '0'
+
+FORMATOS_HOJA_NIPD = {
+    'nipd': FORMATO_ENTERO,
+    'kgtotales rvc': FORMATO_KG,
+    'kgtotales extranet': FORMATO_KG,
+    'diferencia': FORMATO_KG,
+    'porcentaje diferencia': FORMATO_PORCENTAJE,
+    'cantidad pesadas rvc': FORMATO_ENTERO,
+    'cantidad pesadas extranet': FORMATO_ENTERO
+}
+
+FORMATOS_HOJA_NIF = {
+    'nipd': FORMATO_ENTERO,
+    'KgTotales RVC': FORMATO_KG,
+    'KgTotales Extranet': FORMATO_KG,
+    'diferencia porcentual': FORMATO_KG,
+    'porcentaje diferencia pesadas': FORMATO_PORCENTAJE,
+    'numero pesadas viticultor rvc': FORMATO_ENTERO,
+    'numero pesadas viticultor extranet': FORMATO_ENTERO
+}
+
+FORMATOS_HOJA_PESADAS = {
+    'nipd': FORMATO_ENTERO,
+    'fecha': FORMATO_FECHA,
+    'kg_extranet': FORMATO_KG,
+    'kg_ervc': FORMATO_KG,
+    'diferencia_kg': FORMATO_KG
+}
+
+FORMATOS_HOJA_CONSISTENCIA = {
+    'pesadas_extranet': FORMATO_ENTERO,
+    'pesadas_ervc': FORMATO_ENTERO
+}
+
+# Particiones por NIPD de la conciliación (por defecto, una por núcleo)
+PARTICIONES_CONCILIACION = int(os.environ.get('VERIFICACION_PARTICIONES', 0)) or os.cpu_count() or 1
+
+# Por debajo de estas filas (Extranet + eRVC) repartir en procesos no compensa
+MIN_FILAS_PARTICIONADO = int(os.environ.get('VERIFICACION_MIN_FILAS_PARTICIONADO', 200_000))
+
+# Columnas de Extranet y eRVC preparados que necesita cada partición
+COLUMNAS_PARTICION_EXTRANET = ['NIPD', 'Nif Viticultor', 'Total Kg:', 'fecha_pesada']
+COLUMNAS_PARTICION_ERVC = ['nipd', 'nifLLiurador', 'kgTotals', 'fecha_pesada']
+
+class ErrorComprobaciones(Exception):
+    """Error de datos que impide continuar con las comprobaciones"""
+
+def _sin_progreso(nivel, mensaje):
+    pass
+
+def filtrar_por_zona(df_extranet, hojas_bbdd, progreso=None):
+    """Excluye de Extranet las zonas sin pestaña de referencia en la BBDD"""
+    progreso = progreso or _sin_progreso
+
+    # Detectar columna de zona
+    col_zona = None
+    for col in df_extranet.columns:
+        if 'zona' in str(col).lower():
+            col_zona = col
+            break
+
+    if col_zona is None:
+        raise ErrorComprobaciones(
+            f"No se encontró columna 'Zona' en Extranet (columnas: {', '.join(map(str, df_extranet.columns))})"
+        )
+
+    progreso('info', f"📍 Usando columna zona: '{col_zona}'")
+
+    zonas_extranet = df_extranet[col_zona].dropna().unique()
+    zonas_excluir = [zona for zona in zonas_extranet if hoja_para_zona(zona, hojas_bbdd) is None]
+    df_filtrado = df_extranet[~df_extranet[col_zona].isin(zonas_excluir)]
+    if zonas_excluir:
+        progreso('info', f"📍 Zonas excluidas (sin pestaña en BBDD): {', '.join(map(str, zonas_excluir))}")
+
+    progreso('exito', f"✅ Filtrado por zona: {df_filtrado.shape[0]} registros (excluidos: {df_extranet.shape[0] - df_filtrado.shape[0]})")
+    return df_filtrado
+
+def enriquecer_declaracion(datos, memoria=None, progreso=None):
+    """
+    Paso 1: filtra Extranet por zona y le añade el NIPD de la BBDD.
+    datos: resultado de cargar_archivos_comprobaciones.
+    Devuelve (df_enriquecido, df_auditoria).
+    """
+    progreso = progreso or _sin_progreso
+
+    progreso('titulo', "📥 1. Archivos cargados")
+    df_extranet = datos['extranet']
+    progreso('exito',
+        f"✅ Extranet: {df_extranet.shape[0]} registros cargados "
+        f"(descartados al leer por zona sin BBDD: {df_extranet.attrs.get('filas_descartadas', 0)})"
+    )
+
+    df_bbdd = datos['bbdd']
+    hojas_bbdd = set(df_bbdd['HOJA'].unique())
+    resumen_hojas = ", ".join(f"{hoja}: {n}" for hoja, n in df_bbdd['HOJA'].value_counts().items())
+    progreso('exito', f"✅ BBDD: {df_bbdd.shape[0]} registros cargados ({resumen_hojas})")
+    if datos['hojas_ignoradas']:
+        progreso('info', f"ℹ️ Pestañas ignoradas (sin columnas EXTRANET/RVC/NIPD): {', '.join(datos['hojas_ignoradas'])}")
+
+    progreso('titulo', "🏷️ 2. Filtrando por zona...")
+    df_extranet_filtrado = filtrar_por_zona(df_extranet, hojas_bbdd, progreso)
+
+    progreso('titulo', "🏭 3. Añadiendo NIPD...")
+    memoria = memoria or {}
+    progreso('info', f"🧠 Memoria de matches: {len(memoria)} resoluciones confirmadas")
+    df_enriquecido, df_auditoria = enriquecer_con_nipd_mejorado(df_extranet_filtrado, df_bbdd, memoria, progreso)
+
+    nipd_encontrados = df_enriquecido['NIPD'].notna().sum()
+    progreso('exito', f"✅ NIPD encontrados: {nipd_encontrados}/{df_enriquecido.shape[0]} registros")
+
+    return df_enriquecido, df_auditoria
+
+def detectar_columnas_bodega_zona(df):
+    """Detecta las columnas de razón social (bodega) y zona en Extranet"""
+    col_bodega = None
+    col_zona = None
+
+    for col in df.columns:
+        col_lower = str(col).lower()
+        if 'razón' in col_lower and 'social' in col_lower:
+            col_bodega = col
+        elif 'zona' in col_lower:
+            col_zona = col
+
+    return col_bodega, col_zona
+
+def enriquecer_con_nipd_mejorado(df_extranet, df_bbdd, memoria=None, progreso=None):
+    """Añade NIPD al DataFrame de extranet - VERSIÓN MEJORADA
+
+    Devuelve el DataFrame enriquecido y una tabla de auditoría con una fila
+    por combinación (bodega, zona) y la decisión de matching tomada.
+    memoria: diccionario {(bodega, zona): nipd} de resoluciones confirmadas,
+    consultado después del match exacto y antes del parcial.
+    """
+    progreso = progreso or _sin_progreso
+
+    df_resultado = df_extranet.copy()
+    df_resultado['NIPD'] = None
+    memoria = memoria or {}
+
+    # Detectar columnas en extranet
+    col_bodega, col_zona = detectar_columnas_bodega_zona(df_extranet)
+
+    if col_bodega is None or col_zona is None:
+        raise ErrorComprobaciones(
+            f"Columnas no encontradas - Bodega: {col_bodega}, Zona: {col_zona} "
+            f"(columnas: {', '.join(map(str, df_extranet.columns))})"
+        )
+
+    progreso('info', f"🔍 Detectadas - Bodega: '{col_bodega}', Zona: '{col_zona}'")
+
+    # Crear índice por pestaña de zona usando columnas EXTRANET y RVC del BBDD
+    # (una BBDD sin columna 'HOJA' se trata como la pestaña CAT)
+    indice_bodegas = {}
+    for _, row in df_bbdd.iterrows():
+        nombre_extranet = str(row['EXTRANET']).strip().upper()
+        nombre_rvc = str(row['RVC']).strip().upper()
+        nipd = row['NIPD']
+        zona_bbdd = str(row.get('ZONA', '')).strip().upper()
+        bodegas_dict = indice_bodegas.setdefault(row.get('HOJA', HOJA_POR_DEFECTO), {})
+
+        # Agregar ambos nombres al diccionario
+        bodegas_dict[nombre_extranet] = {
+            'nipd': nipd,
+            'zona_bbdd': zona_bbdd
+        }
+
+        if nombre_rvc != nombre_extranet:
+            bodegas_dict[nombre_rvc] = {
+                'nipd': nipd,
+                'zona_bbdd': zona_bbdd
+            }
+
+    # Normalizar claves una sola vez y resolver cada combinación (bodega, zona)
+    # única en lugar de cada registro
+    bodegas = df_resultado[col_bodega].astype(str).str.strip().str.upper()
+    zonas = df_resultado[col_zona].astype(str).str.strip().str.upper()
+    conteos = pd.DataFrame({'bodega': bodegas, 'zona': zonas}).value_counts(sort=False)
+
+    asignaciones = {}
+    auditoria = []
+
+    for (bodega_extranet, zona_extranet), registros in conteos.items():
+        nipd_asignado = None
+        nombre_match = None
+        bodegas_dict = indice_bodegas.get(hoja_para_zona(zona_extranet, indice_bodegas), {})
+
+        # CASO ESPECIAL: CODORNIU, S.A.
+        if bodega_extranet == 'CODORNIU, S.A.':
+            nipd_asignado = NIPD_CODORNIU.get(zona_extranet)
+            metodo = 'codorniu' if nipd_asignado else 'codorniu_zona_desconocida'
+
+            # Zona no prevista pero confirmada manualmente en otra ejecución
+            if not nipd_asignado and (bodega_extranet, zona_extranet) in memoria:
+                nipd_asignado = memoria[(bodega_extranet, zona_extranet)]
+                metodo = 'memoria'
+
+        # BÚSQUEDA NORMAL
+        else:
+            # Búsqueda exacta primero
+            if bodega_extranet in bodegas_dict:
+                nipd_asignado = bodegas_dict[bodega_extranet]['nipd']
+                nombre_match = bodega_extranet
+                metodo = 'exacto'
+
+            # Resolución confirmada en ejecuciones anteriores
+            elif (bodega_extranet, zona_extranet) in memoria:
+                nipd_asignado = memoria[(bodega_extranet, zona_extranet)]
+                metodo = 'memoria'
+
+            # Búsqueda parcial si no hay match exacto
+            else:
+                metodo = 'sin_match'
+                for nombre_bbdd, datos in bodegas_dict.items():
+                    if bodega_extranet in nombre_bbdd or nombre_bbdd in bodega_extranet:
+                        nipd_asignado = datos['nipd']
+                        nombre_match = nombre_bbdd
+                        metodo = 'parcial'
+                        break
+
+        if not nipd_asignado:
+            nipd_asignado = None
+            if metodo != 'codorniu_zona_desconocida':
+                metodo = 'sin_match'
+
+        asignaciones[(bodega_extranet, zona_extranet)] = nipd_asignado
+        auditoria.append({
+            'clave': bodega_extranet,
+            'zona': zona_extranet,
+            'metodo': metodo,
+            'nombre_match': nombre_match,
+            'nipd': nipd_asignado,
+            'registros': int(registros)
+        })
+
+    # Asignar NIPD (como entero canónico)
+    df_resultado['NIPD'] = normalizar_nipd(pd.Series(
+        [asignaciones[clave] for clave in zip(bodegas, zonas)],
+        index=df_resultado.index, dtype=object
+    ))
+
+    df_auditoria = pd.DataFrame(auditoria, columns=COLUMNAS_AUDITORIA)
+
+    return df_resultado, df_auditoria
+
+def preparar_datos_fechas(df_extranet, df_ervc, ventana_dias=0, progreso=None):
+    """
+    Prepara datos y convierte fechas para comparación. Conserva las pesadas cuya
+    fecha tiene alguna fecha del otro sistema a ±ventana_dias (0: fechas comunes).
+    """
+    progreso = progreso or _sin_progreso
+
+    # Detectar columnas
+    col_fecha_extranet = 'Día y hora:'
+    col_fecha_ervc = None
+
+    # Buscar columna de fecha en eRVC
+    for posible in COLUMNAS_FECHA_ERVC:
+        if posible in df_ervc.columns:
+            col_fecha_ervc = posible
+            break
+
+    if not col_fecha_ervc:
+        raise ErrorComprobaciones("No se encontró columna fecha en eRVC")
+
+    progreso('info', f"📅 Usando fechas: Extranet='{col_fecha_extranet}', eRVC='{col_fecha_ervc}'")
+
+    # Preparar Extranet y eRVC: se parsean solo los valores únicos con formato inferido
+    df_extranet_prep = df_extranet.copy()
+    df_ervc_prep = df_ervc.copy()
+
+    for nombre, df_prep, col_fecha in (
+        ('Extranet', df_extranet_prep, col_fecha_extranet),
+        ('eRVC', df_ervc_prep, col_fecha_ervc)
+    ):
+        try:
+            df_prep['fecha_pesada'], resumen = normalizar_fechas(df_prep[col_fecha])
+        except Exception as e:
+            raise ErrorComprobaciones(f"Error al procesar fechas {nombre}: {str(e)}") from e
+
+        mensaje = (
+            f"Fechas {nombre}: formato '{resumen['formato']}', "
+            f"{resumen['valores_unicos']} valores únicos"
+        )
+        if resumen['fallidos']:
+            progreso('aviso',
+                f"⚠️ {mensaje}, {resumen['fallidos']} registros sin fecha válida "
+                f"(p. ej. {', '.join(resumen['ejemplos_fallidos'])})"
+            )
+        else:
+            progreso('exito', f"✅ {mensaje}, todos procesados")
+
+    # Filtrar por fechas válidas primero
+    df_extranet_prep = df_extranet_prep.dropna(subset=['fecha_pesada'])
+    df_ervc_prep = df_ervc_prep.dropna(subset=['fecha_pesada'])
+
+    # Filtrar por fechas con pareja en el otro sistema dentro de la ventana
+    en_ventana_extranet = fechas_en_ventana(df_extranet_prep['fecha_pesada'], df_ervc_prep['fecha_pesada'], ventana_dias)
+    en_ventana_ervc = fechas_en_ventana(df_ervc_prep['fecha_pesada'], df_extranet_prep['fecha_pesada'], ventana_dias)
+
+    progreso('info',
+        f"📊 Fechas válidas - Extranet: {df_extranet_prep['fecha_pesada'].nunique()}, "
+        f"eRVC: {df_ervc_prep['fecha_pesada'].nunique()}"
+    )
+    progreso('info',
+        f"📊 Fechas con pareja (±{ventana_dias} días) - "
+        f"Extranet: {df_extranet_prep.loc[en_ventana_extranet, 'fecha_pesada'].nunique()}, "
+        f"eRVC: {df_ervc_prep.loc[en_ventana_ervc, 'fecha_pesada'].nunique()}"
+    )
+
+    if not en_ventana_extranet.any():
+        progreso('aviso', "⚠️ No se encontraron fechas comunes. Procesando todos los datos...")
+        # Si no hay fechas comunes, usar todos los datos
+        progreso('exito', f"✅ Datos preparados - Extranet: {len(df_extranet_prep)}, eRVC: {len(df_ervc_prep)}")
+        return df_extranet_prep, df_ervc_prep
+
+    df_extranet_prep = df_extranet_prep[en_ventana_extranet]
+    df_ervc_prep = df_ervc_prep[en_ventana_ervc]
+
+    progreso('exito', f"✅ Datos filtrados por fechas (±{ventana_dias} días) - Extranet: {len(df_extranet_prep)}, eRVC: {len(df_ervc_prep)}")
+
+    return df_extranet_prep, df_ervc_prep
+
+def generar_reporte(df_enriquecido, df_ervc, opciones=None, progreso=None):
+    """
+    Paso 2: agrega por NIPD y NIF, concilia pesada a pesada y genera el Excel.
+    df_ervc: eRVC tal como sale de cargar_archivos_comprobaciones.
+    opciones: {'usar_almacen', 'campana', 'usuario', 'reglas', 'tolerancia_kg_pesada',
+    'particiones', 'max_workers'}; los agregados del almacén son propios de 'usuario'.
+    Con archivos grandes la agregación por NIPD y la conciliación se reparten
+    en procesos (ver conciliar_en_particiones).
+    Devuelve {'df_nipd', 'df_nif', 'df_pesadas', 'df_consistencia', 'archivo_excel',
+    'tolerancia_kg_pesada', 'indice_desglose'}.
+    """
+    opciones = opciones or {}
+    progreso = progreso or _sin_progreso
+    reglas = completar_reglas(opciones.get('reglas'))
+    tolerancia_kg_pesada = opciones.get('tolerancia_kg_pesada', TOLERANCIA_KG_PESADA)
+
+    progreso('titulo', "📊 5. Generando Reporte Agrupado...")
+
+    # eRVC ya parseado al subir los archivos
+    # (solo pesadas 'dos'='CV' y columnas necesarias, filtradas durante la lectura)
+    progreso('exito',
+        f"✅ eRVC 'dos'='{DOS_ERVC}': {df_ervc.shape[0]} registros cargados "
+        f"(descartados al leer: {df_ervc.attrs.get('filas_descartadas', 0)})"
+    )
+
+    # Solo NIPD que existen en extranet
+    nipd_validos = df_enriquecido['NIPD'].dropna().unique()
+    df_ervc_final = df_ervc[df_ervc['nipd'].isin(nipd_validos)]
+
+    progreso('exito', f"✅ eRVC final: {df_ervc_final.shape[0]} registros")
+    progreso('info', f"🎯 NIPD a analizar: {len(nipd_validos)}")
+
+    # NIF y NIPD cruzados entre ambos sistemas (antes de filtrar por fechas)
+    progreso('detalle', "🔗 Comprobando la consistencia de NIF y NIPD entre Extranet y eRVC...")
+    df_consistencia = comprobar_consistencia(df_enriquecido, df_ervc)
+    resumen_consistencia = resumir_consistencia(df_consistencia)
+    progreso('aviso' if len(df_consistencia) else 'exito',
+        f"{'⚠️' if len(df_consistencia) else '✅'} Consistencia NIF: "
+        f"{resumen_consistencia['formato']} con diferencias de formato, "
+        f"{resumen_consistencia['nipd_distinto']} con NIPD distinto, "
+        f"{resumen_consistencia['solo_extranet']} solo en Extranet, "
+        f"{resumen_consistencia['solo_ervc']} solo en eRVC"
+    )
+
+    # Preparar datos con fechas
+    progreso('detalle', "📅 Preparando datos y comparando fechas...")
+    df_extranet_prep, df_ervc_prep = preparar_datos_fechas(
+        df_enriquecido, df_ervc_final, reglas['ventana_dias'], progreso
+    )
+
+    if 'NIPD' not in df_extranet_prep.columns:
+        raise ErrorComprobaciones("La columna NIPD se perdió durante el procesamiento de fechas")
+    if 'nipd' not in df_ervc_prep.columns:
+        raise ErrorComprobaciones("La columna nipd no existe en eRVC")
+
+    # Mismo diccionario de NIF en ambos sistemas: los merges usan los códigos enteros
+    df_extranet_prep['Nif Viticultor'], df_ervc_prep['nifLLiurador'] = unificar_categorias(
+        df_extranet_prep['Nif Viticultor'], df_ervc_prep['nifLLiurador']
+    )
+
+    # Agregar una sola vez por (NIPD, NIF, día) en cada sistema
+    cubos = None
+    if opciones.get('usar_almacen'):
+        # Solo se agregan los días nuevos o modificados; el resto sale del almacén
+        almacen = AlmacenAgregados()
+        campana = opciones.get('campana') or str(datetime.now().year)
+        # Particiones propias de cada usuario: las declaraciones de otros no se pisan
+        ambito = opciones.get('usuario') or 'anonimo'
+        cubo_extranet, resumen_extranet = actualizar_cubo_incremental(
+            almacen, ambito, campana, 'extranet', df_extranet_prep, 'NIPD', 'Nif Viticultor', 'Total Kg:'
+        )
+        cubo_ervc, resumen_ervc = actualizar_cubo_incremental(
+            almacen, ambito, campana, 'ervc', df_ervc_prep, 'nipd', 'nifLLiurador', 'kgTotals'
+        )
+        for nombre, resumen in (('Extranet', resumen_extranet), ('eRVC', resumen_ervc)):
+            progreso('info',
+                f"🗄️ {nombre} (campaña {campana}): {resumen['nuevas']} días nuevos, "
+                f"{resumen['modificadas']} modificados, {resumen['reutilizadas']} reutilizados"
+            )
+        cubo_extranet['nif'], cubo_ervc['nif'] = unificar_categorias(
+            cubo_extranet['nif'], cubo_ervc['nif']
+        )
+        cubos = (cubo_extranet, cubo_ervc)
+
+    particiones = opciones.get('particiones') or PARTICIONES_CONCILIACION
+    if particiones > 1 and len(df_extranet_prep) + len(df_ervc_prep) >= MIN_FILAS_PARTICIONADO:
+        # Cubos, hoja NIPD y conciliación de pesadas en paralelo por partición de NIPD
+        progreso('detalle', f"🧩 Agregando y conciliando en {particiones} particiones por NIPD...")
+        cubo_extranet, cubo_ervc, df_nipd, df_pesadas = conciliar_en_particiones(
+            df_extranet_prep, df_ervc_prep, reglas, tolerancia_kg_pesada, particiones, cubos,
+            max_workers=opciones.get('max_workers')
+        )
+    else:
+        if cubos is None:
+            progreso('detalle', "🧮 Agregando por NIPD, NIF y día...")
+            cubo_extranet = construir_cubo(df_extranet_prep, 'NIPD', 'Nif Viticultor', 'Total Kg:')
+            cubo_ervc = construir_cubo(df_ervc_prep, 'nipd', 'nifLLiurador', 'kgTotals')
+
+        progreso('detalle', "🏭 Agrupando por NIPD...")
+        df_nipd = agrupar_por_nipd(cubo_extranet, cubo_ervc, reglas)
+
+        progreso('detalle', "⚖️ Conciliando pesadas individuales...")
+        df_pesadas = conciliar_pesadas(df_extranet_prep, df_ervc_prep, tolerancia_kg_pesada, reglas['ventana_dias'])
+
+    # Un NIF puede tener pesadas en varios NIPD: se consolida sobre los cubos completos
+    progreso('detalle', "👤 Agrupando por NIF...")
+    df_nif = agrupar_por_nif(cubo_extranet, cubo_ervc, reglas)
+
+    progreso('detalle', "📋 Generando archivo Excel...")
+    archivo_excel = crear_excel_agrupado(df_nipd, df_nif, df_pesadas, df_consistencia)
+
+    # Índice de desglose por NIPD/NIF, construido una sola vez por reporte
+    progreso('detalle', "🔎 Preparando desglose por NIPD y NIF...")
+    indice_desglose = construir_indice_desglose(cubo_extranet, cubo_ervc, df_pesadas)
+
+    progreso('exito', "✅ Reporte generado exitosamente")
+
+    return {
+        'df_nipd': df_nipd,
+        'df_nif': df_nif,
+        'df_pesadas': df_pesadas,
+        'df_consistencia': df_consistencia,
+        'archivo_excel': archivo_excel,
+        'tolerancia_kg_pesada': tolerancia_kg_pesada,
+        'indice_desglose': indice_desglose
+    }
+
+def agrupar_por_nipd(cubo_extranet, cubo_ervc, reglas=None):
+    """Agrupa datos por NIPD (a partir de los cubos NIPD/NIF/día) y calcula diferencias"""
+    reglas = completar_reglas(reglas)
+
+    # Consolidar Extranet por NIPD (días únicos como "número de pesadas")
+    extranet_nipd = consolidar_por_nipd(cubo_extranet).rename(columns={
+        'nipd': 'NIPD',
+        'kg': 'kg_extranet',
+        'dias': 'num_pesadas_extranet'
+    })
+
+    # Consolidar eRVC por NIPD (días únicos como "número de pesadas")
+    ervc_nipd = consolidar_por_nipd(cubo_ervc).rename(columns={
+        'nipd': 'NIPD',
+        'kg': 'kg_ervc',
+        'dias': 'num_pesadas_ervc'
+    })
+
+    # Merge (sobre NIPD entero; solo se rellenan con 0 las métricas)
+    df_nipd = pd.merge(ervc_nipd, extranet_nipd, on='NIPD', how='outer')
+    metricas = ['kg_ervc', 'num_pesadas_ervc', 'kg_extranet', 'num_pesadas_extranet']
+    df_nipd[metricas] = df_nipd[metricas].fillna(0)
+
+    # Calcular diferencias y porcentajes
+    df_nipd['diferencia'] = df_nipd['kg_extranet'] - df_nipd['kg_ervc']
+    df_nipd['porcentaje_diferencia'] = np.where(
+        df_nipd['kg_ervc'] != 0,
+        (df_nipd['diferencia'] / df_nipd['kg_ervc']) * 100,
+        np.inf
+    )
+
+    # Calcular incidencias: días sin pareja a ±ventana (con 0, distinto número de días)
+    # y kg fuera de tolerancia
+    df_nipd['incidencia_pesadas'] = incidencia_dias(
+        df_nipd, 'NIPD', cubo_extranet, cubo_ervc, 'nipd', reglas['ventana_dias'],
+        ('num_pesadas_extranet', 'num_pesadas_ervc')
+    )
+
+    df_nipd['incidencia_kg'] = incidencia_kg(
+        df_nipd['kg_extranet'], df_nipd['kg_ervc'], df_nipd['porcentaje_diferencia'], reglas
+    )
+
+    # Renombrar columnas para Excel
+    df_nipd = df_nipd.rename(columns={
+        'NIPD': 'nipd',
+        'kg_ervc': 'kgtotales rvc',
+        'kg_extranet': 'kgtotales extranet',
+        'diferencia': 'diferencia',
+        'porcentaje_diferencia': 'porcentaje diferencia',
+        'num_pesadas_ervc': 'cantidad pesadas rvc',
+        'num_pesadas_extranet': 'cantidad pesadas extranet',
+        'incidencia_pesadas': 'incidencia pesadas',
+        'incidencia_kg': 'incidencias kg'
+    })
+
+    # Reordenar columnas según imagen
+    columnas_orden = [
+        'nipd', 'kgtotales rvc', 'kgtotales extranet', 'diferencia',
+        'porcentaje diferencia', 'cantidad pesadas rvc', 'cantidad pesadas extranet',
+        'incidencia pesadas', 'incidencias kg'
+    ]
+
+    df_nipd = df_nipd[columnas_orden]
+
+    return df_nipd
+
+def agrupar_por_nif(cubo_extranet, cubo_ervc, reglas=None):
+    """Agrupa datos por NIF (a partir de los cubos NIPD/NIF/día) y calcula diferencias"""
+    reglas = completar_reglas(reglas)
+
+    # Consolidar Extranet por NIF (NIPD de su primera pesada como referencia)
+    extranet_nif = consolidar_por_nif(cubo_extranet).rename(columns={
+        'nif': 'Nif Viticultor',
+        'kg': 'kg_extranet',
+        'dias': 'num_pesadas_extranet',
+        'nipd': 'NIPD'
+    })
+
+    # Consolidar eRVC por NIF
+    ervc_nif = consolidar_por_nif(cubo_ervc).rename(columns={
+        'kg': 'kg_ervc',
+        'dias': 'num_pesadas_ervc'
+    })
+
+    # Merge por NIF (Ahora 'nif' sí existe en ervc_nif)
+    df_nif = pd.merge(
+        ervc_nif, extranet_nif,
+        left_on='nif', right_on='Nif Viticultor',
+        how='outer'
+    )
+    metricas = ['kg_ervc', 'num_pesadas_ervc', 'kg_extranet', 'num_pesadas_extranet']
+    df_nif[metricas] = df_nif[metricas].fillna(0)
+
+    # Usar el NIF del lado que exista
+    df_nif['nif_final'] = df_nif['nif'].astype(object).fillna(df_nif['Nif Viticultor'].astype(object))
+
+    # Usar el NIPD del lado que exista
+    df_nif['nipd_final'] = df_nif['nipd'].fillna(df_nif['NIPD'])
+
+    # Calcular diferencias y porcentajes
+    df_nif['diferencia'] = df_nif['kg_extranet'] - df_nif['kg_ervc']
+    df_nif['porcentaje_diferencia'] = np.where(
+        df_nif['kg_ervc'] != 0,
+        (df_nif['diferencia'] / df_nif['kg_ervc']) * 100,
+        np.inf
+    )
+
+    # Calcular incidencias: días sin pareja a ±ventana (con 0, distinto número de días)
+    df_nif['incidencia_pesadas'] = incidencia_dias(
+        df_nif, 'nif_final', cubo_extranet, cubo_ervc, 'nif', reglas['ventana_dias'],
+        ('num_pesadas_extranet', 'num_pesadas_ervc')
+    )
+
+    # Limpiar y renombrar columnas para Excel
+    df_nif = df_nif[[
+        'nipd_final', 'nif_final', 'kg_ervc', 'kg_extranet', 'diferencia',
+        'porcentaje_diferencia', 'num_pesadas_ervc', 'num_pesadas_extranet',
+        'incidencia_pesadas'
+    ]].rename(columns={
+        'nipd_final': 'nipd',
+        'nif_final': 'nif',
+        'kg_ervc': 'KgTotales RVC',
+        'kg_extranet': 'KgTotales Extranet',
+        'diferencia': 'diferencia porcentual',
+        'porcentaje_diferencia': 'porcentaje diferencia pesadas',
+        'num_pesadas_ervc': 'numero pesadas viticultor rvc',
+        'num_pesadas_extranet': 'numero pesadas viticultor extranet',
+        'incidencia_pesadas': 'incidencia pesadas'
+    })
+
+    return df_nif
+
+def particion_nipd(nipd, particiones):
+    """Partición de cada fila según el hash de su NIPD (los NIPD nulos van todos a la misma)"""
+    claves = pd.array(nipd, dtype='Int64').fillna(-1).to_numpy(dtype='int64')
+    return (pd.util.hash_array(claves) % particiones).astype('int64')
+
+def _repartir(hashes, particiones):
+    """Posiciones (ordenadas) de las filas de cada partición"""
+    orden = np.argsort(hashes, kind='stable')
+    limites = np.searchsorted(hashes[orden], np.arange(particiones + 1))
+    return [orden[limites[i]:limites[i + 1]] for i in range(particiones)]
+
+def _conciliar_particion(argumentos):
+    """
+    Tarea de un worker: cubos, hoja NIPD y conciliación de pesadas de una partición.
+    Extranet y eRVC llegan como tablas compartidas y posiciones: el worker solo
+    materializa sus filas. Con cubos=None se construyen aquí, con primera_fila
+    relativa al DataFrame completo.
+    """
+    tabla_extranet, filas_extranet, tabla_ervc, filas_ervc, cubos, reglas, tolerancia_kg = argumentos
+    df_extranet = tabla_extranet.abrir(filas_extranet)
+    df_ervc = tabla_ervc.abrir(filas_ervc)
+
+    if cubos is None:
+        cubo_extranet = construir_cubo(df_extranet, 'NIPD', 'Nif Viticultor', 'Total Kg:')
+        cubo_ervc = construir_cubo(df_ervc, 'nipd', 'nifLLiurador', 'kgTotals')
+        cubo_extranet['primera_fila'] = filas_extranet[cubo_extranet['primera_fila'].to_numpy()]
+        cubo_ervc['primera_fila'] = filas_ervc[cubo_ervc['primera_fila'].to_numpy()]
+    else:
+        cubo_extranet, cubo_ervc = cubos
+
+    df_nipd = agrupar_por_nipd(cubo_extranet, cubo_ervc, reglas)
+    df_pesadas = conciliar_pesadas(df_extranet, df_ervc, tolerancia_kg, reglas['ventana_dias'])
+    return cubo_extranet, cubo_ervc, df_nipd, df_pesadas
+
+def conciliar_en_particiones(df_extranet_prep, df_ervc_prep, reglas, tolerancia_kg_pesada,
+                             particiones=None, cubos=None, max_workers=None):
+    """
+    Reparte Extranet y eRVC (ya preparados) por hash del NIPD y, en un pool de
+    procesos, agrega, compara y concilia cada partición por separado: todo lo
+    que cuelga de un NIPD cae en la misma partición, así que el resultado es el
+    mismo que en un único proceso. Los DataFrames se escriben una sola vez como
+    tablas compartidas (utils.intercambio) y a cada worker solo viajan posiciones.
+    cubos: (cubo_extranet, cubo_ervc) ya construidos (almacén de agregados) o None.
+    Devuelve (cubo_extranet, cubo_ervc, df_nipd, df_pesadas) unidos y en el
+    mismo orden que agrupar_por_nipd y conciliar_pesadas.
+    """
+    particiones = particiones or PARTICIONES_CONCILIACION
+    reglas = completar_reglas(reglas)
+
+    filas_extranet = _repartir(particion_nipd(df_extranet_prep['NIPD'], particiones), particiones)
+    filas_ervc = _repartir(particion_nipd(df_ervc_prep['nipd'], particiones), particiones)
+    if cubos is not None:
+        filas_cubos = [
+            _repartir(particion_nipd(cubo['nipd'], particiones), particiones) for cubo in cubos
+        ]
+
+    directorio = tempfile.TemporaryDirectory(prefix='verificacion_particiones_')
+    tabla_extranet = escribir_tabla(
+        df_extranet_prep[COLUMNAS_PARTICION_EXTRANET], os.path.join(directorio.name, 'extranet')
+    )
+    tabla_ervc = escribir_tabla(df_ervc_prep[COLUMNAS_PARTICION_ERVC], os.path.join(directorio.name, 'ervc'))
+
+    tareas = []
+    for i in range(particiones):
+        if cubos is None:
+            cubos_particion = None
+            if not len(filas_extranet[i]) and not len(filas_ervc[i]):
+                continue
+        else:
+            cubos_particion = tuple(
+                cubo.iloc[filas[i]].reset_index(drop=True) for cubo, filas in zip(cubos, filas_cubos)
+            )
+            if not len(cubos_particion[0]) and not len(cubos_particion[1]):
+                continue
+        tareas.append((
+            tabla_extranet, filas_extranet[i], tabla_ervc, filas_ervc[i],
+            cubos_particion, reglas, tolerancia_kg_pesada
+        ))
+
+    workers = max(1, min(len(tareas), max_workers or os.cpu_count() or 1))
+    with directorio:
+        if workers == 1:
+            resultados = [_conciliar_particion(tarea) for tarea in tareas]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                resultados = list(executor.map(_conciliar_particion, tareas))
+
+    cubo_extranet, cubo_ervc, df_nipd, df_pesadas = (
+        pd.concat([resultado[i] for resultado in resultados], ignore_index=True)
+        for i in range(4)
+    )
+    df_nipd = df_nipd.sort_values('nipd', kind='stable').reset_index(drop=True)
+    df_pesadas = df_pesadas.sort_values(CLAVES_PESADA + ['estado'], kind='stable').reset_index(drop=True)
+    return cubo_extranet, cubo_ervc, df_nipd, df_pesadas
+
+def crear_excel_agrupado(df_nipd, df_nif, df_pesadas=None, df_consistencia=None):
+    """
+    Crea archivo Excel con 2 pestañas, más la conciliación de pesadas y la
+    consistencia de NIF entre sistemas si se incluyen
+    """
+    hojas = [
+        # Pestaña NIPD
+        {
+            'nombre': 'nipd',
+            'df': df_nipd,
+            'formatos': FORMATOS_HOJA_NIPD,
+            'columnas_incidencia': ['incidencia pesadas', 'incidencias kg']
+        },
+        # Pestaña NIF
+        {
+            'nombre': 'nifViticultor',
+            'df': df_nif,
+            'formatos': FORMATOS_HOJA_NIF,
+            'columnas_incidencia': ['incidencia pesadas']
+        }
+    ]
+
+    # Pestaña conciliación pesada a pesada
+    if df_pesadas is not None:
+        hojas.append({
+            'nombre': 'pesadas',
+            'df': df_pesadas,
+            'formatos': FORMATOS_HOJA_PESADAS
+        })
+
+    # Pestaña consistencia de NIF y NIPD entre Extranet y eRVC
+    if df_consistencia is not None:
+        hojas.append({
+            'nombre': 'consistencia',
+            'df': df_consistencia,
+            'formatos': FORMATOS_HOJA_CONSISTENCIA
+        })
+
+    # Escritura en streaming (write_only): formatos e incidencias en la misma pasada
+    return crear_excel_streaming(hojas)
+
+def ejecutar_comprobaciones(bytes_extranet, bytes_bbdd, bytes_ervc, opciones=None, memoria=None, progreso=None):
+    """
+    Pipeline completo: carga de los tres archivos, Paso 1 (enriquecimiento) y
+    Paso 2 (reporte). Devuelve el diccionario de generar_reporte con además
+    'df_enriquecido', 'df_auditoria' e 'informe_memoria'.
+    """
+    progreso = progreso or _sin_progreso
+
+    progreso('detalle', "📥 Cargando los tres archivos en paralelo...")
+    datos = cargar_archivos_comprobaciones(
+        bytes_extranet, bytes_bbdd, bytes_ervc, max_workers=(opciones or {}).get('max_workers')
+    )
+
+    df_enriquecido, df_auditoria = enriquecer_declaracion(datos, memoria, progreso)
+    reporte = generar_reporte(df_enriquecido, datos['ervc'], opciones, progreso)
+
+    return {
+        **reporte,
+        'df_enriquecido': df_enriquecido,
+        'df_auditoria': df_auditoria,
+        'informe_memoria': datos['informe_memoria']
+    }
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+MB = 1024 * 1024
+
+def _entero_compacto(serie):
+    """Reduce una columna numérica a su entero más pequeño, o None si no es entera sin nulos"""
+    if pd.api.types.is_integer_dtype(serie.dtype) and not pd.api.types.is_extension_array_dtype(serie.dtype):
+        return pd.to_numeric(serie, downcast='integer')
+    if pd.api.types.is_float_dtype(serie.dtype) and not pd.api.types.is_extension_array_dtype(serie.dtype):
+        valores = serie.values
+        if len(valores) and not np.isnan(valores).any() and np.array_equal(valores, np.floor(valores)):
+            if np.abs(valores).max() < np.iinfo(np.int64).max:
+                return pd.to_numeric(valores.astype(np.int64), downcast='integer')
+    return None
+
+def compactar_tipos(df, categoricas=(), excluir=()):
+    """
+    Reduce la memoria de un DataFrame recién leído:
+    - enteros (y flotantes sin decimales ni nulos) al entero más pequeño que los contiene;
+      los flotantes con decimales se mantienen en float64 para no perder precisión en las sumas
+    - las columnas de texto de 'categoricas' (nombres ya resueltos) pasan a categóricas
+
+    Las columnas de 'excluir' (p. ej. claves ya normalizadas) no se tocan.
+    Devuelve un DataFrame nuevo (mismos attrs) sin modificar el original.
+    """
+    compactado = df.copy(deep=False)
+    compactado.attrs = dict(df.attrs)
+
+    for col in df.columns:
+        if col in excluir:
+            continue
+        serie = df[col]
+        if col in categoricas:
+            if not isinstance(serie.dtype, pd.CategoricalDtype):
+                compactado[col] = serie.astype('category')
+            continue
+        if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+            entero = _entero_compacto(serie)
+            if entero is not None:
+                compactado[col] = pd.Series(entero, index=serie.index, name=col)
+
+    return compactado
+
+def informe_memoria(antes, despues):
+    """Memoria y tipo por columna de un DataFrame antes y después de la carga tipada"""
+    columnas = [col for col in despues.columns if col in antes.columns]
+    mb_antes = antes[columnas].memory_usage(index=False, deep=True) / MB
+    mb_despues = despues[columnas].memory_usage(index=False, deep=True) / MB
+    return pd.DataFrame({
+        'columna': [str(col) for col in columnas],
+        'tipo_antes': [str(antes[col].dtype) for col in columnas],
+        'tipo_despues': [str(despues[col].dtype) for col in columnas],
+        'mb_antes': mb_antes.values,
+        'mb_despues': mb_despues.values
+    })
+
+def resumir_informe(informe):
+    """Totales de un informe_memoria: MB antes, después y porcentaje de ahorro"""
+    mb_antes = float(informe['mb_antes'].sum())
+    mb_despues = float(informe['mb_despues'].sum())
+    return {
+        'mb_antes': mb_antes,
+        'mb_despues': mb_despues,
+        'ahorro': (1 - mb_despues / mb_antes) * 100 if mb_antes else 0.0
+    }
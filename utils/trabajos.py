@@ -0,0 +1,687 @@
+"""
+Servicio local de trabajos: cola asyncio con un pool de procesos detrás.
+
+Los clientes (páginas de Streamlit, servidor_trabajos.py) envían trabajos de
+verificador o de comprobaciones con rutas de archivos y opciones, consultan su
+estado y leen el resultado, que el proceso trabajador deja en disco (mismo
+equipo, sin red externa).
+
+Planificación: como mucho se ejecutan max_concurrentes trabajos a la vez y la
+cola se reparte por turnos entre usuarios (sesiones de Streamlit): pasa antes
+el usuario con menos trabajos en curso y, a igualdad, el que lleva más tiempo
+esperando. Cada trabajo declara una memoria estimada (tamaño de sus entradas
+por un factor según el formato); solo arranca si cabe en el margen que dejan
+los trabajos en curso y la memoria libre del equipo, y se rechaza al enviarlo
+si no cabría ni con el servicio vacío. Un trabajo pequeño puede adelantar a
+uno que espera memoria, pero no durante más de SEGUNDOS_MAX_ADELANTAMIENTO.
+Los pasos de comprobaciones abren sus propios pools (lectura de los archivos,
+conciliación por particiones): el servicio les fija cuántos procesos pueden
+usar (max_workers y particiones en sus opciones) y cuenta esos procesos hijos
+en la memoria estimada, de modo que el total del equipo sigue acotado.
+
+Protocolo: una petición JSON por línea sobre TCP en 127.0.0.1, con 'accion'
+en ping / enviar / estado / listar, y una respuesta JSON por línea. Salvo
+ping, cada petición lleva el token del servicio (VERIFICACION_TOKEN_TRABAJOS o
+el archivo 'token' que el servicio deja en su directorio, legible solo por su
+usuario); las rutas de los trabajos tienen que estar dentro de ese directorio y
+cada trabajo solo lo consulta el usuario que lo envió.
+
+Las entradas y resultados se borran pasadas HORAS_RETENCION_TRABAJOS, y los
+trabajos terminados salen de la lista del servicio al mismo tiempo.
+"""
+import asyncio
+import contextlib
+import hmac
+import json
+import os
+import pickle
+import secrets
+import shutil
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.intercambio import escribir_tabla, abrir_tabla, publicar_tablas, adjuntar_tablas, rutas_tablas
+
+# Configuración (variables de entorno)
+HOST_TRABAJOS = '127.0.0.1'
+PUERTO_TRABAJOS = int(os.environ.get('VERIFICACION_PUERTO_TRABAJOS', 8765))
+MAX_TRABAJOS_CONCURRENTES = int(os.environ.get('VERIFICACION_MAX_TRABAJOS', max(1, (os.cpu_count() or 2) // 2)))
+# Procesos que puede abrir cada trabajo de comprobaciones (por defecto CPU / MAX_TRABAJOS_CONCURRENTES)
+PROCESOS_POR_TRABAJO = int(os.environ.get('VERIFICACION_PROCESOS_POR_TRABAJO', 0)) or None
+HORAS_RETENCION_TRABAJOS = float(os.environ.get('VERIFICACION_HORAS_RETENCION_TRABAJOS', 24))
+SEGUNDOS_PURGA_TRABAJOS = 600
+# Token compartido entre el servicio y sus clientes (si no se fija, uno aleatorio por arranque)
+TOKEN_TRABAJOS = os.environ.get('VERIFICACION_TOKEN_TRABAJOS')
+ARCHIVO_TOKEN = 'token'
+DIRECTORIO_TRABAJOS = os.environ.get(
+    'VERIFICACION_DIRECTORIO_TRABAJOS',
+    os.path.join(os.path.expanduser('~'), '.verificacion', 'trabajos')
+)
+
+# Admisión por memoria: presupuesto de los trabajos en curso y reserva para el resto del equipo
+MEMORIA_TRABAJOS_MB = float(os.environ.get('VERIFICACION_MEMORIA_TRABAJOS_MB', 4096))
+RESERVA_SISTEMA_MB = float(os.environ.get('VERIFICACION_RESERVA_SISTEMA_MB', 512))
+SEGUNDOS_MAX_ADELANTAMIENTO = float(os.environ.get('VERIFICACION_SEGUNDOS_MAX_ADELANTAMIENTO', 120))
+SEGUNDOS_REVISION_COLA = 2.0
+
+# Memoria estimada de un trabajo: base del proceso más sus entradas por un factor
+# según el formato (un .xlsx ocupa en pandas muchas veces su tamaño comprimido)
+MEMORIA_BASE_TRABAJO_MB = 200
+FACTOR_MEMORIA_ENTRADA = {'.xlsx': 12, '.xls': 12, '.arrow': 1.5, '.pkl': 3}
+FACTOR_MEMORIA_POR_DEFECTO = 3
+# Procesos hijos de un trabajo: base de cada uno y, entre todos, otra copia de los datos
+MEMORIA_BASE_PROCESO_HIJO_MB = 120
+FACTOR_MEMORIA_PROCESOS_HIJOS = 1
+MB = 1024 * 1024
+
+ESTADO_EN_COLA = 'en_cola'
+ESTADO_EN_CURSO = 'en_curso'
+ESTADO_TERMINADO = 'terminado'
+ESTADO_ERROR = 'error'
+ESTADOS_FINALES = (ESTADO_TERMINADO, ESTADO_ERROR)
+
+NOMBRES_TRABAJO = {
+    'verificador': "Verificador: analizar, corregir y generar",
+    'comprobaciones': "Comprobaciones completas",
+    'enriquecimiento': "Comprobaciones · Paso 1: carga y NIPD",
+    'reporte': "Comprobaciones · Paso 2: reporte agrupado"
+}
+
+# Claves del resultado que se publican como tablas compartidas (utils.intercambio):
+# los trabajos siguientes y la página las abren mapeadas en lugar de copiarlas
+# Tipos de trabajo que reparten su trabajo en procesos hijos (max_workers / particiones)
+TIPOS_CON_PROCESOS_HIJOS = ('comprobaciones', 'enriquecimiento', 'reporte')
+
+TABLAS_COMPARTIDAS = {
+    'enriquecimiento': ('datos_cargados', 'df_enriquecido')
+}
+
+class ErrorTrabajos(Exception):
+    """Error del servicio de trabajos o de un trabajo concreto"""
+
+# ---------------------------------------------------------------------------
+# Trabajos (se ejecutan en los procesos del pool)
+# ---------------------------------------------------------------------------
+
+def _leer(ruta):
+    with open(ruta, 'rb') as f:
+        return f.read()
+
+def _cargar_pickle(ruta):
+    with open(ruta, 'rb') as f:
+        return pickle.load(f)
+
+def _trabajo_verificador(rutas, opciones, progreso):
+    """Pasos 1 a 3 del verificador sobre la declaración de rutas[0]"""
+    from utils.analyzer import VerificadorAnalyzer
+    from utils.historial_analisis import HistorialAnalisis
+
+    nombre = opciones.get('nombre_archivo') or os.path.basename(rutas[0])
+    # Con historial, al volver a subir una declaración solo se revalidan las filas cambiadas
+    historial = HistorialAnalisis() if opciones.get('usar_historial', True) else None
+    analyzer = VerificadorAnalyzer(historial, opciones.get('usuario'))
+    try:
+        # El analizador informa por consola; en el servicio esa salida se descarta
+        with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+            if not analyzer.analizar_errores_originales(_leer(rutas[0]), nombre):
+                raise ErrorTrabajos("Error al analizar el archivo. Verifica que sea un archivo Excel válido.")
+            progreso('exito', "✅ Análisis completado")
+            if not analyzer.aplicar_correcciones():
+                raise ErrorTrabajos("Error al aplicar las correcciones.")
+            progreso('exito', "✅ Correcciones aplicadas")
+            archivo_corregido = analyzer.generar_archivo_corregido()
+            if not archivo_corregido:
+                raise ErrorTrabajos("Error al generar el archivo corregido.")
+            progreso('exito', "✅ Archivo generado exitosamente")
+    finally:
+        with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+            analyzer.cleanup()
+
+    return {
+        'nombre_archivo': nombre,
+        'errores_originales': analyzer.errores_originales,
+        'diferencias_analisis': analyzer.diferencias_analisis,
+        'errores_post_correccion': analyzer.errores_post_correccion,
+        'informe_memoria': analyzer.informe_memoria,
+        'archivo_corregido': archivo_corregido
+    }
+
+def _trabajo_comprobaciones(rutas, opciones, progreso):
+    """Pipeline completo de comprobaciones sobre Extranet, BBDD y eRVC"""
+    from utils.memoria_matches import MemoriaMatches
+    from utils.pipeline_comprobaciones import ejecutar_comprobaciones
+
+    memoria = MemoriaMatches().cargar() if opciones.get('usar_memoria_matches', True) else {}
+    return ejecutar_comprobaciones(*(_leer(ruta) for ruta in rutas), opciones, memoria, progreso)
+
+def _trabajo_enriquecimiento(rutas, opciones, progreso):
+    """Paso 1 de comprobaciones: carga de los tres archivos y NIPD"""
+    from utils.carga import cargar_archivos_comprobaciones
+    from utils.memoria_matches import MemoriaMatches
+    from utils.pipeline_comprobaciones import enriquecer_declaracion
+
+    datos = cargar_archivos_comprobaciones(
+        *(_leer(ruta) for ruta in rutas), max_workers=opciones.get('max_workers')
+    )
+    memoria = MemoriaMatches().cargar() if opciones.get('usar_memoria_matches', True) else {}
+    df_enriquecido, df_auditoria = enriquecer_declaracion(datos, memoria, progreso)
+    return {'datos_cargados': datos, 'df_enriquecido': df_enriquecido, 'df_auditoria': df_auditoria}
+
+def _trabajo_reporte(rutas, opciones, progreso):
+    """Paso 2 de comprobaciones: rutas con las tablas de df_enriquecido y eRVC"""
+    from utils.pipeline_comprobaciones import generar_reporte
+
+    # Las tablas en pickle solo se abren desde el directorio del servicio
+    df_enriquecido, df_ervc = (abrir_tabla(ruta, directorio=opciones['directorio_trabajos']) for ruta in rutas)
+    return generar_reporte(df_enriquecido, df_ervc, opciones, progreso)
+
+TIPOS_TRABAJO = {
+    'verificador': _trabajo_verificador,
+    'comprobaciones': _trabajo_comprobaciones,
+    'enriquecimiento': _trabajo_enriquecimiento,
+    'reporte': _trabajo_reporte
+}
+
+def _ejecutar_en_proceso(tipo, rutas, opciones, ruta_resultado):
+    """
+    Punto de entrada en el proceso trabajador. El resultado (con los mensajes de
+    progreso y, si se pidió, el informe de perfilado) se escribe en ruta_resultado;
+    por el pool solo vuelve la ruta.
+    """
+    mensajes = []
+
+    def progreso(nivel, mensaje):
+        mensajes.append((nivel, mensaje))
+
+    if opciones.get('perfilar'):
+        from utils.perfilado import perfilar
+        with perfilar(NOMBRES_TRABAJO[tipo]) as informe:
+            resultado = TIPOS_TRABAJO[tipo](rutas, opciones, progreso)
+        resultado['informe_perfilado'] = informe
+    else:
+        resultado = TIPOS_TRABAJO[tipo](rutas, opciones, progreso)
+    resultado['mensajes'] = mensajes
+
+    # Las tablas grandes van a archivos mapeables junto al resultado, no al pickle
+    directorio_tablas = os.path.splitext(ruta_resultado)[0]
+    for clave in TABLAS_COMPARTIDAS.get(tipo, ()):
+        if clave in resultado:
+            resultado[clave] = publicar_tablas(resultado[clave], directorio_tablas, clave)
+
+    temporal = f"{ruta_resultado}.tmp"
+    with open(temporal, 'wb') as f:
+        pickle.dump(resultado, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporal, ruta_resultado)
+    return ruta_resultado
+
+# ---------------------------------------------------------------------------
+# Servicio
+# ---------------------------------------------------------------------------
+
+def _ahora():
+    return datetime.now().isoformat(timespec='seconds')
+
+def estimar_memoria_mb(rutas, procesos=1):
+    """
+    Memoria estimada (MB) de un trabajo a partir del tamaño y formato de sus entradas.
+    Con procesos > 1 suma los procesos hijos que abrirá el trabajo.
+    """
+    datos = 0
+    for ruta in rutas:
+        extension = os.path.splitext(ruta)[1].lower()
+        datos += os.path.getsize(ruta) / MB * FACTOR_MEMORIA_ENTRADA.get(extension, FACTOR_MEMORIA_POR_DEFECTO)
+    total = MEMORIA_BASE_TRABAJO_MB + datos
+    if procesos > 1:
+        total += procesos * MEMORIA_BASE_PROCESO_HIJO_MB + datos * FACTOR_MEMORIA_PROCESOS_HIJOS
+    return round(total, 1)
+
+def memoria_libre_mb():
+    """Memoria disponible del equipo (MemAvailable de /proc/meminfo) o None si no se conoce"""
+    try:
+        with open('/proc/meminfo') as f:
+            for linea in f:
+                if linea.startswith('MemAvailable:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def purgar_directorio(directorio=None, horas=None, conservar=()):
+    """
+    Elimina entradas y resultados de trabajos con más de 'horas' de antigüedad,
+    salvo los que contienen alguna de las rutas de conservar (trabajos pendientes)
+    """
+    directorio = directorio or DIRECTORIO_TRABAJOS
+    horas = HORAS_RETENCION_TRABAJOS if horas is None else horas
+    limite = time.time() - horas * 3600
+    conservar = [os.path.realpath(ruta) for ruta in conservar]
+    for subdirectorio in ('entradas', 'resultados'):
+        ruta = os.path.join(directorio, subdirectorio)
+        if not os.path.isdir(ruta):
+            continue
+        for nombre in os.listdir(ruta):
+            completo = os.path.join(ruta, nombre)
+            real = os.path.realpath(completo)
+            if any(r == real or r.startswith(real + os.sep) for r in conservar):
+                continue
+            try:
+                if os.path.getmtime(completo) < limite:
+                    if os.path.isdir(completo):
+                        shutil.rmtree(completo, ignore_errors=True)
+                    else:
+                        os.remove(completo)
+            except OSError:
+                pass
+
+def dentro_de(ruta, directorio):
+    """Si ruta (resueltos los enlaces) queda dentro de directorio"""
+    directorio = os.path.realpath(directorio)
+    return os.path.commonpath([os.path.realpath(ruta), directorio]) == directorio
+
+def leer_token(directorio=None):
+    """Token del servicio: VERIFICACION_TOKEN_TRABAJOS o el archivo que deja el servicio (None si no hay)"""
+    if TOKEN_TRABAJOS:
+        return TOKEN_TRABAJOS
+    try:
+        with open(os.path.join(directorio or DIRECTORIO_TRABAJOS, ARCHIVO_TOKEN)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _escribir_token(directorio, token):
+    """Deja el token en el directorio del servicio, legible solo por su usuario"""
+    ruta = os.path.join(directorio, ARCHIVO_TOKEN)
+    temporal = f"{ruta}.tmp"
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(temporal)
+    descriptor = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, 'w') as f:
+        f.write(token)
+    os.replace(temporal, ruta)
+
+class ServicioTrabajos:
+    """Cola de trabajos con reparto por usuario y admisión por memoria sobre un ProcessPoolExecutor"""
+
+    def __init__(self, max_concurrentes=None, directorio=None, memoria_mb=None, procesos_por_trabajo=None,
+                 token=None):
+        self.max_concurrentes = max_concurrentes or MAX_TRABAJOS_CONCURRENTES
+        self.procesos_por_trabajo = (
+            procesos_por_trabajo or PROCESOS_POR_TRABAJO
+            or max(1, (os.cpu_count() or 1) // self.max_concurrentes)
+        )
+        self.directorio = directorio or DIRECTORIO_TRABAJOS
+        self.memoria_mb = memoria_mb or MEMORIA_TRABAJOS_MB
+        self.token = token or TOKEN_TRABAJOS or secrets.token_hex(16)
+        self.trabajos = {}
+        self._orden = []
+        self._executor = None
+        self._tareas = set()
+        # (id, time.monotonic()) del primero de la cola desde que espera memoria
+        self._bloqueo_memoria = None
+        os.makedirs(os.path.join(self.directorio, 'resultados'), exist_ok=True)
+
+    async def servir(self, host=HOST_TRABAJOS, puerto=PUERTO_TRABAJOS, listo=None):
+        """Atiende peticiones hasta que se cancele la tarea"""
+        self.purgar()
+        _escribir_token(self.directorio, self.token)
+        self._executor = ProcessPoolExecutor(max_workers=self.max_concurrentes)
+        servidor = await asyncio.start_server(self._atender, host, puerto)
+        revision = asyncio.get_running_loop().create_task(self._revisar_cola())
+        if listo is not None:
+            listo.set()
+        try:
+            async with servidor:
+                await servidor.serve_forever()
+        finally:
+            revision.cancel()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def enviar(self, tipo, rutas, opciones=None, descripcion=None, usuario=None):
+        """Encola un trabajo y devuelve su identificador (ErrorTrabajos si no cabría nunca en memoria)"""
+        if tipo not in TIPOS_TRABAJO:
+            raise ErrorTrabajos(f"Tipo de trabajo desconocido: {tipo}")
+        # Solo archivos del propio servicio: las entradas pickle se cargan en el trabajo
+        fuera = [ruta for ruta in rutas if not dentro_de(ruta, self.directorio)]
+        if fuera:
+            raise ErrorTrabajos(f"Rutas fuera del directorio del servicio: {', '.join(fuera)}")
+        rutas = [os.path.realpath(ruta) for ruta in rutas]
+        faltan = [ruta for ruta in rutas if not os.path.exists(ruta)]
+        if faltan:
+            raise ErrorTrabajos(f"No existen los archivos: {', '.join(faltan)}")
+        opciones = dict(opciones or {})
+        # El trabajo guarda su historial (verificador) bajo el usuario que lo envía
+        opciones['usuario'] = usuario or 'anonimo'
+        opciones['directorio_trabajos'] = self.directorio
+        procesos = 1
+        if tipo in TIPOS_CON_PROCESOS_HIJOS:
+            # Los pools internos del trabajo no pasan de los procesos que le tocan
+            procesos = min(opciones.get('max_workers') or self.procesos_por_trabajo, self.procesos_por_trabajo)
+            opciones['max_workers'] = procesos
+            if procesos == 1:
+                opciones['particiones'] = 1
+        memoria = estimar_memoria_mb(rutas, procesos)
+        if memoria > self.memoria_mb:
+            raise ErrorTrabajos(
+                f"El trabajo necesitaría unos {memoria:,.0f} MB y el servicio admite "
+                f"{self.memoria_mb:,.0f} MB (VERIFICACION_MEMORIA_TRABAJOS_MB)"
+            )
+
+        id_trabajo = uuid.uuid4().hex[:12]
+        self.trabajos[id_trabajo] = {
+            'id': id_trabajo,
+            'tipo': tipo,
+            'descripcion': descripcion or NOMBRES_TRABAJO[tipo],
+            'usuario': opciones['usuario'],
+            'rutas': list(rutas),
+            'opciones': opciones,
+            'memoria_mb': memoria,
+            'procesos': procesos,
+            'estado': ESTADO_EN_COLA,
+            'espera': None,
+            'creado': _ahora(),
+            'inicio': None,
+            'fin': None,
+            'error': None,
+            'ruta_resultado': None
+        }
+        self._orden.append(id_trabajo)
+        self._despachar()
+        return id_trabajo
+
+    def _en_curso(self):
+        return [t for t in self.trabajos.values() if t['estado'] == ESTADO_EN_CURSO]
+
+    def _orden_despacho(self):
+        """
+        Trabajos en cola en el orden en que se les dará turno: por turnos entre
+        usuarios (menos trabajos en curso primero; a igualdad, el que lleva más
+        esperando) y, dentro de cada usuario, por orden de llegada
+        """
+        colas = {}
+        for id_trabajo in self._orden:
+            trabajo = self.trabajos[id_trabajo]
+            if trabajo['estado'] == ESTADO_EN_COLA:
+                colas.setdefault(trabajo['usuario'], []).append(id_trabajo)
+        turnos = {usuario: 0 for usuario in colas}
+        for trabajo in self._en_curso():
+            if trabajo['usuario'] in turnos:
+                turnos[trabajo['usuario']] += 1
+
+        orden = []
+        while colas:
+            usuario = min(colas, key=lambda u: (turnos[u], self._orden.index(colas[u][0])))
+            orden.append(colas[usuario].pop(0))
+            turnos[usuario] += 1
+            if not colas[usuario]:
+                del colas[usuario]
+        return orden
+
+    def _margen_memoria(self):
+        """MB que puede ocupar un trabajo nuevo: presupuesto sin lo reservado y sin pasar de la memoria libre"""
+        margen = self.memoria_mb - sum(t['memoria_mb'] for t in self._en_curso())
+        libre = memoria_libre_mb()
+        if libre is not None:
+            margen = min(margen, libre - RESERVA_SISTEMA_MB)
+        return margen
+
+    def _despachar(self):
+        """Arranca los trabajos en cola que tienen turno, hueco en el pool y memoria"""
+        if self._executor is None:
+            return
+        margen = self._margen_memoria()
+        for posicion, id_trabajo in enumerate(self._orden_despacho()):
+            if len(self._en_curso()) >= self.max_concurrentes:
+                break
+            trabajo = self.trabajos[id_trabajo]
+            # Con el servicio vacío arranca aunque la estimación supere la memoria libre
+            if trabajo['memoria_mb'] <= margen or not self._en_curso():
+                margen -= trabajo['memoria_mb']
+                trabajo['estado'] = ESTADO_EN_CURSO
+                trabajo['espera'] = None
+                tarea = asyncio.get_running_loop().create_task(self._ejecutar(id_trabajo))
+                self._tareas.add(tarea)
+                tarea.add_done_callback(self._tareas.discard)
+                continue
+
+            trabajo['espera'] = f"esperando memoria: necesita ~{trabajo['memoria_mb']:,.0f} MB, libres ~{max(margen, 0):,.0f} MB"
+            if posicion == 0:
+                if self._bloqueo_memoria is None or self._bloqueo_memoria[0] != id_trabajo:
+                    self._bloqueo_memoria = (id_trabajo, time.monotonic())
+                # Los siguientes pueden adelantarlo, pero no indefinidamente
+                if time.monotonic() - self._bloqueo_memoria[1] > SEGUNDOS_MAX_ADELANTAMIENTO:
+                    break
+
+    async def _revisar_cola(self):
+        """
+        La memoria libre del equipo cambia sin avisar: se reintenta la admisión cada
+        poco y, cada SEGUNDOS_PURGA_TRABAJOS, se purgan los trabajos antiguos
+        """
+        ultima_purga = time.monotonic()
+        while True:
+            await asyncio.sleep(SEGUNDOS_REVISION_COLA)
+            self._despachar()
+            if time.monotonic() - ultima_purga > SEGUNDOS_PURGA_TRABAJOS:
+                ultima_purga = time.monotonic()
+                self.purgar()
+
+    def purgar(self, horas=None):
+        """
+        Quita de la lista los trabajos terminados hace más de 'horas' y borra del
+        directorio las entradas y resultados antiguos que no usa ningún trabajo pendiente
+        """
+        horas = HORAS_RETENCION_TRABAJOS if horas is None else horas
+        limite = (datetime.now() - timedelta(hours=horas)).isoformat(timespec='seconds')
+        caducados = {
+            id_trabajo for id_trabajo, trabajo in self.trabajos.items()
+            if trabajo['estado'] in ESTADOS_FINALES and trabajo['fin'] and trabajo['fin'] < limite
+        }
+        for id_trabajo in caducados:
+            del self.trabajos[id_trabajo]
+        self._orden = [id_trabajo for id_trabajo in self._orden if id_trabajo not in caducados]
+
+        pendientes = [
+            ruta for trabajo in self.trabajos.values() if trabajo['estado'] not in ESTADOS_FINALES
+            for ruta in trabajo['rutas']
+        ]
+        purgar_directorio(self.directorio, horas, pendientes)
+
+    async def _ejecutar(self, id_trabajo):
+        trabajo = self.trabajos[id_trabajo]
+        trabajo['inicio'] = _ahora()
+        ruta_resultado = os.path.join(self.directorio, 'resultados', f"{id_trabajo}.pkl")
+        executor = self._executor
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                executor, _ejecutar_en_proceso,
+                trabajo['tipo'], trabajo['rutas'], trabajo['opciones'], ruta_resultado
+            )
+            trabajo['ruta_resultado'] = ruta_resultado
+            trabajo['estado'] = ESTADO_TERMINADO
+        except BrokenProcessPool as e:
+            # Un proceso murió (p. ej. sin memoria): todos los trabajos del pool roto
+            # fallan a la vez, pero solo el primero lo cierra y lo repone
+            if self._executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = ProcessPoolExecutor(max_workers=self.max_concurrentes)
+            trabajo['estado'] = ESTADO_ERROR
+            trabajo['error'] = f"El proceso del trabajo terminó de forma inesperada: {e}"
+        except Exception as e:
+            trabajo['estado'] = ESTADO_ERROR
+            trabajo['error'] = f"{type(e).__name__}: {e}"
+            trabajo['traza'] = ''.join(traceback.format_exception(e))
+        trabajo['fin'] = _ahora()
+        self._despachar()
+
+    def estado(self, id_trabajo, orden=None, usuario=None):
+        """
+        Copia del estado del trabajo con su posición en la cola (1 = el siguiente en tener turno).
+        Con usuario, solo si lo envió ese usuario (si no, como si no existiera).
+        """
+        if id_trabajo not in self.trabajos or (usuario is not None and self.trabajos[id_trabajo]['usuario'] != usuario):
+            raise ErrorTrabajos(f"Trabajo desconocido: {id_trabajo}")
+        estado = dict(self.trabajos[id_trabajo])
+        if estado['estado'] == ESTADO_EN_COLA:
+            orden = self._orden_despacho() if orden is None else orden
+            estado['posicion'] = orden.index(id_trabajo) + 1
+            estado['en_cola'] = len(orden)
+        return estado
+
+    def listar(self, usuario=None):
+        """Estado de los trabajos del usuario (todos si usuario es None)"""
+        orden = self._orden_despacho()
+        return [
+            self.estado(id_trabajo, orden) for id_trabajo in self._orden
+            if usuario is None or self.trabajos[id_trabajo]['usuario'] == usuario
+        ]
+
+    async def _atender(self, reader, writer):
+        """Una petición JSON por línea, una respuesta JSON por línea"""
+        try:
+            while linea := await reader.readline():
+                try:
+                    respuesta = {'ok': True, **self._responder(json.loads(linea))}
+                except Exception as e:
+                    respuesta = {'ok': False, 'error': str(e)}
+                writer.write((json.dumps(respuesta, ensure_ascii=False) + '\n').encode('utf-8'))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def _responder(self, peticion):
+        accion = peticion.get('accion')
+        if accion == 'ping':
+            return {'en_curso': len(self._en_curso())}
+        if not hmac.compare_digest(str(peticion.get('token') or ''), self.token):
+            raise ErrorTrabajos("Token del servicio de trabajos no válido")
+        if accion == 'enviar':
+            return {'id': self.enviar(
+                peticion['tipo'], peticion.get('rutas', []), peticion.get('opciones'),
+                peticion.get('descripcion'), peticion.get('usuario')
+            )}
+        if accion == 'estado':
+            return {'trabajo': self.estado(peticion['id'], usuario=peticion.get('usuario') or 'anonimo')}
+        if accion == 'listar':
+            return {'trabajos': self.listar(peticion.get('usuario'))}
+        raise ErrorTrabajos(f"Acción desconocida: {accion}")
+
+# ---------------------------------------------------------------------------
+# Cliente
+# ---------------------------------------------------------------------------
+
+class ClienteTrabajos:
+    """Cliente síncrono del servicio de trabajos"""
+
+    def __init__(self, host=HOST_TRABAJOS, puerto=PUERTO_TRABAJOS, timeout=10, directorio=None, token=None):
+        self.host = host
+        self.puerto = puerto
+        self.timeout = timeout
+        self.directorio = directorio or DIRECTORIO_TRABAJOS
+        self.token = token
+
+    def _peticion(self, **peticion):
+        # El token se relee en cada petición: cambia si el servicio se reinicia
+        peticion['token'] = self.token or leer_token(self.directorio)
+        with socket.create_connection((self.host, self.puerto), timeout=self.timeout) as conexion:
+            conexion.sendall((json.dumps(peticion, ensure_ascii=False) + '\n').encode('utf-8'))
+            with conexion.makefile('r', encoding='utf-8') as lectura:
+                respuesta = json.loads(lectura.readline())
+        if not respuesta.pop('ok', False):
+            raise ErrorTrabajos(respuesta.get('error', 'Respuesta no válida del servicio de trabajos'))
+        return respuesta
+
+    def disponible(self):
+        try:
+            self._peticion(accion='ping')
+            return True
+        except OSError:
+            return False
+
+    def guardar_entrada(self, valor, nombre):
+        """
+        Deja un archivo de entrada en el directorio del servicio y devuelve su ruta:
+        bytes tal cual, DataFrames como tabla compartida (utils.intercambio) y
+        cualquier otro objeto como pickle
+        """
+        directorio = os.path.join(self.directorio, 'entradas')
+        os.makedirs(directorio, exist_ok=True)
+        ruta = os.path.join(directorio, f"{uuid.uuid4().hex[:12]}-{os.path.basename(nombre)}")
+        if isinstance(valor, pd.DataFrame):
+            return escribir_tabla(valor, os.path.splitext(ruta)[0]).ruta
+        with open(ruta, 'wb') as f:
+            if isinstance(valor, (bytes, bytearray)):
+                f.write(valor)
+            else:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return ruta
+
+    def enviar(self, tipo, rutas, opciones=None, descripcion=None, usuario=None):
+        return self._peticion(
+            accion='enviar', tipo=tipo, rutas=[os.path.abspath(ruta) for ruta in rutas],
+            opciones=opciones or {}, descripcion=descripcion, usuario=usuario
+        )['id']
+
+    def estado(self, id_trabajo, usuario=None):
+        return self._peticion(accion='estado', id=id_trabajo, usuario=usuario)['trabajo']
+
+    def listar(self, usuario=None):
+        return self._peticion(accion='listar', usuario=usuario)['trabajos']
+
+    def resultado(self, id_trabajo, usuario=None):
+        """
+        Resultado de un trabajo terminado del usuario (ErrorTrabajos si falló o no ha terminado).
+        Las tablas compartidas se abren mapeadas y sus rutas quedan en 'tablas'
+        ({'datos_cargados.ervc': ruta, ...}) para pasarlas a otro trabajo sin reescribirlas.
+        """
+        estado = self.estado(id_trabajo, usuario)
+        if estado['estado'] == ESTADO_ERROR:
+            raise ErrorTrabajos(estado['error'])
+        if estado['estado'] != ESTADO_TERMINADO:
+            raise ErrorTrabajos(f"El trabajo {id_trabajo} aún no ha terminado ({estado['estado']})")
+        # Solo se carga el pickle si es un resultado del directorio del servicio
+        if not dentro_de(estado['ruta_resultado'], os.path.join(self.directorio, 'resultados')):
+            raise ErrorTrabajos(f"Resultado fuera del directorio del servicio: {estado['ruta_resultado']}")
+        resultado = _cargar_pickle(estado['ruta_resultado'])
+        tablas = rutas_tablas(resultado)
+        if tablas:
+            resultado = adjuntar_tablas(resultado)
+            resultado['tablas'] = tablas
+        return resultado
+
+    def esperar(self, id_trabajo, usuario=None, intervalo=1.0):
+        """Espera a que el trabajo termine y devuelve su estado final"""
+        while (estado := self.estado(id_trabajo, usuario))['estado'] not in ESTADOS_FINALES:
+            time.sleep(intervalo)
+        return estado
+
+_servicio_embebido = None
+_cerrojo_servicio = threading.Lock()
+
+def asegurar_servicio(host=HOST_TRABAJOS, puerto=PUERTO_TRABAJOS):
+    """
+    Cliente del servicio; si no hay ninguno escuchando (servidor_trabajos.py),
+    arranca uno dentro de este proceso en un hilo propio
+    """
+    global _servicio_embebido
+    cliente = ClienteTrabajos(host, puerto)
+    with _cerrojo_servicio:
+        if cliente.disponible():
+            return cliente
+        listo = threading.Event()
+        servicio = ServicioTrabajos()
+        hilo = threading.Thread(
+            target=asyncio.run, args=(servicio.servir(host, puerto, listo),),
+            name='servicio-trabajos', daemon=True
+        )
+        hilo.start()
+        if not listo.wait(timeout=10):
+            raise ErrorTrabajos(f"No se pudo arrancar el servicio de trabajos en {host}:{puerto}")
+        _servicio_embebido = servicio
+    return cliente
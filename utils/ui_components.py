@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from utils.tipos import resumir_informe
 
 def mostrar_mensaje_exito(mensaje, icono="🎉"):
     """Muestra un mensaje de éxito con estilo"""
@@ -17,6 +18,33 @@ def mostrar_mensaje_info(mensaje, icono="ℹ️"):
     """Muestra un mensaje informativo con estilo"""
     st.info(f"{icono} {mensaje}")
 
+def mostrar_progreso(nivel, mensaje):
+    """Muestra un mensaje de progreso del pipeline de comprobaciones según su nivel"""
+    if nivel == 'titulo':
+        st.write(f"### {mensaje}")
+    elif nivel == 'exito':
+        st.success(mensaje)
+    elif nivel == 'aviso':
+        st.warning(mensaje)
+    elif nivel == 'detalle':
+        st.caption(mensaje)
+    else:
+        st.info(mensaje)
+
+def mostrar_estado_trabajo(estado):
+    """Muestra el estado de un trabajo del servicio local mientras no termina"""
+    if estado['estado'] == 'en_cola':
+        espera = f" · {estado['espera']}" if estado.get('espera') else ""
+        st.info(
+            f"⏳ {estado['descripcion']}: en cola (posición {estado['posicion']} de {estado['en_cola']}{espera}). "
+            f"Puedes cerrar la pestaña y volver más tarde (trabajo {estado['id']})."
+        )
+    else:
+        st.info(
+            f"⚙️ {estado['descripcion']}: en curso desde las {estado['inicio'][11:]}. "
+            f"Puedes cerrar la pestaña y volver más tarde (trabajo {estado['id']})."
+        )
+
 def mostrar_resumen_errores_originales(errores_originales):
     """Muestra el resumen de errores antes de correcciones usando componentes nativos"""
     if not errores_originales:
@@ -184,6 +212,69 @@ def crear_boton_descarga(archivo_bytes, nombre_archivo="declaracion_corregida.xl
         st.error("❌ Error al generar el archivo corregido.")
         return False
 
+def mostrar_informe_memoria(informe):
+    """Muestra la memoria de los datos cargados antes y después de compactar los tipos"""
+    if informe is None or informe.empty:
+        return
+    
+    resumen = resumir_informe(informe)
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("📦 Memoria leída", f"{resumen['mb_antes']:,.2f} MB")
+    
+    with col2:
+        st.metric("🗜️ Memoria compactada", f"{resumen['mb_despues']:,.2f} MB")
+    
+    with col3:
+        st.metric("📉 Ahorro", f"{resumen['ahorro']:.0f}%")
+    
+    # Solo las columnas cuyo tipo ha cambiado
+    cambios = informe[informe['tipo_antes'] != informe['tipo_despues']]
+    if not cambios.empty:
+        st.dataframe(cambios, use_container_width=True, hide_index=True)
+
+def mostrar_informes_perfilado(informes):
+    """Muestra los informes de perfilado de la sesión (el más reciente primero)"""
+    if not informes:
+        st.info("ℹ️ Aún no hay pasos perfilados en esta sesión.")
+        return
+    
+    informes = list(reversed(informes))
+    indice = st.selectbox(
+        "Paso perfilado",
+        range(len(informes)),
+        format_func=lambda i: f"{informes[i]['fecha']:%H:%M:%S} · {informes[i]['nombre']} ({informes[i]['segundos']:.1f} s)",
+        key="informe_perfilado"
+    )
+    informe = informes[indice]
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.metric("⏱️ Tiempo total", f"{informe['segundos']:,.2f} s")
+    
+    with col2:
+        st.metric("📈 Pico de memoria", f"{informe['pico_mb']:,.1f} MB")
+    
+    for nota in informe.get('notas', []):
+        st.caption(f"ℹ️ {nota}")
+    
+    st.markdown("**Funciones con más tiempo acumulado**")
+    st.dataframe(informe['funciones'], use_container_width=True, hide_index=True)
+    
+    st.markdown("**Líneas con más memoria asignada durante el paso**")
+    st.dataframe(informe['asignaciones'], use_container_width=True, hide_index=True)
+    
+    st.download_button(
+        label="📥 Descargar perfil (.prof)",
+        data=informe['prof'],
+        file_name=f"perfil_{informe['fecha']:%Y%m%d_%H%M%S}.prof",
+        mime="application/octet-stream",
+        help="Se abre con pstats o snakeviz"
+    )
+
 def mostrar_instrucciones():
     """Muestra las instrucciones de uso de la herramienta"""
     st.markdown("""